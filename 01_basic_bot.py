@@ -1,6 +1,12 @@
-from langchain_openai import AzureChatOpenAI
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from langchain.schema import HumanMessage
 import os
+from async_serving import run_server
+from llm_scheduler import schedule
+from embedding_service import CachedEmbeddings
+from local_embeddings import LocalEmbeddings
+from streaming import TokenPrinter
+from semantic_cache import SemanticCache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,24 +15,62 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+streaming = os.getenv("BOT_STREAMING") == "1"  # print tokens as they arrive
+embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+local_embedding_model = os.getenv("LOCAL_EMBEDDING_MODEL")  # e.g. sentence-transformers/all-MiniLM-L6-v2: embed on CPU instead
 
-# Create the model
-chat = AzureChatOpenAI(
+# Semantic cache: near-duplicate questions are answered without calling the chat deployment
+semantic_cache = None
+embedding = None
+if local_embedding_model:
+    embedding = CachedEmbeddings(LocalEmbeddings(local_embedding_model), path=f".cache/embeddings/{local_embedding_model}")
+elif embedding_deployment:
+    embedding = CachedEmbeddings(AzureOpenAIEmbeddings(
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        openai_api_version=api_version,
+        model=embedding_deployment,
+    ), path=f".cache/embeddings/{embedding_deployment}")
+if embedding is not None:
+    semantic_cache = SemanticCache(
+        embedding,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        snapshot_path=os.getenv("SEMANTIC_CACHE_PATH", ".cache/semantic_cache.npz"),
+    )
+
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+chat = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
-    api_version=api_version
-)
+    api_version=api_version,
+    streaming=streaming
+), cache=semantic_cache)
 
 # ---- SIMPLE CHAT ----
-print("AI Agent (Azure) is ready! Type 'exit' to quit.\n")
+async def reply(chat, user_input):
+    response = await chat.ainvoke([HumanMessage(content=user_input)])
+    return response.content
+
+def shutdown():
+    if semantic_cache is not None:
+        semantic_cache.save()
 
-while True:
-    user_input = input("You: ")
-    if user_input.lower() in ["exit", "quit"]:
-        print("Goodbye!")
-        break
-    response = chat.invoke([HumanMessage(content=user_input)])
-    print("Agent:", response.content)
+if __name__ == "__main__":
+    if os.getenv("BOT_SERVE_MODE") == "async":
+        # Every session shares the (stateless) chat client
+        run_server(lambda session_id: chat, reply)  # stateless: nothing to store per session
+    else:
+        print("AI Agent (Azure) is ready! Type 'exit' to quit.\n")
 
+        while True:
+            user_input = input("You: ")
+            if user_input.lower() in ["exit", "quit"]:
+                shutdown()
+                print("Goodbye!")
+                break
+            printer = TokenPrinter(label="Agent:")
+            response = chat.invoke([HumanMessage(content=user_input)], config={"callbacks": [printer]})
+            printer.finish(response.content)
@@ -1,9 +1,12 @@
 from langchain_openai import AzureChatOpenAI
-from langchain.agents import initialize_agent
-from langchain_community.agent_toolkits.load_tools import load_tools
 from langchain.agents import AgentType
-from langchain.memory import ConversationBufferMemory
 import os
+from async_serving import run_server
+from llm_scheduler import schedule
+from math_engine import calculator_tool, llm_math_fallback
+from bounded_memory import TokenBudgetMemory
+from structured_agents import initialize_structured_agent, answer_printer
+from session_store import store_from_env
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -12,35 +15,56 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+streaming = os.getenv("BOT_STREAMING") == "1"  # print tokens as they arrive
+agent_mode = os.getenv("AGENT_MODE", "react")  # react | json | tools: how the agent's actions are read (see structured_agents.py)
+memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))  # per-memory prompt budget
+# SESSION_STORE_PATH=.cache/sessions keeps memories on disk: sessions survive restarts and can move between workers
+session_store = store_from_env(os.environ)
 
-# Create the model
-llm = AzureChatOpenAI(
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+llm = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
-    api_version=api_version
-)
+    api_version=api_version,
+    streaming=streaming
+))
 
-# 2. Load tools (calculator)
-tools = load_tools(["llm-math"], llm=llm)
+# 2. Load tools (calculator: evaluated locally; llm-math is loaded, and called, only for what it can't parse)
+tools = [calculator_tool(fallback=llm_math_fallback(llm))]
 
-# 3. Add memory (to store conversation)
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+def build_agent(session_id=None):
+    """Fresh memory + agent; called once per session."""
+    # 3. Add memory (to store conversation)
+    memory = TokenBudgetMemory(llm=llm, max_token_limit=memory_token_budget, memory_key="chat_history", return_messages=True,
+                               store=session_store, session_id=session_id)
 
-# 4. Create the agent
-agent = initialize_agent(
-    tools,
-    llm,
-    agent='chat-conversational-react-description',
-    verbose=True,
-    memory = memory
-)
+    # 4. Create the agent
+    agent = initialize_structured_agent(
+        tools,
+        llm,
+        agent='chat-conversational-react-description',
+        mode=agent_mode,
+        verbose=True,
+        memory = memory,
+        handle_parsing_errors = True
+    )
+    return agent
 
-while True:
-    user_input = input("How can i help you today. Type 'stop' to exit\n")
-    if user_input == 'stop':
-        break
-
-    print(agent.invoke({'input':f"${user_input}"})['output'])
+if __name__ == "__main__":
+    if os.getenv("BOT_SERVE_MODE") == "async":
+        # Many sessions in one process, each with its own agent + memory
+        run_server(build_agent)
+    else:
+        agent = build_agent(os.getenv("BOT_SESSION_ID"))  # set to continue a stored session
+        # chat-conversational-react answers with {"action": "Final Answer", "action_input": "..."}
+        printer = answer_printer('chat-conversational-react-description', agent_mode, label=None)
+        while True:
+            user_input = input("How can i help you today. Type 'stop' to exit\n")
+            if user_input == 'stop':
+                break
 
+            response = agent.invoke({'input':f"${user_input}"}, config={"callbacks": [printer]})
+            printer.finish(response['output'])
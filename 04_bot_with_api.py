@@ -1,11 +1,18 @@
 from langchain_openai import AzureChatOpenAI
-from langchain.agents import initialize_agent
-from langchain_community.agent_toolkits.load_tools import load_tools
 from langchain.agents import AgentType
-from langchain.memory import ConversationSummaryMemory
 from langchain.tools import StructuredTool
 import os
-import requests
+from async_serving import run_server
+from llm_scheduler import schedule
+from lazy_loading import Lazy
+from math_engine import calculator_tool, llm_math_fallback
+from summary_memory import BackgroundSummaryMemory
+from structured_agents import initialize_structured_agent, answer_printer
+from research_cache import ResearchCache
+from http_client import deadline
+from weather_provider import WeatherProvider, WeatherUnavailable
+from rate_provider import default_provider as rate_provider, RateUnavailable, UnsupportedCurrency
+from session_store import store_from_env
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -14,17 +21,26 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+streaming = os.getenv("BOT_STREAMING") == "1"  # print tokens as they arrive
+agent_mode = os.getenv("AGENT_MODE", "react")  # react | json | tools: how the agent's actions are read (see structured_agents.py)
+weather_api_url = os.getenv("WEATHER_API_URL", "https://wttr.in")
+turn_budget = float(os.getenv("BOT_TURN_BUDGET", "60"))  # seconds a turn's HTTP calls may take in total
+research_cache_path = os.getenv("RESEARCH_CACHE_PATH", ".cache/research_cache.sqlite")
 serp_api_key  = os.getenv('SERP_API_KEY')
 os.environ["SERPAPI_API_KEY"] = serp_api_key
+# SESSION_STORE_PATH=.cache/sessions keeps memories on disk: sessions survive restarts and can move between workers
+session_store = store_from_env(os.environ)
 
-# Create the model
-llm = AzureChatOpenAI(
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+llm = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
-    api_version=api_version
-)
+    api_version=api_version,
+    streaming=streaming
+))
 
 def currency_converter(query: str) -> str:
     """
@@ -36,27 +52,33 @@ def currency_converter(query: str) -> str:
         amount, from_currency, _, to_currency = query.strip().split()
         amount = float(amount)
         from_currency, to_currency = from_currency.lower(), to_currency.lower()
-        url = f"https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{from_currency}.json"
-        response = requests.get(url)
-        if response.status_code != 200:
+        try:
+            rate = rate_provider.get_rate(from_currency, to_currency)
+        except UnsupportedCurrency:
+            return "Error: Unsupported currency pair."
+        except RateUnavailable:
             return "Error: Unable to fetch currency rates."
-        data = response.json()
-        rate = data[from_currency].get(to_currency)
-        if rate:
-            return f"{amount} {from_currency.upper()} = {amount * rate:.2f} {to_currency.upper()}"
-        return "Error: Unsupported currency pair."
+        return f"{amount} {from_currency.upper()} = {amount * rate:.2f} {to_currency.upper()}"
     except Exception as e:
         return "Error: Use '<amount> <FROM> to <TO>'"
+# One provider per process: canonical city keys, short TTL, coalesced fetches
+weather_provider = WeatherProvider(base_url=weather_api_url)
+
 def get_weather(city: str) -> str:
     """
     Gets current weather for a city.
     Format: Just pass the city name. Example: 'London'
     """
     try:
-        url = f"https://wttr.in/{city}?format=3"
-        response = requests.get(url)
-        return response.text if response.status_code == 200 else "Error fetching weather."
-    except:
+        return weather_provider.get(city)
+    except WeatherUnavailable:
+        return "Error: Unable to get weather."
+
+async def aget_weather(city: str) -> str:
+    """Async version of get_weather, used when the agent runs via ainvoke."""
+    try:
+        return await weather_provider.aget(city)
+    except WeatherUnavailable:
         return "Error: Unable to get weather."
 
 currency_tool = StructuredTool.from_function(
@@ -66,34 +88,58 @@ currency_tool = StructuredTool.from_function(
 )
 weather_tool = StructuredTool.from_function(
     func=get_weather,
+    coroutine=aget_weather,
     name="weather_checker",
     description="Get current weather for a city. Format: Just pass the city name. Example: 'London'."
 )
 
 # ---------- Tools (Calculator + Wikipedia + Web Search + Currency Converter) ----------
-tools = load_tools(["llm-math", "wikipedia", "serpapi"], llm=llm)
-tools += [currency_tool,weather_tool]
+# Wikipedia/Search results are cached on disk (shared by every bot process, per-source TTL)
+research_cache = ResearchCache(research_cache_path)
 
+def load_agent_tools():
+    # Importing the tool loader alone takes seconds: done when the first session builds its agent
+    from langchain_community.agent_toolkits.load_tools import load_tools
 
-# ---------- Smarter Memory (Summary-based) ----------
-memory = ConversationSummaryMemory(llm=llm, memory_key="chat_history",return_messages=True)
+    # Calculator is evaluated locally; only expressions it can't parse cost an llm-math call
+    tools = [calculator_tool(fallback=llm_math_fallback(llm))]
+    tools += research_cache.wrap_tools(load_tools(["wikipedia", "serpapi"], llm=llm))
+    return tools + [currency_tool,weather_tool]
 
-# 4. Create the agent
-agent = initialize_agent(
-    tools,
-    llm,
-    agent= AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    verbose=True,
-    memory = memory,
-    handle_parsing_errors = True,
-    allow_dangerous_tools = True
-)
+tools = Lazy(load_agent_tools, name="tools")
+
+
+def build_agent(session_id=None):
+    """Fresh memory + agent; called once per session."""
+    # ---------- Smarter Memory (Summary-based, summarised in the background every few turns) ----------
+    memory = BackgroundSummaryMemory(llm=llm, memory_key="chat_history",return_messages=True,
+                                     store=session_store, session_id=session_id)
 
-# ---------- Conversation Loop ----------
-while True:
-    query = input("You: ")
-    if query.lower() in ["exit", "quit"]:
-        break
-    response = agent.invoke({"input": query})
-    print("Bot:", response["output"])
+    # 4. Create the agent
+    agent = initialize_structured_agent(
+        tools.get(),
+        llm,
+        agent= AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        mode=agent_mode,
+        verbose=True,
+        memory = memory,
+        handle_parsing_errors = True,
+        allow_dangerous_tools = True
+    )
+    return agent
 
+if __name__ == "__main__":
+    if os.getenv("BOT_SERVE_MODE") == "async":
+        # Many sessions in one process, each with its own agent + memory
+        run_server(build_agent)
+    else:
+        agent = build_agent(os.getenv("BOT_SESSION_ID"))  # set to continue a stored session
+        # ReAct agent: the final answer follows "AI:" (function calling: it's the whole completion)
+        printer = answer_printer(AgentType.CONVERSATIONAL_REACT_DESCRIPTION, agent_mode)
+        while True:
+            query = input("You: ")
+            if query.lower() in ["exit", "quit"]:
+                break
+            with deadline(turn_budget):
+                response = agent.invoke({"input": query}, config={"callbacks": [printer]})
+            printer.finish(response["output"])
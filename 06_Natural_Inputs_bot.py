@@ -1,13 +1,24 @@
 from langchain_openai import AzureChatOpenAI
 from langchain.agents import initialize_agent
-from langchain_community.agent_toolkits.load_tools import load_tools
 from langchain.agents import AgentType
-from langchain.memory import ConversationBufferMemory
 from langchain.tools import StructuredTool
 from langchain.schema.messages import SystemMessage
 from pydantic import BaseModel, Field, field_validator
+from typing import List
 import os
-import requests
+from async_serving import run_server
+from llm_scheduler import schedule
+from lazy_loading import Lazy
+from math_engine import calculator_tool, llm_math_fallback
+from bounded_memory import TokenBudgetMemory
+from streaming import FinalAnswerPrinter
+from research_cache import ResearchCache
+from parallel_tools import ParallelAgentExecutor
+from prompt_compiler import compile_agent
+from http_client import deadline
+from weather_provider import WeatherProvider, WeatherUnavailable
+from rate_provider import default_provider as rate_provider, format_conversions, RateUnavailable, UnsupportedCurrency
+from session_store import store_from_env
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -16,20 +27,29 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+streaming = os.getenv("BOT_STREAMING") == "1"  # print tokens as they arrive
+weather_api_url = os.getenv("WEATHER_API_URL", "https://wttr.in")
+turn_budget = float(os.getenv("BOT_TURN_BUDGET", "60"))  # seconds a turn's HTTP calls may take in total
+memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))  # per-memory prompt budget
+research_cache_path = os.getenv("RESEARCH_CACHE_PATH", ".cache/research_cache.sqlite")
 serp_api_key  = os.getenv('SERPAPI_API_KEY')
 os.environ["SERPAPI_API_KEY"] = serp_api_key
+# SESSION_STORE_PATH=.cache/sessions keeps memories on disk: sessions survive restarts and can move between workers
+session_store = store_from_env(os.environ)
 
-# Create the model
-llm = AzureChatOpenAI(
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+llm = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
     api_version=api_version,
+    streaming=streaming,
     model_kwargs = {
         "messages": [{"role": "system", "content": "You are a helpful assistant. Always try to understand informal terms like 'bucks' as USD or 'down under' as AUD when converting currencies."}]
     }
-)
+))
 
 # Input Class for Currency Converter function
 class CurrencyInput(BaseModel):
@@ -75,19 +95,29 @@ def normalize_currency_name(name: str) -> str:
 def currency_converter_pydantic(amount: float, from_currency: str, to_currency: str) -> str:
     from_currency = normalize_currency_name(from_currency).lower()
     to_currency = normalize_currency_name(to_currency).lower()
-    
-    url = f"https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{from_currency}.json"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        data = response.json()
-        if to_currency in data[from_currency]:
-            rate = data[from_currency][to_currency]
-            converted = amount * rate
-            return f"{amount} {from_currency.upper()} = {converted:.2f} {to_currency.upper()}"
-        else:
-            return f"Conversion rate for {to_currency.upper()} not available."
-    return "API Error: Could not fetch conversion rate."
+
+    # Rates come from the shared provider (pooled session + TTL cache + cross rates)
+    try:
+        rate = rate_provider.get_rate(from_currency, to_currency)
+    except UnsupportedCurrency as e:
+        return str(e)
+    except RateUnavailable:
+        return "API Error: Could not fetch conversion rate."
+    converted = amount * rate
+    return f"{amount} {from_currency.upper()} = {converted:.2f} {to_currency.upper()}"
+
+# Input Class for the batch converter (a whole expense list in one tool call)
+class BatchCurrencyInput(BaseModel):
+    conversions: List[CurrencyInput] = Field(..., min_length=1, description="Conversions to run, each with amount, from_currency and to_currency")
+
+# Batch Currency Converter Function: one rate fetch per base currency, one NumPy pass for the maths
+def batch_currency_converter(conversions: List[CurrencyInput]) -> str:
+    conversions = [CurrencyInput.model_validate(c) for c in conversions]  # models or plain dicts
+    amounts = [c.amount for c in conversions]
+    from_currencies = [normalize_currency_name(c.from_currency) for c in conversions]
+    to_currencies = [normalize_currency_name(c.to_currency) for c in conversions]
+    converted, errors = rate_provider.convert_many(amounts, from_currencies, to_currencies)
+    return format_conversions(amounts, from_currencies, to_currencies, converted, errors)
 
 def currency_converter_logged(*args, **kwargs):
     print("🛠️ [Currency Tool] Called with:", args, kwargs)
@@ -106,63 +136,106 @@ currency_tool = StructuredTool.from_function(
 )
 
 # Weather function
+# One provider per process: canonical city keys, short TTL, coalesced fetches
+weather_provider = WeatherProvider(base_url=weather_api_url)
+
 def get_weather(city: str) -> str:
     """
     Gets current weather for a city.
     Format: Just pass the city name. Example: 'London'
     """
     try:
-        url = f"https://wttr.in/{city}?format=3"
-        response = requests.get(url)
-        return response.text if response.status_code == 200 else "Error fetching weather."
-    except:
+        return weather_provider.get(city)
+    except WeatherUnavailable:
         return "Error: Unable to get weather."
 
+async def aget_weather(city: str) -> str:
+    """Async version of get_weather, used when the agent runs via ainvoke."""
+    try:
+        return await weather_provider.aget(city)
+    except WeatherUnavailable:
+        return "Error: Unable to get weather."
+
+batch_currency_tool = StructuredTool.from_function(
+    func=batch_currency_converter,
+    name="batch_currency_converter",
+    args_schema=BatchCurrencyInput,
+    description="Converts many amounts in one call, e.g. an expense list. Use this instead of calling currency_converter repeatedly. Example: {\"conversions\": [{\"amount\": 12.5, \"from_currency\": \"USD\", \"to_currency\": \"EUR\"}, {\"amount\": 900, \"from_currency\": \"INR\", \"to_currency\": \"EUR\"}]}",
+    handle_tool_error = handle_currency_errors
+)
+
 weather_tool = StructuredTool.from_function(
     func=get_weather,
+    coroutine=aget_weather,
     name="weather_checker",
     description="Get current weather for a city. Format: Just pass the city name. Example: 'London'."
 )
 
 # ----- Tools (Calculator + Wikipedia + Web Search + Currency Converter + Weather) ----------
-tools = load_tools(["llm-math", "wikipedia", "serpapi"], llm=llm)
-tools += [currency_tool,weather_tool]
-
-
-# ---------- Smarter Memory (Summary-based) ----------
-memory = ConversationBufferMemory(
-    llm=llm, 
-    memory_key="chat_history",
-    return_messages=True,
-    input_key = "input"
-)
-system_msg = SystemMessage(
-    content="You are a helpful and precise assistant with access to tools like currency conversion, weather, calculator, and web search. "
-        "Always use tools when available to answer factual questions. "
-        "Be concise and friendly. Round currency values to two decimal places. "
-        "Use metric units where applicable (e.g., Celsius instead of Fahrenheit). "
-        "If you're unsure about something or data isn't available, say so honestly rather than guessing."
-)
-
-# 4. Create the agent
-agent = initialize_agent(
-    tools,
-    llm,
-    agent= AgentType.OPENAI_FUNCTIONS,
-    verbose=True,
-    memory = memory,
-    handle_parsing_errors = True,
-    allow_dangerous_tools = True,
-    agent_kwargs= {
-        "system_message":system_msg
-    }
-)
-
-# ---------- Conversation Loop ----------
-while True:
-    query = input("You: ")
-    if query.lower() in ["exit", "quit"]:
-        break
-    response = agent.invoke({"input": query})
-    print("Bot:", response["output"])
-
+# Wikipedia/Search results are cached on disk (shared by every bot process, per-source TTL)
+research_cache = ResearchCache(research_cache_path)
+
+def load_agent_tools():
+    # Importing the tool loader alone takes seconds: done when the first session builds its agent
+    from langchain_community.agent_toolkits.load_tools import load_tools
+
+    # Calculator is evaluated locally; only expressions it can't parse cost an llm-math call
+    tools = [calculator_tool(fallback=llm_math_fallback(llm))]
+    tools += research_cache.wrap_tools(load_tools(["wikipedia", "serpapi"], llm=llm))
+    return tools + [currency_tool,batch_currency_tool,weather_tool]
+
+tools = Lazy(load_agent_tools, name="tools")
+
+
+def build_agent(session_id=None):
+    """Fresh memory + agent; called once per session."""
+    # ---------- Smarter Memory (token-budgeted, rolling summary) ----------
+    memory = TokenBudgetMemory(
+        llm=llm,
+        max_token_limit=memory_token_budget,
+        memory_key="chat_history",
+        return_messages=True,
+        input_key = "input",
+        store=session_store,
+        session_id=session_id
+    )
+    system_msg = SystemMessage(
+        content="You are a helpful and precise assistant with access to tools like currency conversion, weather, calculator, and web search. "
+            "Always use tools when available to answer factual questions. "
+            "Be concise and friendly. Round currency values to two decimal places. "
+            "Use metric units where applicable (e.g., Celsius instead of Fahrenheit). "
+            "If you're unsure about something or data isn't available, say so honestly rather than guessing."
+    )
+
+    # 4. Create the agent
+    # Multi-function agent can ask for several tools in one turn; they run in parallel
+    # (prompt compiled and function schemas built once, not on every step)
+    agent = ParallelAgentExecutor.from_executor(compile_agent(initialize_agent(
+        tools.get(),
+        llm,
+        agent= AgentType.OPENAI_MULTI_FUNCTIONS,
+        verbose=True,
+        memory = memory,
+        handle_parsing_errors = True,
+        allow_dangerous_tools = True,
+        agent_kwargs= {
+            "system_message":system_msg
+        }
+    )), tool_timeout=20)
+    return agent
+
+if __name__ == "__main__":
+    if os.getenv("BOT_SERVE_MODE") == "async":
+        # Many sessions in one process, each with its own agent + memory
+        run_server(build_agent)
+    else:
+        agent = build_agent(os.getenv("BOT_SESSION_ID"))  # set to continue a stored session
+        # Function-calling agent: any content tokens are the final answer
+        printer = FinalAnswerPrinter(prefix=None)
+        while True:
+            query = input("You: ")
+            if query.lower() in ["exit", "quit"]:
+                break
+            with deadline(turn_budget):
+                response = agent.invoke({"input": query}, config={"callbacks": [printer]})
+            printer.finish(response["output"])
@@ -1,13 +1,31 @@
-from langchain_openai import AzureChatOpenAI
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from langchain.agents import initialize_agent
-from langchain_community.agent_toolkits.load_tools import load_tools
 from langchain.agents import AgentType
-from langchain.memory import ConversationBufferMemory
 from langchain.tools import StructuredTool, Tool
 from langchain_core.messages import SystemMessage
 from pydantic import BaseModel, Field, field_validator
+from typing import List
 import os
-import requests
+import functools
+from async_serving import run_server
+from llm_scheduler import schedule
+from math_engine import calculator_tool, llm_math_fallback
+from fast_router import FastRouter
+from bounded_memory import TokenBudgetMemory
+from embedding_service import CachedEmbeddings
+from local_embeddings import LocalEmbeddings
+from streaming import FinalAnswerPrinter
+from structured_agents import initialize_structured_agent, answer_printer
+from research_cache import ResearchCache
+from local_knowledge import LocalKnowledge
+from lazy_loading import Lazy, LazyAgents
+from instrumentation import tracer_from_env
+from parallel_tools import ParallelAgentExecutor
+from prompt_compiler import compile_agent
+from http_client import deadline
+from weather_provider import WeatherProvider, WeatherUnavailable
+from rate_provider import default_provider as rate_provider, format_conversions, RateUnavailable, UnsupportedCurrency
+from session_store import store_from_env
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -16,20 +34,35 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+streaming = os.getenv("BOT_STREAMING") == "1"  # print tokens as they arrive
+agent_mode = os.getenv("AGENT_MODE", "react")  # react | json | tools: how the agent's actions are read (see structured_agents.py)
+weather_api_url = os.getenv("WEATHER_API_URL", "https://wttr.in")
+turn_budget = float(os.getenv("BOT_TURN_BUDGET", "60"))  # seconds a turn's HTTP calls may take in total
+memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))  # per-memory prompt budget
+research_cache_path = os.getenv("RESEARCH_CACHE_PATH", ".cache/research_cache.sqlite")
+embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+local_embedding_model = os.getenv("LOCAL_EMBEDDING_MODEL")  # e.g. sentence-transformers/all-MiniLM-L6-v2: embed on CPU instead
+local_knowledge_path = os.getenv("LOCAL_KNOWLEDGE_PATH", ".cache/local_knowledge.npz")
 serp_api_key  = os.getenv('SERPAPI_API_KEY')
 os.environ["SERPAPI_API_KEY"] = serp_api_key
+# BOT_TRACE_FILE=traces.jsonl and/or BOT_METRICS_PORT=9464 turn on per-turn span traces
+tracer = tracer_from_env(os.environ)
+# SESSION_STORE_PATH=.cache/sessions keeps memories on disk: sessions survive restarts and can move between workers
+session_store = store_from_env(os.environ)
 
-# Create the model
-llm = AzureChatOpenAI(
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+llm = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
     api_version=api_version,
+    streaming=streaming,
     model_kwargs = {
         "messages": [{"role": "system", "content": "You are a helpful assistant. Always try to understand informal terms like 'bucks' as USD or 'down under' as AUD when converting currencies."}]
     }
-)
+))
 
 # Input Class for Currency Converter function
 class CurrencyInput(BaseModel):
@@ -75,19 +108,29 @@ def normalize_currency_name(name: str) -> str:
 def currency_converter_pydantic(amount: float, from_currency: str, to_currency: str) -> str:
     from_currency = normalize_currency_name(from_currency).lower()
     to_currency = normalize_currency_name(to_currency).lower()
-    
-    url = f"https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{from_currency}.json"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        data = response.json()
-        if to_currency in data[from_currency]:
-            rate = data[from_currency][to_currency]
-            converted = amount * rate
-            return f"{amount} {from_currency.upper()} = {converted:.2f} {to_currency.upper()}"
-        else:
-            return f"Conversion rate for {to_currency.upper()} not available."
-    return "API Error: Could not fetch conversion rate."
+
+    # Rates come from the shared provider (pooled session + TTL cache + cross rates)
+    try:
+        rate = rate_provider.get_rate(from_currency, to_currency)
+    except UnsupportedCurrency as e:
+        return str(e)
+    except RateUnavailable:
+        return "API Error: Could not fetch conversion rate."
+    converted = amount * rate
+    return f"{amount} {from_currency.upper()} = {converted:.2f} {to_currency.upper()}"
+
+# Input Class for the batch converter (a whole expense list in one tool call)
+class BatchCurrencyInput(BaseModel):
+    conversions: List[CurrencyInput] = Field(..., min_length=1, description="Conversions to run, each with amount, from_currency and to_currency")
+
+# Batch Currency Converter Function: one rate fetch per base currency, one NumPy pass for the maths
+def batch_currency_converter(conversions: List[CurrencyInput]) -> str:
+    conversions = [CurrencyInput.model_validate(c) for c in conversions]  # models or plain dicts
+    amounts = [c.amount for c in conversions]
+    from_currencies = [normalize_currency_name(c.from_currency) for c in conversions]
+    to_currencies = [normalize_currency_name(c.to_currency) for c in conversions]
+    converted, errors = rate_provider.convert_many(amounts, from_currencies, to_currencies)
+    return format_conversions(amounts, from_currencies, to_currencies, converted, errors)
 
 def currency_converter_logged(*args, **kwargs):
     print("🛠️ [Currency Tool] Called with:", args, kwargs)
@@ -106,112 +149,242 @@ currency_tool = StructuredTool.from_function(
 )
 
 # Weather function
+# One provider per process: canonical city keys, short TTL, coalesced fetches
+weather_provider = WeatherProvider(base_url=weather_api_url)
+
 def get_weather(city: str) -> str:
     """
     Gets current weather for a city.
     Format: Just pass the city name. Example: 'London'
     """
     try:
-        url = f"https://wttr.in/{city}?format=3"
-        response = requests.get(url)
-        return response.text if response.status_code == 200 else "Error fetching weather."
-    except:
+        return weather_provider.get(city)
+    except WeatherUnavailable:
+        return "Error: Unable to get weather."
+
+async def aget_weather(city: str) -> str:
+    """Async version of get_weather, used when the agent runs via ainvoke."""
+    try:
+        return await weather_provider.aget(city)
+    except WeatherUnavailable:
         return "Error: Unable to get weather."
 
+batch_currency_tool = StructuredTool.from_function(
+    func=batch_currency_converter,
+    name="batch_currency_converter",
+    args_schema=BatchCurrencyInput,
+    description="Converts many amounts in one call, e.g. an expense list. Use this instead of calling currency_converter repeatedly. Example: {\"conversions\": [{\"amount\": 12.5, \"from_currency\": \"USD\", \"to_currency\": \"EUR\"}, {\"amount\": 900, \"from_currency\": \"INR\", \"to_currency\": \"EUR\"}]}",
+    handle_tool_error = handle_currency_errors
+)
+
 weather_tool = StructuredTool.from_function(
     func=get_weather,
+    coroutine=aget_weather,
     name="weather_checker",
     description="Get current weather for a city. Format: Just pass the city name. Example: 'London'."
 )
 
 # ----- Tools (Calculator + Wikipedia + Web Search + Currency Converter + Weather) ----------
-tools = load_tools(["llm-math", "wikipedia", "serpapi"], llm=llm)
-tools += [currency_tool,weather_tool]
+# Wikipedia/Search results are cached on disk (shared by every bot process, per-source TTL)
+research_cache = ResearchCache(research_cache_path)
+# Calculator is evaluated locally; only expressions it can't parse cost an llm-math call
+# (and only then is llm-math loaded)
+utility_tools = [calculator_tool(fallback=llm_math_fallback(llm)), currency_tool, batch_currency_tool, weather_tool]
 
+# Local retrieval over earlier research results: every wikipedia/Search result
+# is chunked and embedded in the background, and the research agent checks
+# local_knowledge before going to the web (needs a local model or an embeddings deployment)
+embedding = None
+if local_embedding_model:
+    embedding = CachedEmbeddings(LocalEmbeddings(local_embedding_model), path=f".cache/embeddings/{local_embedding_model}")
+elif embedding_deployment:
+    embedding = CachedEmbeddings(AzureOpenAIEmbeddings(
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        openai_api_version=api_version,
+        model=embedding_deployment,
+    ), path=f".cache/embeddings/{embedding_deployment}")
 
-# ---------- Smarter Memory (Summary-based) ----------
-research_memory = ConversationBufferMemory(
-    llm=llm, 
-    memory_key="chat_history",
-    return_messages=True,
-    input_key = "input"
-)
+local_knowledge = Lazy(lambda: LocalKnowledge(embedding, path=local_knowledge_path) if embedding is not None else None,
+                       name="local_knowledge")
 
-research_prompt = SystemMessage(content="You are a research assistant that helps with factual queries from the web or Wikipedia.")
-
-# Research agent
-research_agent = initialize_agent(
-    [tool for tool in tools if tool.name in ['wikipedia', 'serpapi']],
-    llm,
-    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    verbose=True,
-    memory=research_memory,
-    handle_parsing_errors = True,
-    allow_dangerous_tools = True,
-    agent_kwargs={"system_message": research_prompt}
-)
+def load_research_tools():
+    # Importing the tool loader alone takes seconds: done when the first research question comes in
+    from langchain_community.agent_toolkits.load_tools import load_tools
 
-utility_prompt = SystemMessage(content="You are a utility assistant that helps with currency conversion, weather, and similar tasks.")
+    tools = research_cache.wrap_tools(load_tools(["wikipedia", "serpapi"], llm=llm))
+    knowledge = local_knowledge.get()
+    if knowledge is not None:
+        tools = [knowledge.as_tool()] + [knowledge.wrap(tool) for tool in tools]
+    return tools
 
-utility_memory = ConversationBufferMemory(
-    llm=llm, 
-    memory_key="chat_history",
-    return_messages=True,
-    input_key = "input"
-)
-# Utility agent
-utility_agent = initialize_agent(
-    [tool for tool in tools if tool.name in ['currency_converter', 'weather_checker']],
-    llm,
-    agent=AgentType.OPENAI_FUNCTIONS,
-    verbose=True,
-    memory = utility_memory,
-    handle_parsing_errors = True,
-    allow_dangerous_tools = True,
-    agent_kwargs={"system_message": utility_prompt}
-)
+# local_knowledge first; load_tools names the serpapi tool "Search"
+research_tools = Lazy(load_research_tools)
 
-router_tools = [
-    Tool(
-        name="research_agent",
-        func=research_agent.run,
-        description="Good for information gathering and questions about people, places, or current events"
-    ),
-    Tool(
-        name="utility_agent",
-        func=utility_agent.run,
-        description="Good for currency conversion, weather info, or math calculations"
+
+def build_research_agent(agents, session_id=None):
+    # ---------- Smarter Memory (token-budgeted, rolling summary) ----------
+    research_memory = TokenBudgetMemory(
+        llm=llm,
+        max_token_limit=memory_token_budget,
+        memory_key="chat_history",
+        return_messages=True,
+        input_key = "input",
+        store=session_store,
+        session_id=session_id,
+        store_key="research_memory"
     )
-]
 
-system_msg = SystemMessage(
-    content="Your job is to route queries to the correct expert agent based on context and user intent. Remember prior conversation history."
-)
-shared_memory = ConversationBufferMemory(
-    llm=llm, 
-    memory_key="chat_history",
-    return_messages=True,
-    input_key = "input"
-)
+    research_prompt = SystemMessage(content="You are a research assistant that helps with factual queries from the web or Wikipedia. "
+                                            "If local_knowledge is available, check it first and only search the web when it has no answer.")
 
-router_agent = initialize_agent(
-    tools=router_tools,
-    llm=llm,
-    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    verbose=True,
-    memory = shared_memory,
-    handle_parsing_errors = True,
-    allow_dangerous_tools = True,
-    agent_kwargs={
-        "system_message":system_msg
-    }
-)
+    return initialize_structured_agent(
+        research_tools.get(),
+        llm,
+        agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        mode=agent_mode,
+        verbose=True,
+        memory=tracer.wrap_memory(research_memory, "research_memory"),
+        handle_parsing_errors = True,
+        allow_dangerous_tools = True,
+        agent_kwargs={"system_message": research_prompt}
+    )
+
+def build_utility_agent(agents, session_id=None):
+    utility_prompt = SystemMessage(content="You are a utility assistant that helps with calculations, currency conversion, weather, and similar tasks.")
+
+    utility_memory = TokenBudgetMemory(
+        llm=llm,
+        max_token_limit=memory_token_budget,
+        memory_key="chat_history",
+        return_messages=True,
+        input_key = "input",
+        store=session_store,
+        session_id=session_id,
+        store_key="utility_memory"
+    )
+    # Multi-function, so calculator + currency + weather calls in one turn run in parallel; function schemas built once
+    return ParallelAgentExecutor.from_executor(compile_agent(initialize_agent(
+        utility_tools,
+        llm,
+        agent=AgentType.OPENAI_MULTI_FUNCTIONS,
+        verbose=True,
+        memory = tracer.wrap_memory(utility_memory, "utility_memory"),
+        handle_parsing_errors = True,
+        allow_dangerous_tools = True,
+        agent_kwargs={"system_message": utility_prompt}
+    )), tool_timeout=20)
+
+def build_router_memory(agents, session_id=None):
+    return tracer.wrap_memory(TokenBudgetMemory(
+        llm=llm,
+        max_token_limit=memory_token_budget,
+        memory_key="chat_history",
+        return_messages=True,
+        input_key = "input",
+        store=session_store,
+        session_id=session_id,
+        store_key="router_memory"
+    ), "router_memory")
+
+def expert_tool(agents, name, description):
+    # The expert agent is built the first time the router hands it a query
+    def run(query):
+        return agents[name].run(query)
+
+    async def arun(query):
+        return await agents[name].arun(query)
+
+    return Tool(name=name, func=run, coroutine=arun, description=description)
+
+def build_router(agents):
+    router_tools = [
+        expert_tool(agents, "research_agent",
+                    "Good for information gathering and questions about people, places, or current events"),
+        expert_tool(agents, "utility_agent",
+                    "Good for currency conversion, weather info, or math calculations"),
+    ]
+
+    system_msg = SystemMessage(
+        content="Your job is to route queries to the correct expert agent based on context and user intent. Remember prior conversation history."
+    )
+
+    return initialize_structured_agent(
+        tools=router_tools,
+        llm=llm,
+        agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        mode=agent_mode,
+        verbose=True,
+        memory = agents["router_memory"],
+        handle_parsing_errors = True,
+        allow_dangerous_tools = True,
+        agent_kwargs={
+            "system_message":system_msg
+        }
+    )
+
+def build_agents(session_id=None):
+    """Fresh (or, with a session store, stored) memories + research/utility/router agents; called once per session, each agent built on first use."""
+    return LazyAgents({
+        "router": build_router,
+        "router_memory": functools.partial(build_router_memory, session_id=session_id),
+        "research_agent": functools.partial(build_research_agent, session_id=session_id),
+        "utility_agent": functools.partial(build_utility_agent, session_id=session_id),
+    })
+
+# Obvious currency/weather/math vs. factual queries skip the router's LLM hop
+# With a local model, queries the rules are unsure about are classified by embedding
+# (a few ms) before falling back to the LLM router
+fast_router = FastRouter(slang_to_currency=SLANG_TO_CURRENCY, embeddings=embedding if local_embedding_model else None)
+
+def respond(agents, user_input, route, config=None):
+    config = dict(config or {})
+    if tracer.enabled:
+        config["callbacks"] = list(config.get("callbacks", [])) + [tracer.handler]
+    with tracer.turn("turn", route=route or "router"):
+        if route is None:
+            return agents["router"].invoke({"input": user_input}, config=config)["output"]
+        output = agents[route].invoke({"input": user_input}, config=config)["output"]
+        # Keep the router's history complete for the turns it didn't see
+        agents["router_memory"].save_context({"input": user_input}, {"output": output})
+        return output
 
-while True:
-    user_input = input("You: ")
-    if user_input.lower() in ["exit", "quit"]:
-        break
-    result = router_agent.invoke({"input":user_input})
-    print("Bot:", result["output"])
+async def arespond(agents, user_input):
+    route = fast_router.route(user_input)
+    config = {"callbacks": [tracer.handler]} if tracer.enabled else None
+    with tracer.turn("turn", route=route or "router"):
+        if route is None:
+            return (await agents["router"].ainvoke({"input": user_input}, config=config))["output"]
+        output = (await agents[route].ainvoke({"input": user_input}, config=config))["output"]
+        # Off the event loop: saving may summarise (an LLM call) and write to the session store
+        await agents["router_memory"].asave_context({"input": user_input}, {"output": output})
+        return output
 
+def shutdown():
+    # Only if it was opened: no need to load the index just to close it
+    if local_knowledge.loaded and local_knowledge.get() is not None:
+        local_knowledge.get().close()
 
+if __name__ == "__main__":
+    if os.getenv("BOT_SERVE_MODE") == "async":
+        # Many sessions in one process, each with its own agents + memories
+        run_server(build_agents, arespond)
+    else:
+        agents = build_agents(os.getenv("BOT_SESSION_ID"))  # set to continue a stored session
+        # ReAct agents (router, research) put their final answer after "AI:",
+        # the function-calling utility agent's content tokens are the answer
+        printers = {
+            None: answer_printer(AgentType.CONVERSATIONAL_REACT_DESCRIPTION, agent_mode),
+            "research_agent": answer_printer(AgentType.CONVERSATIONAL_REACT_DESCRIPTION, agent_mode),
+            "utility_agent": FinalAnswerPrinter(prefix=None),
+        }
+        while True:
+            user_input = input("You: ")
+            if user_input.lower() in ["exit", "quit"]:
+                shutdown()
+                break
+            route = fast_router.route(user_input)
+            printer = printers[route]
+            with deadline(turn_budget):
+                output = respond(agents, user_input, route, config={"callbacks": [printer]})
+            printer.finish(output)
@@ -1,6 +1,9 @@
 from langchain_openai import AzureOpenAIEmbeddings
 from dotenv import load_dotenv
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules live in the repo root
+from embedding_service import CachedEmbeddings
 load_dotenv()
 
 #CONFIG
@@ -10,13 +13,27 @@ api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
 embedding_deployment= os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
 
-embedding = AzureOpenAIEmbeddings(
-    azure_endpoint=azure_endpoint,
-    api_key=api_key,
-    openai_api_version=api_version,
-    model = embedding_deployment,
+# Batched + deduplicated requests, vectors cached on disk (one store per embedding model)
+embedding = CachedEmbeddings(
+    AzureOpenAIEmbeddings(
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        openai_api_version=api_version,
+        model = embedding_deployment,
+    ),
+    path=f".cache/embeddings/{embedding_deployment}",
 )
 
 result = embedding.embed_query("Delhi is the capital of India")
 
-print(str(result))
\ No newline at end of file
+print(str(result))
+
+# Many documents at once: one request per 2048 new texts, repeats come from the cache
+documents = [
+    "Delhi is the capital of India",
+    "Paris is the capital of France",
+    "Tokyo is the capital of Japan",
+    "Delhi is the capital of India",
+]
+vectors = embedding.embed_documents(documents)
+print(f"{len(vectors)} vectors, {embedding.hits} from cache, {embedding.misses} embedded")
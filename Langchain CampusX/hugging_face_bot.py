@@ -1,6 +1,9 @@
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from dotenv import load_dotenv
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules live in the repo root
+from llm_scheduler import schedule
 
 load_dotenv()
 HUGGINGFACEHUB_API_TOKEN = os.getenv("HUGGINGFACEHUB_ACCESS_TOKEN")
@@ -13,7 +16,8 @@ llm = HuggingFaceEndpoint(
     max_new_tokens=50
 )
 
-model = ChatHuggingFace(llm = llm,verbose = True)
+# Calls go through the shared LLM scheduler (set LLM_RPM to the endpoint's rate limit)
+model = schedule(ChatHuggingFace(llm = llm,verbose = True))
 
 while True:
     query = input("You: ")
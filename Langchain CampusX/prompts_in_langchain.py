@@ -1,8 +1,13 @@
 from langchain_openai import AzureChatOpenAI
-from langchain_core.prompts import load_prompt
 from dotenv import load_dotenv
 import os
+import sys
 import streamlit as st
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules live in the repo root
+from llm_cache import SQLiteLLMCache
+from llm_scheduler import schedule
+from prompt_compiler import PrefixCacheReport, load_compiled
+from streaming import StreamlitWriter
 load_dotenv()
 
 # ---- CONFIG ----
@@ -11,14 +16,32 @@ api_key=os.getenv("AZURE_OPENAI_API_KEY")
 api_version=os.getenv('AZURE_OPENAI_API_VERSION')
 deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
 
-# Create the model
-model = AzureChatOpenAI(
+# temperature=0 -> same paper/style/length gives the same summary, so repeats come from the cache
+@st.cache_resource
+def get_llm_cache():
+    return SQLiteLLMCache(os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite"))
+
+llm_cache = get_llm_cache()
+
+# Shared across reruns: what share of each prompt the provider served from its prompt cache
+@st.cache_resource
+def get_prefix_report():
+    return PrefixCacheReport()
+
+prefix_report = get_prefix_report()
+
+stream_output = st.sidebar.checkbox("Stream answer", value=True)  # render tokens as they arrive
+
+# Create the model (every call waits for a slot from the shared LLM scheduler)
+model = schedule(AzureChatOpenAI(
     deployment_name=deployment_name,
     temperature=0,
+    max_retries=0,  # 429s and transient errors are retried by the scheduler, not by each client
     api_key=api_key,
     azure_endpoint =azure_endpoint,
-    api_version=api_version
-)
+    api_version=api_version,
+    streaming=stream_output
+), cache=llm_cache)
 
 st.header("Legal Research Assistant")
 
@@ -28,14 +51,20 @@ style_input = st.selectbox( "Select Explanation Style", ["Beginner-Friendly", "T
 
 length_input = st.selectbox( "Select Explanation Length", ["Short (1-2 paragraphs)", "Medium (3-5 paragraphs)", "Long (detailed explanation)"] )
 
-template = load_prompt("./template.json") # Calls the prompt_template stored in template.json
+# Compiled once and re-read only when template.json changes. Its fixed instructions
+# would go first as a cacheable system message, but only once they reach the
+# provider's 1024-token minimum; today they're shorter, so the order is kept
+template = load_compiled("./template.json", stable_prefix=True)
 
 if st.button("Answer"):
     chain = template | model # Creates a chain where the result of template is passed to model
+    writer = StreamlitWriter(st.empty())
     result = chain.invoke({
         "paper_input":paper_input,
         "style_input":style_input,
         "length_input":length_input
-    })
-    st.write(result.content)
-    
\ No newline at end of file
+    }, config={"callbacks": [writer, prefix_report]})
+    writer.finish(result.content)
+
+st.sidebar.caption(f"LLM cache: {llm_cache.hits} hits / {llm_cache.misses} misses")
+st.sidebar.caption(f"Prompt cache: {prefix_report.share:.0%} of prompt tokens from the cached prefix")
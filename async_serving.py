@@ -0,0 +1,193 @@
+"""
+Asyncio serving mode for the bots.
+
+One process multiplexes many independent chat sessions. Each session gets its
+own agent (and therefore its own memory object) built by the bot's
+`build_agent()` factory, plus its own queue so turns inside a session run in
+order. A global semaphore caps how many turns are in flight across all
+sessions at once.
+
+Sessions are exposed over a plain line-based TCP protocol: every connection is
+a session, every line a user turn, every reply one line starting with "Bot:".
+Try it with `nc localhost 8765`. A connection gets a new random session id;
+send `SESSION <id>` before the first turn to continue an earlier session
+instead (its memories come back if the bot has a session store, see
+session_store.py), or `SESSION` to be told the current id.
+
+A session id is a bearer secret: whoever sends it continues that session and
+sees its stored conversation, and the server authenticates nothing else. The
+ids it generates are random (`secrets`), and `SESSION <id>` refuses ids
+shorter than 16 characters, so a guessable name like "alice" can't be used.
+"""
+import asyncio
+import os
+import re
+import secrets
+
+from http_client import deadline
+from llm_scheduler import scheduling
+
+
+async def invoke_agent(agent, text):
+    """Default turn handler: run an AgentExecutor-style runnable via ainvoke."""
+    result = await agent.ainvoke({"input": text})
+    return result["output"]
+
+
+# Long enough that an id can't be guessed; new_session_id() makes 22-character ones
+_SESSION_ID = re.compile(r"[\w.:-]{16,128}")
+
+
+def new_session_id():
+    """A random session id (128 bits): it's the only thing protecting the session's history."""
+    return secrets.token_urlsafe(16)
+
+
+class _Session:
+    def __init__(self, state, queue_size):
+        self.state = state
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.worker = None
+        self.connections = 0
+
+
+class SessionServer:
+    def __init__(self, build_session, handle_turn=invoke_agent,
+                 max_concurrency=64, queue_size=16, turn_budget=60):
+        """
+        build_session: `(session_id) -> state`, called once per new session (the state is usually an agent)
+        handle_turn: `async (state, text) -> str`
+        max_concurrency: turns allowed in flight across all sessions
+        queue_size: pending turns allowed per session before `submit` waits
+        turn_budget: seconds the HTTP calls made during one turn may take in total
+        """
+        self.build_session = build_session
+        self.handle_turn = handle_turn
+        self.queue_size = queue_size
+        self.turn_budget = turn_budget
+        self.max_concurrency = max_concurrency
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._sessions = {}
+
+    def _get_session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session(self.build_session(session_id), self.queue_size)
+            session.worker = asyncio.create_task(self._run_session(session_id, session))
+            self._sessions[session_id] = session
+        return session
+
+    async def _run_session(self, session_id, session):
+        while True:
+            text, future = await session.queue.get()
+            try:
+                async with self._limit:
+                    # LLM calls of this turn take their fair-share slot as this session
+                    with deadline(self.turn_budget), scheduling(session=session_id):
+                        reply = await self.handle_turn(session.state, text)
+                if not future.cancelled():
+                    future.set_result(reply)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                session.queue.task_done()
+
+    async def submit(self, session_id, text):
+        """Queue a turn for `session_id` and wait for its reply."""
+        session = self._get_session(session_id)
+        future = asyncio.get_running_loop().create_future()
+        await session.queue.put((text, future))
+        return await future
+
+    def attach(self, session_id):
+        """A connection starts using `session_id`; the session stays open until all its connections close it."""
+        self._get_session(session_id).connections += 1
+
+    async def close_session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.connections -= 1
+        if session.connections <= 0:
+            del self._sessions[session_id]
+            session.worker.cancel()
+
+    @property
+    def active_sessions(self):
+        return len(self._sessions)
+
+    # ---- TCP front end ----
+    async def _handle_connection(self, reader, writer):
+        session_id = new_session_id()
+        attached = False
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                text = line.decode().strip()
+                if not text:
+                    continue
+                if text.lower() in ["exit", "quit"]:
+                    break
+                command, _, argument = text.partition(" ")
+                if command.upper() == "SESSION":
+                    argument = argument.strip()
+                    if not argument or argument == session_id:
+                        reply = f"Session: {session_id}"
+                    elif attached:
+                        reply = "Error: send SESSION <id> before the first message"
+                    elif not _SESSION_ID.fullmatch(argument):
+                        reply = ("Error: session ids are secrets of 16 to 128 letters, digits, '_', '.', ':' or '-'; "
+                                 "send a bare SESSION to get a random one")
+                    else:
+                        session_id = argument
+                        reply = f"Session: {session_id}"
+                    writer.write(f"{reply}\n".encode())
+                    await writer.drain()
+                    continue
+                if not attached:
+                    self.attach(session_id)
+                    attached = True
+                try:
+                    reply = await self.submit(session_id, text)
+                except Exception as e:
+                    reply = f"Error: {e}"
+                reply = " ".join(str(reply).splitlines())  # one line per reply
+                writer.write(f"Bot: {reply}\n".encode())
+                await writer.drain()
+        finally:
+            if attached:
+                await self.close_session(session_id)
+            writer.close()
+
+    async def serve_tcp(self, host="127.0.0.1", port=8765, sock=None):
+        """sock: an already listening socket to accept on instead (e.g. one shared by forked workers)"""
+        if sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=sock)
+            host, port = sock.getsockname()[:2]
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Serving sessions on {host}:{port} (max {self.max_concurrency} concurrent turns)")
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(build_session, handle_turn=invoke_agent, sock=None):
+    """
+    Entry point used by the bots when BOT_SERVE_MODE=async.
+
+    sock: a listening socket to serve on instead of BOT_HOST:BOT_PORT (bot_launcher.py's forked workers)
+    """
+    host = os.getenv("BOT_HOST", "127.0.0.1")
+    port = int(os.getenv("BOT_PORT", "8765"))
+    max_concurrency = int(os.getenv("BOT_MAX_CONCURRENCY", "64"))
+    queue_size = int(os.getenv("BOT_SESSION_QUEUE_SIZE", "16"))
+    turn_budget = float(os.getenv("BOT_TURN_BUDGET", "60"))
+
+    async def main():
+        server = SessionServer(build_session, handle_turn, max_concurrency, queue_size, turn_budget)
+        await server.serve_tcp(host, port, sock=sock)
+
+    asyncio.run(main())
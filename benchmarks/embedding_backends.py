@@ -0,0 +1,145 @@
+"""
+Compare embedding backends: local CPU model vs the Azure deployment.
+
+    python benchmarks/embedding_backends.py
+    python benchmarks/embedding_backends.py --corpus sentences.txt --repeat 4 --k 10
+
+Reports, per backend, batch throughput (texts/s through embed_documents) and
+single-query latency (embed_query p50/p99). When AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+is configured, it also reports how well the local model agrees with Azure:
+for every corpus text, the overlap between its k nearest neighbours under
+each model (recall@k, Azure as ground truth).
+
+The default corpus is the recorded research results, router examples and
+scripted user messages; pass --corpus (one text per line) for a real one.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fast_router import EXAMPLES  # noqa: E402
+from local_embeddings import DEFAULT_MODEL, LocalEmbeddings  # noqa: E402
+from local_knowledge import chunk_text  # noqa: E402
+from run_benchmarks import percentile  # noqa: E402
+
+
+def default_corpus():
+    with open(os.path.join(BENCH_DIR, "fixtures.json")) as f:
+        fixtures = json.load(f)
+    texts = []
+    for answers in fixtures["tools"].values():
+        for answer in answers.values():
+            texts += chunk_text(answer, max_chars=200, overlap=0)
+    for examples in EXAMPLES.values():
+        texts += examples
+    for script in fixtures["conversations"].values():
+        texts += [message for message in script if isinstance(message, str)]
+    return list(dict.fromkeys(texts))
+
+
+def azure_embeddings():
+    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    if not deployment:
+        return None
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        model=deployment,
+    )
+
+
+def measure(embeddings, corpus, repeat, queries):
+    """Throughput, query latency and the corpus vectors (for recall) for one backend."""
+    embeddings.embed_documents(corpus[:2])  # warm up: model load, connection pool
+    start = time.perf_counter()
+    vectors = None
+    for _ in range(repeat):
+        vectors = embeddings.embed_documents(corpus)
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for text in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "texts": len(corpus) * repeat,
+        "texts_per_s": len(corpus) * repeat / elapsed,
+        "query_p50_ms": percentile(latencies, 50) * 1000,
+        "query_p99_ms": percentile(latencies, 99) * 1000,
+        "dim": len(vectors[0]),
+    }, np.asarray(vectors, dtype=np.float32)
+
+
+def neighbours(vectors, k):
+    """Indices of each row's k nearest other rows by cosine similarity."""
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    sims = unit @ unit.T
+    np.fill_diagonal(sims, -np.inf)
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def recall_at_k(truth, candidate, k):
+    expected, found = neighbours(truth, k), neighbours(candidate, k)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_MODEL))
+    parser.add_argument("--onnx-path", help="exported model (default: the one local_embeddings.py --export writes)")
+    parser.add_argument("--corpus", help="file with one text per line")
+    parser.add_argument("--repeat", type=int, default=8, help="passes over the corpus for the local throughput run")
+    parser.add_argument("--queries", type=int, default=50, help="single-text embed_query calls per backend")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = default_corpus()
+    queries = [corpus[i % len(corpus)] for i in range(args.queries)]
+
+    local = LocalEmbeddings(args.model, onnx_path=args.onnx_path)
+    results = [dict(backend=f"local/{local.backend}", **measure(local, corpus, args.repeat, queries)[0])]
+    local_vectors = np.asarray(local.embed_documents(corpus), dtype=np.float32)
+
+    azure = azure_embeddings()
+    if azure is not None:
+        # One pass only: every Azure text is billed
+        stats, azure_vectors = measure(azure, corpus, 1, queries[:10])
+        results.append(dict(backend="azure", **stats))
+        k = min(args.k, len(corpus) - 1)
+        results[0][f"recall@{k}"] = recall_at_k(azure_vectors, local_vectors, k)
+
+    print(f"corpus: {len(corpus)} texts, model: {args.model}")
+    header = f"{'backend':14} {'dim':>5} {'texts':>6} {'texts/s':>9} {'q p50 ms':>9} {'q p99 ms':>9} {'recall':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        recall = next((v for name, v in r.items() if name.startswith("recall@")), None)
+        print(f"{r['backend']:14} {r['dim']:>5} {r['texts']:>6} {r['texts_per_s']:>9.1f} {r['query_p50_ms']:>9.2f} "
+              f"{r['query_p99_ms']:>9.2f} {'-' if recall is None else f'{recall:.3f}':>7}")
+    if azure is None:
+        print("(set AZURE_OPENAI_EMBEDDING_DEPLOYMENT to compare against Azure and report recall)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Local stand-ins for every network dependency of the bots.
+
+One ThreadingHTTPServer serves:
+  POST /openai/deployments/<name>/chat/completions   Azure OpenAI chat (incl. SSE streaming)
+  POST /openai/deployments/<name>/embeddings         Azure OpenAI embeddings
+  GET  /currencies/<base>.json                       jsdelivr currency-api
+  GET  /wttr/<city>?format=3                         wttr.in
+
+The chat endpoint is scripted rather than echoing: it recognises the prompt
+formats the bots use (ReAct, chat-conversational JSON, OpenAI
+functions/multi-functions, llm-math, summary memory) and answers so that each
+agent takes a realistic path: one tool call when the question needs a tool,
+then a final answer. Usage includes `cached_tokens` from a simulated
+provider prompt cache. With `malformed_rate` some agent completions come back
+slightly malformed (lower-case "action:", no "AI:", renamed JSON keys). Every request is counted with its prompt tokens so the
+benchmark can report LLM calls and tokens per turn.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+EMBEDDING_DIM = 256
+
+
+def count_tokens(text):
+    # ~4 characters per token is close enough for relative comparisons
+    return max(1, len(text) // 4)
+
+
+class PromptCache:
+    """
+    Azure OpenAI-style prompt caching: the longest previously seen prefix, in
+    128-token blocks, counts as cached once it reaches 1024 tokens.
+    """
+
+    BLOCK_CHARS = 128 * 4
+
+    def __init__(self, min_tokens=1024):
+        self.min_tokens = min_tokens
+        self.lock = threading.Lock()
+        self.seen = set()
+
+    def cached_tokens(self, prompt):
+        digest, hits, prefix_intact = hashlib.blake2b(digest_size=16), 0, True
+        with self.lock:
+            for start in range(0, len(prompt) - self.BLOCK_CHARS + 1, self.BLOCK_CHARS):
+                digest.update(prompt[start:start + self.BLOCK_CHARS].encode())
+                key = digest.copy().digest()
+                if prefix_intact and key in self.seen:
+                    hits += 1
+                else:
+                    prefix_intact = False
+                    self.seen.add(key)
+        tokens = hits * self.BLOCK_CHARS // 4
+        return tokens if tokens >= self.min_tokens else 0
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.chat_calls = 0
+            self.prompt_tokens = 0
+            self.cached_tokens = 0
+            self.completion_tokens = 0
+            self.embedding_calls = 0
+            self.embedded_texts = 0
+            self.http_calls = {"currency": 0, "weather": 0}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "chat_calls": self.chat_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+                "embedding_calls": self.embedding_calls,
+                "embedded_texts": self.embedded_texts,
+                "http_calls": dict(self.http_calls),
+            }
+
+
+# ---- scripted chat behaviour ----
+_CONVERT = re.compile(r"(\d+(?:\.\d+)?)\s*([A-Za-z]{3})\s+(?:to|in|into)\s+([A-Za-z]{3})", re.IGNORECASE)
+_WEATHER = re.compile(r"weather (?:in|at|for) ([A-Za-z .,'-]+?)(?:[?.!]|\s+and\b|$)", re.IGNORECASE)
+_MATH = re.compile(r"\d[\d\s.]*(?:[-+*/^%]\s*[\d.(][\d\s.()]*)+")
+
+
+def _tool_requests(question):
+    """(tool, args) pairs the scripted model asks for, in question order."""
+    calls = []
+    for amount, src, dst in _CONVERT.findall(question):
+        calls.append(("currency_converter", {"amount": float(amount), "from_currency": src.upper(), "to_currency": dst.upper()}))
+    for city in _WEATHER.findall(question):
+        calls.append(("weather_checker", {"city": city.strip()}))
+    expression = _math_expression(question)
+    if expression:
+        calls.append(("Calculator", {"expression": expression}))
+    return calls
+
+
+def _math_expression(question):
+    match = _MATH.search(question)
+    return match.group(0).strip() if match else None
+
+
+def _react_tool(question, tool_names):
+    """Which ReAct tool (if any) the scripted model would call first."""
+    lowered = question.lower()
+    if "utility_agent" in tool_names and (_tool_requests(question) or _math_expression(question)):
+        return "utility_agent"
+    if "research_agent" in tool_names:
+        return "research_agent"
+    if "Calculator" in tool_names and _math_expression(question):
+        return "Calculator"
+    if "currency_converter" in tool_names and _CONVERT.search(question):
+        return "currency_converter"
+    if "weather_checker" in tool_names and _WEATHER.search(question):
+        return "weather_checker"
+    if any(w in lowered for w in ("who", "when", "where", "capital", "invented", "history")):
+        for name in ("wikipedia", "Search"):
+            if name in tool_names:
+                return name
+    return None
+
+
+def _react_input(tool, question):
+    if tool == "Calculator":
+        return _math_expression(question)
+    if tool == "currency_converter":
+        amount, src, dst = _CONVERT.search(question).groups()
+        return f"{amount} {src.upper()} to {dst.upper()}"
+    if tool == "weather_checker":
+        return _WEATHER.search(question).group(1).strip()
+    return question
+
+
+def _last_observation(text):
+    found = re.findall(r"Observation: ([\s\S]*?)(?:\nThought:|$)", text)
+    return found[-1].strip() if found else None
+
+
+def scripted_reply(body):
+    """Return (content, function_call or None, tool_calls or None)."""
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {"role": "user", "content": ""}
+    text = last.get("content") or ""
+    everything = "\n".join(str(m.get("content") or "") for m in messages)
+
+    # llm-math
+    if "Translate a math problem into a expression" in everything:
+        question = text.rsplit("Question:", 1)[-1]
+        return f"```text\n{_math_expression(question) or '0'}\n```", None, None
+
+    # summary memory
+    if "Progressively summarize" in everything:
+        return "The human asked a few questions and the AI answered them using its tools.", None, None
+
+    # OpenAI functions / multi-functions / tools agents
+    functions = body.get("functions") or [t["function"] for t in body.get("tools", [])]
+    if functions:
+        if last.get("role") in ("function", "tool"):
+            return f"Here is what I found: {text}", None, None
+        question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        names = [f["name"] for f in functions]
+        # multi-functions wraps every tool in one "tool_selection" function
+        calls = [(n, a) for n, a in _tool_requests(question) if n in names or "tool_selection" in names]
+        if not calls and "tool_selection" not in names and not body.get("tools"):
+            # A ReAct agent built with native function calling (structured_agents "tools" mode)
+            tool = _react_tool(question, names)
+            calls = [(tool, {})] if tool else []
+        if "tool_selection" not in names:
+            # Single-string tools (e.g. the ReAct bots' currency_converter) get the ReAct-style input
+            properties = {f["name"]: list(f.get("parameters", {}).get("properties", {})) for f in functions}
+            calls = [(n, a) if a and set(a) <= set(properties[n]) or len(properties[n]) > 1
+                     else (n, {(properties[n] or ["__arg1"])[0]: _react_input(n, question)}) for n, a in calls]
+        if not calls:
+            return f"Mock answer to: {question[:80]}", None, None
+        if "tool_selection" in names:
+            actions = [{"action_name": n, "action": a} for n, a in calls]
+            return "", {"name": "tool_selection", "arguments": json.dumps({"actions": actions})}, None
+        if body.get("tools"):
+            tool_calls = [
+                {"id": f"call_{i}", "type": "function", "function": {"name": n, "arguments": json.dumps(a)}}
+                for i, (n, a) in enumerate(calls)
+            ]
+            return "", None, tool_calls
+        name, args = calls[0]
+        return "", {"name": name, "arguments": json.dumps(args)}, None
+
+    # chat-conversational-react (JSON blobs)
+    if '"action_input"' in everything:
+        if "TOOL RESPONSE" in text:
+            observation = text.split("TOOL RESPONSE:", 1)[-1].split("\n", 2)[-1].split("USER'S INPUT")[0].strip()
+            answer = f"The answer is {observation}"
+        else:
+            question = text.rsplit("NOTHING else):", 1)[-1].strip().lstrip("$")
+            tool_names = re.findall(r"^> (\S+):", everything, re.MULTILINE)
+            tool = _react_tool(question, tool_names)
+            if tool:
+                payload = {"action": tool, "action_input": _react_input(tool, question)}
+                return f"```json\n{json.dumps(payload)}\n```", None, None
+            answer = f"Mock answer to: {question[:80]}"
+        return f"```json\n{json.dumps({'action': 'Final Answer', 'action_input': answer})}\n```", None, None
+
+    # conversational ReAct ("Do I need to use a tool?")
+    if "Do I need to use a tool?" in everything:
+        question = everything.rsplit("New input:", 1)[-1].split("\n", 1)[0].strip()
+        observation = _last_observation(text.rsplit("New input:", 1)[-1])
+        if observation is not None:
+            return f"Do I need to use a tool? No\nAI: {observation}", None, None
+        tool_names = re.findall(r"^> (\S+):", everything, re.MULTILINE)
+        tool = _react_tool(question, tool_names)
+        if tool:
+            return f"Do I need to use a tool? Yes\nAction: {tool}\nAction Input: {_react_input(tool, question)}", None, None
+        return f"Do I need to use a tool? No\nAI: Mock answer to: {question[:80]}", None, None
+
+    # plain chat / prompt chains
+    return f"Mock answer to: {text[:200]}", None, None
+
+
+def malformed(content):
+    """A near-miss of a well-formed agent completion, the kind a stock parser rejects."""
+    if content.startswith("Do I need to use a tool? Yes\n"):
+        _, action, action_input = content.split("\n", 2)
+        return f"{action.lower()}\n{action_input.replace('Action Input:', 'action input:', 1)}"
+    if content.startswith("Do I need to use a tool? No\nAI: "):
+        return content.replace("\nAI: ", "\n", 1)
+    if content.startswith("```json\n"):
+        blob = json.loads(content[len("```json\n"):-len("\n```")])
+        return json.dumps({"tool": blob["action"], "tool_input": blob["action_input"]})
+    return content
+
+
+def fake_embedding(item):
+    """Deterministic bag-of-tokens vector: overlapping words -> similar vectors."""
+    tokens = item if isinstance(item, list) else re.findall(r"\w+", str(item).lower())
+    vector = [0.0] * EMBEDDING_DIM
+    for token in tokens:
+        digest = hashlib.blake2b(str(token).encode(), digest_size=4).digest()
+        index = int.from_bytes(digest[:2], "little") % EMBEDDING_DIM
+        vector[index] += 1.0 if digest[2] & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockAzure/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _text(self, text, status=200):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # ---- GET: currency + weather ----
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path).path
+        if path.startswith("/currencies/") and path.endswith(".json"):
+            base = path[len("/currencies/"):-len(".json")].lower()
+            with server.stats.lock:
+                server.stats.http_calls["currency"] += 1
+            time.sleep(server.http_latency)
+            usd = server.fixtures["rates_usd"]
+            if base not in usd:
+                return self._json({"error": "unknown currency"}, status=404)
+            table = {code: rate / usd[base] for code, rate in usd.items()}
+            return self._json({"date": "2024-01-01", base: table})
+        if path.startswith("/wttr/"):
+            city = unquote(path[len("/wttr/"):])
+            with server.stats.lock:
+                server.stats.http_calls["weather"] += 1
+            time.sleep(server.http_latency)
+            return self._text(f"{city}: ⛅️  +18°C\n")
+        self._json({"error": "not found"}, status=404)
+
+    # ---- POST: Azure OpenAI ----
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = urlparse(self.path).path
+        if path.endswith("/embeddings"):
+            inputs = body.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            with server.stats.lock:
+                server.stats.embedding_calls += 1
+                server.stats.embedded_texts += len(inputs)
+            time.sleep(server.embedding_latency)
+            return self._json({
+                "object": "list",
+                "model": "mock-embedding",
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(x)} for i, x in enumerate(inputs)],
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            })
+        if path.endswith("/chat/completions"):
+            return self._chat(body)
+        self._json({"error": "not found"}, status=404)
+
+    def _chat(self, body):
+        server = self.server
+        # Tool schemas go ahead of the messages, as the provider renders them
+        prompt = json.dumps(body.get("functions") or body.get("tools") or []) + json.dumps(body.get("messages", []))
+        content, function_call, tool_calls = scripted_reply(body)
+        if content and server.malformed_rate:
+            with server.stats.lock:
+                if server.random.random() < server.malformed_rate:
+                    content = malformed(content)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content or json.dumps(function_call or tool_calls))
+        cached_tokens = min(server.prompt_cache.cached_tokens(prompt), prompt_tokens)
+        with server.stats.lock:
+            server.stats.chat_calls += 1
+            server.stats.prompt_tokens += prompt_tokens
+            server.stats.cached_tokens += cached_tokens
+            server.stats.completion_tokens += completion_tokens
+        time.sleep(server.llm_latency)
+
+        message = {"role": "assistant", "content": content or None}
+        if function_call:
+            message["function_call"] = function_call
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        finish = "function_call" if function_call else "tool_calls" if tool_calls else "stop"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": "mock-gpt"}
+
+        if not body.get("stream"):
+            return self._json(dict(base, object="chat.completion", usage=usage,
+                                   choices=[{"index": 0, "message": message, "finish_reason": finish}]))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send(delta, finish_reason=None):
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        if function_call:
+            send({"function_call": function_call})
+        if tool_calls:
+            send({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]})
+        for word in re.findall(r"\S+\s*", content or ""):
+            time.sleep(server.token_latency)
+            send({"content": word})
+        send({}, finish)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures, port=0, llm_latency=0.0, token_latency=0.0,
+                 embedding_latency=0.0, http_latency=0.0, malformed_rate=0.0, seed=0, cache_min_tokens=1024):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.fixtures = fixtures
+        self.malformed_rate = malformed_rate  # share of agent completions sent as a near-miss
+        self.random = random.Random(seed)
+        self.llm_latency = llm_latency
+        self.token_latency = token_latency
+        self.embedding_latency = embedding_latency
+        self.http_latency = http_latency
+        self.stats = Stats()
+        self.prompt_cache = PromptCache(cache_min_tokens)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Run the mock Azure/tool server on its own")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    with open(os.path.join(os.path.dirname(__file__), "fixtures.json")) as f:
+        server = MockServer(json.load(f), port=args.port, llm_latency=args.llm_latency)
+    print(f"Mock server on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,256 @@
+"""
+Benchmark the bots end to end without network access.
+
+Every bot configuration (01-07 and the CampusX prompt chain) runs scripted
+multi-turn conversations against benchmarks/mock_servers.py, which stands in
+for Azure OpenAI, the currency API and wttr.in. Wikipedia and SerpAPI are
+replaced with recorded fixtures from benchmarks/fixtures.json.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --bots 05 07 --sessions 1 32 --llm-latency 0.3
+    python benchmarks/run_benchmarks.py --json bench.json
+
+Reports per-turn latency percentiles, LLM calls and prompt tokens per turn,
+the share of prompt tokens the provider's prompt cache would serve, and
+throughput (turns/s) with N concurrent sessions.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_servers import MockServer  # noqa: E402
+from structured_agents import AGENT_MODES, parse_stats  # noqa: E402
+
+BOTS = {
+    "01": ("01_basic_bot.py", "chat"),
+    "02": ("02_calculator_bot.py", "calculator"),
+    "03": ("03_multi_tool_bot.py", "tools"),
+    "04": ("04_bot_with_api.py", "tools"),
+    "05": ("05_Pydantic_Inputs_bot.py", "tools"),
+    "06": ("06_Natural_Inputs_bot.py", "tools"),
+    "07": ("07_multi_agent.py", "tools"),
+    "campusx": (None, "prompt_chain"),
+}
+
+FIXTURE_TOOLS = {
+    "wikipedia": ("wikipedia", "A wrapper around Wikipedia. Useful for when you need to answer general questions about "
+                               "people, places, companies, facts, historical events, or other subjects. "
+                               "Input should be a search query."),
+    "serpapi": ("Search", "A search engine. Useful for when you need to answer questions about current events. "
+                          "Input should be a search query."),
+}
+
+
+def configure_env(url, workdir):
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": url,
+        "AZURE_OPENAI_API_KEY": "mock-key",
+        "AZURE_OPENAI_API_VERSION": "2024-06-01",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "mock-gpt",
+        "SERPAPI_API_KEY": "mock-key",
+        "SERP_API_KEY": "mock-key",
+        "CURRENCY_API_URL": f"{url}/currencies",
+        "WEATHER_API_URL": f"{url}/wttr",
+        "SEMANTIC_CACHE_PATH": os.path.join(workdir, "semantic_cache.npz"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite"),
+        "RESEARCH_CACHE_PATH": os.path.join(workdir, "research_cache.sqlite"),
+    })
+    # Caches would hide agent overhead; benchmark them explicitly, not by accident
+    os.environ.pop("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", None)
+
+
+def install_tool_fixtures(fixtures):
+    """Make load_tools return recorded Wikipedia/SerpAPI tools (must run before the bots import it)."""
+    import langchain_community.agent_toolkits.load_tools as lt
+    from langchain_core.tools import Tool
+
+    real_load_tools = lt.load_tools
+
+    def fixture_tool(name):
+        tool_name, description = FIXTURE_TOOLS[name]
+        answers = fixtures["tools"][tool_name]
+
+        def lookup(query):
+            query = query.lower()
+            for key, answer in answers.items():
+                if key in query:
+                    return answer
+            return "No good search result was found"
+
+        return Tool(name=tool_name, func=lookup, description=description)
+
+    def load_tools(tool_names, llm=None, **kwargs):
+        tools = []
+        for name in tool_names:
+            if name in FIXTURE_TOOLS:
+                tools.append(fixture_tool(name))
+            else:
+                tools += real_load_tools([name], llm=llm, **kwargs)
+        return tools
+
+    lt.load_tools = load_tools
+
+
+def load_bot(filename):
+    spec = importlib.util.spec_from_file_location(f"bot_{filename[:2]}", os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def session_factory(key):
+    """Returns `new_session() -> turn(text_or_inputs) -> str` for a bot configuration."""
+    filename, _ = BOTS[key]
+    if filename is None:
+        from langchain_openai import AzureChatOpenAI
+        from prompt_compiler import load_compiled
+
+        model = AzureChatOpenAI(
+            deployment_name=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"],
+            temperature=0,
+            api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        )
+        chain = load_compiled(os.path.join(ROOT, "Langchain CampusX", "template.json"), stable_prefix=True) | model
+        return lambda: (lambda inputs: chain.invoke(inputs).content)
+
+    module = load_bot(filename)
+    if hasattr(module, "build_agents"):
+        def new_session():
+            agents = module.build_agents()
+            return lambda text: module.respond(agents, text, module.fast_router.route(text))
+        return new_session
+    if hasattr(module, "build_agent"):
+        def new_session():
+            agent = module.build_agent()
+            return lambda text: agent.invoke({"input": text})["output"]
+        return new_session
+
+    from langchain_core.messages import HumanMessage
+    return lambda: (lambda text: module.chat.invoke([HumanMessage(content=text)]).content)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def run(new_session, script, sessions, server):
+    """Run `script` once in each of `sessions` concurrent sessions."""
+    turns = [new_session() for _ in range(sessions)]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(turn):
+        for message in script:
+            start = time.perf_counter()
+            try:
+                turn(message)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    server.stats.reset()
+    parse_stats.reset()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(turn,)) for turn in turns]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = server.stats.snapshot()
+    parses = parse_stats.snapshot()
+
+    n = len(latencies)
+    return {
+        "sessions": sessions,
+        "turns": n,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "llm_calls_per_turn": stats["chat_calls"] / n,
+        "prompt_tokens_per_turn": stats["prompt_tokens"] / n,
+        "cached_prompt_share": stats["cached_tokens"] / max(stats["prompt_tokens"], 1),
+        "http_calls": stats["http_calls"],
+        "parses_recovered": parses["recovered"],
+        "parse_retries": parses["retries"],
+        "parse_retry_seconds": parses["retry_seconds"],
+        "throughput_tps": n / elapsed,
+        "errors": errors[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bots", nargs="+", default=list(BOTS), choices=list(BOTS))
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per mock chat completion")
+    parser.add_argument("--http-latency", type=float, default=0.01, help="seconds per mock currency/weather call")
+    parser.add_argument("--agent-mode", choices=AGENT_MODES, help="AGENT_MODE for the ReAct bots (default: theirs)")
+    parser.add_argument("--malformed", type=float, default=0.0, help="share of agent completions the mock malforms")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prefix the mock's prompt cache serves (0: any repeated prefix)")
+    parser.add_argument("--strict-parsing", action="store_true", help="re-prompt on every malformed completion")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    if args.agent_mode:
+        os.environ["AGENT_MODE"] = args.agent_mode
+    if args.strict_parsing:
+        os.environ["AGENT_STRICT_PARSING"] = "1"
+
+    with open(os.path.join(BENCH_DIR, "fixtures.json")) as f:
+        fixtures = json.load(f)
+    server = MockServer(fixtures, llm_latency=args.llm_latency, http_latency=args.http_latency,
+                        malformed_rate=args.malformed, cache_min_tokens=args.cache_min_tokens).start()
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    configure_env(server.url, workdir)
+    install_tool_fixtures(fixtures)
+
+    results = []
+    for key in args.bots:
+        _, conversation = BOTS[key]
+        script = fixtures["conversations"][conversation]
+        # The agents are verbose=True; keep their chatter out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            new_session = session_factory(key)
+            for sessions in args.sessions:
+                results.append(dict(run(new_session, script, sessions, server), bot=key))
+
+    header = (f"{'bot':8} {'sess':>4} {'turns':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'llm/turn':>8} "
+              f"{'tok/turn':>9} {'cached':>6} {'turns/s':>8} {'fixed':>6} {'retries':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['bot']:8} {r['sessions']:>4} {r['turns']:>5} {r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['llm_calls_per_turn']:>8.2f} {r['prompt_tokens_per_turn']:>9.0f} "
+              f"{r['cached_prompt_share']:>6.0%} {r['throughput_tps']:>8.1f} {r['parses_recovered']:>6} {r['parse_retries']:>7}")
+        for error in r["errors"]:
+            print(f"         error: {error}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
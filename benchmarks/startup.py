@@ -0,0 +1,168 @@
+"""
+Benchmark how long the bots take to start, without network access.
+
+Every measurement runs in a fresh interpreter against benchmarks/mock_servers.py:
+
+- import: importing the bot script (its tools and agents are lazy)
+- first reply: import, one session, one turn (the conversation's first message)
+- eager: the same, but every lazy tool/model/agent is built before the turn,
+  which is what startup cost before they were lazy
+- fork ready: `bot_launcher.py --serve --workers N` from launch until the port
+  accepts (the parent has imported and warmed the bot and forked)
+- worker reply: the first reply of a pre-forked worker, from connecting, and
+  (next) the reply to the same message sent again, for comparison
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --bots 07 --repeat 5 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+BOTS = ["01", "02", "03", "04", "05", "06", "07"]
+CONVERSATIONS = {"01": "chat", "02": "calculator"}  # the rest: "tools"
+
+
+def child(key, text, eager):
+    """Runs in the fresh interpreter: time the import, the session and the first turn."""
+    started = time.perf_counter()
+    import bot_launcher
+
+    module = bot_launcher.load_bot(key)
+    imported = time.perf_counter()
+    build_session, handle_turn = bot_launcher.session_handlers(module)
+    if eager:
+        from lazy_loading import load_all
+
+        load_all()
+    session = build_session()
+    if eager:
+        bot_launcher.warm_session(session)
+    asyncio.run(handle_turn(session, text))
+    replied = time.perf_counter()
+    print("STARTUP " + json.dumps({"import_s": imported - started, "first_reply_s": replied - started}))
+
+
+def run_child(key, text, eager=False):
+    command = [sys.executable, os.path.abspath(__file__), "--child", key, "--text", text]
+    if eager:
+        command.append("--eager")
+    result = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("STARTUP "):
+            return json.loads(line[len("STARTUP "):])
+    raise RuntimeError(f"bot {key} failed to start:\n{result.stderr[-2000:]}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_forked(key, text, workers):
+    """Launch a pre-forked pool; time until the port accepts, then a worker's first reply."""
+    port = free_port()
+    env = dict(os.environ, BOT_HOST="127.0.0.1", BOT_PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "bot_launcher.py", key, "--serve", "--workers", str(workers)],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"launcher for bot {key} exited:\n{process.stderr.read()[-2000:]}")
+            try:
+                conn = socket.create_connection(("127.0.0.1", port), timeout=60)
+                break
+            except OSError:
+                time.sleep(0.01)
+        ready = time.perf_counter() - started
+        with conn, conn.makefile("rwb") as stream:
+            replies = []
+            for _ in range(2):
+                sent = time.perf_counter()
+                stream.write(text.encode() + b"\n")
+                stream.flush()
+                stream.readline()
+                replies.append(time.perf_counter() - sent)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"fork_ready_s": ready, "worker_reply_s": replies[0], "next_reply_s": replies[1]}
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bots", nargs="+", default=BOTS, choices=BOTS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (the median is reported)")
+    parser.add_argument("--workers", type=int, default=2, help="workers in the pre-forked pool")
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--text", help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.text, args.eager)
+        return
+
+    from mock_servers import MockServer
+    from run_benchmarks import configure_env
+
+    with open(os.path.join(BENCH_DIR, "fixtures.json")) as f:
+        fixtures = json.load(f)
+    server = MockServer(fixtures, llm_latency=0, http_latency=0).start()
+    configure_env(server.url, tempfile.mkdtemp(prefix="startup-"))
+
+    results = []
+    for key in args.bots:
+        text = fixtures["conversations"][CONVERSATIONS.get(key, "tools")][0]
+        lazy = [run_child(key, text) for _ in range(args.repeat)]
+        eager = [run_child(key, text, eager=True) for _ in range(args.repeat)]
+        forked = [run_forked(key, text, args.workers) for _ in range(args.repeat)]
+        results.append({
+            "bot": key,
+            "import_s": median([r["import_s"] for r in lazy]),
+            "first_reply_s": median([r["first_reply_s"] for r in lazy]),
+            "eager_first_reply_s": median([r["first_reply_s"] for r in eager]),
+            "fork_ready_s": median([r["fork_ready_s"] for r in forked]),
+            "worker_reply_ms": median([r["worker_reply_s"] for r in forked]) * 1000,
+            "next_reply_ms": median([r["next_reply_s"] for r in forked]) * 1000,
+        })
+
+    header = (f"{'bot':4} {'import s':>9} {'first reply s':>14} {'eager s':>8} {'fork ready s':>13} "
+              f"{'worker reply ms':>16} {'next ms':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['bot']:4} {r['import_s']:>9.2f} {r['first_reply_s']:>14.2f} {r['eager_first_reply_s']:>8.2f} "
+              f"{r['fork_ready_s']:>13.2f} {r['worker_reply_ms']:>16.1f} {r['next_reply_ms']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Startup-optimized entry point for the bots.
+
+    python bot_launcher.py 07                        # chat in the terminal
+    python bot_launcher.py 07 --serve                # asyncio sessions over TCP, like BOT_SERVE_MODE=async
+    python bot_launcher.py 07 --serve --workers 4    # pre-forked warm pool on one port (Unix)
+
+Importing a bot (LangChain, the OpenAI client, its tools) takes seconds. The
+launcher itself only imports the standard library, so:
+
+- in the terminal, the prompt shows up at once and the bot is imported in a
+  background thread while the first message is typed;
+- with --serve, the port opens as soon as the bot is imported, and what the
+  bot loads lazily (`lazy_loading.Lazy`: the tool loader, llm-math, a local
+  embedding model) is loaded in a background thread instead of by the first
+  request that needs it;
+- with --workers N, the parent imports the bot, loads everything lazy that
+  survives a fork, builds --warm throwaway sessions (so every agent, prompt
+  and tool schema has been built once), freezes its heap and forks N workers
+  that accept connections on the same listening socket. The workers share the
+  parent's memory copy-on-write and answer their first request warm; each
+  loads the rest (a local embedding model) in the background. A worker that
+  exits is replaced by a new fork, which is ready in milliseconds. Each
+  worker gets 1/N of the LLM quota (LLM_RPM / LLM_TPM).
+
+The parent opens no connections and serves nothing the workers would
+inherit: the HTTP pools are still empty when it forks, SQLite connections are
+reopened by each process, and the metrics endpoint (BOT_METRICS_PORT) is only
+started in the workers, worker i on BOT_METRICS_PORT + i. Each worker saves
+its local knowledge index and semantic cache when it exits; a save merges
+with what the other workers already wrote to the same snapshot.
+"""
+import argparse
+import asyncio
+import gc
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from collections.abc import Mapping
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+BOTS = {
+    "01": "01_basic_bot.py",
+    "02": "02_calculator_bot.py",
+    "03": "03_multi_tool_bot.py",
+    "04": "04_bot_with_api.py",
+    "05": "05_Pydantic_Inputs_bot.py",
+    "06": "06_Natural_Inputs_bot.py",
+    "07": "07_multi_agent.py",
+}
+
+# A worker that dies sooner than this after its fork isn't restarted (it would just die again)
+MIN_WORKER_LIFETIME = 5.0
+
+
+def load_bot(key):
+    """Import a bot script (by key, e.g. "07") as a module, without running its chat loop."""
+    filename = BOTS[key]
+    spec = importlib.util.spec_from_file_location(f"bot_{key}", os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def session_handlers(module):
+    """`(build_session, handle_turn)` for a bot, as `async_serving.SessionServer` takes them."""
+    if hasattr(module, "build_agents"):
+        return module.build_agents, module.arespond
+    if hasattr(module, "build_agent"):
+        from async_serving import invoke_agent
+
+        return module.build_agent, invoke_agent
+    return (lambda session_id=None: module.chat), module.reply
+
+
+def warm_session(session):
+    """Build everything a session builds lazily (`LazyAgents` entries)."""
+    if isinstance(session, Mapping):
+        for name in session:
+            session[name]
+
+
+# What the HTTP stack imports, and the response models it builds, on the first
+# request rather than at import: done before forking instead of in every worker
+FIRST_REQUEST_IMPORTS = ["anyio._backends._asyncio"]
+FIRST_REQUEST_MODELS = [("openai.types.chat", "ChatCompletion"), ("openai.types.chat", "ChatCompletionChunk")]
+
+
+def warm_up(build_session, sessions=1):
+    """Before forking: load the fork-safe `Lazy` values and build `sessions` throwaway sessions."""
+    from lazy_loading import load_all
+
+    load_all(fork_safe_only=True)
+    for _ in range(sessions):
+        warm_session(build_session())
+    for name in FIRST_REQUEST_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    for module_name, model_name in FIRST_REQUEST_MODELS:
+        try:
+            getattr(importlib.import_module(module_name), model_name).model_rebuild(force=True)
+        except (ImportError, AttributeError):
+            pass
+
+
+# ---- terminal ----
+def chat(key, turn_budget):
+    loaded = {}
+
+    def load():
+        try:
+            loaded["module"] = load_bot(key)
+        except BaseException as e:
+            loaded["error"] = e
+
+    loader = threading.Thread(target=load, name="bot-loader", daemon=True)
+    loader.start()
+    print(f"Bot {key} is starting; type 'exit' to quit.\n")
+
+    module = session = None
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            user_input = input("You: ")
+            if user_input.lower() in ["exit", "quit"]:
+                break
+            if not user_input.strip():
+                continue
+            if module is None:
+                loader.join()  # usually done by now: it loaded while the message was typed
+                if "error" in loaded:
+                    raise loaded["error"]
+                module = loaded["module"]
+                build_session, handle_turn = session_handlers(module)
+                session = build_session(os.getenv("BOT_SESSION_ID"))
+            from http_client import deadline
+
+            with deadline(turn_budget):
+                reply = loop.run_until_complete(handle_turn(session, user_input))
+            print(f"Bot: {reply}\n")
+    finally:
+        loop.close()
+        if module is not None and hasattr(module, "shutdown"):
+            module.shutdown()
+
+
+# ---- serving ----
+def serve(key, warm=1):
+    """One process: open the port once the bot is imported, load lazy values in the background."""
+    from async_serving import run_server
+    from lazy_loading import load_all
+
+    module = load_bot(key)
+    build_session, handle_turn = session_handlers(module)
+    if warm:
+        threading.Thread(target=load_all, name="warm-up", daemon=True).start()
+    run_server(build_session, handle_turn)
+
+
+def serve_forked(key, workers, warm=1):
+    """Pre-fork: build everything once in this process, then fork `workers` that share it."""
+    if not hasattr(os, "fork"):
+        sys.exit("--workers needs os.fork (Unix); use --serve without it")
+    from async_serving import run_server
+    from instrumentation import defer_metrics, start_metrics
+    from lazy_loading import load_all
+
+    started = time.perf_counter()
+    defer_metrics()  # BOT_METRICS_PORT is served by the workers, each on its own port
+    module = load_bot(key)
+    build_session, handle_turn = session_handlers(module)
+    # Each worker has its own LLM scheduler: split LLM_RPM/LLM_TPM between them
+    # instead of letting N workers each send the whole deployment quota
+    from llm_scheduler import default_scheduler
+
+    default_scheduler.split_quota(workers)
+    if warm:
+        warm_up(build_session, warm)
+
+    # Everything built so far lives as long as the workers: keep the collector
+    # from touching (and so copying) those pages in every worker
+    gc.collect()
+    gc.freeze()
+    host = os.getenv("BOT_HOST", "127.0.0.1")
+    port = int(os.getenv("BOT_PORT", "8765"))
+    sock = socket.create_server((host, port), backlog=512)
+    print(f"Bot {key} loaded and warmed in {time.perf_counter() - started:.2f}s; forking {workers} workers")
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is for the parent, which stops the workers
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            code = 0
+            try:
+                start_metrics(port_offset=index)
+                if warm:
+                    threading.Thread(target=load_all, name="warm-up", daemon=True).start()
+                run_server(build_session, handle_turn, sock=sock)
+            except SystemExit:
+                pass
+            except BaseException:
+                import traceback
+
+                traceback.print_exc()
+                code = 1
+            finally:
+                # Each worker saves what it learned (the parent's copy is stale);
+                # the snapshots merge with what the other workers saved
+                if hasattr(module, "shutdown"):
+                    module.shutdown()
+                os._exit(code)
+        return pid
+
+    # pid -> (index, forked at); a replacement takes over its predecessor's index (and metrics port)
+    children = {spawn(index): (index, time.monotonic()) for index in range(workers)}
+    try:
+        while children:
+            pid, status = os.wait()
+            child = children.pop(pid, None)
+            if child is None:
+                continue
+            index, forked_at = child
+            if time.monotonic() - forked_at < MIN_WORKER_LIFETIME:
+                print(f"Worker {pid} exited right after starting (status {status}); not restarting it")
+                continue
+            print(f"Worker {pid} exited (status {status}); forking a new one")
+            children[spawn(index)] = (index, time.monotonic())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start a bot with deferred loading, or as a pre-forked warm pool.")
+    parser.add_argument("bot", choices=sorted(BOTS), help="which bot to run")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve sessions over TCP on BOT_HOST:BOT_PORT instead of chatting in the terminal")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="with --serve: fork this many workers from one warmed-up parent")
+    parser.add_argument("--warm", type=int, default=1,
+                        help="throwaway sessions built before forking (0: don't load anything up front)")
+    args = parser.parse_args()
+
+    if not args.serve:
+        chat(args.bot, float(os.getenv("BOT_TURN_BUDGET", "60")))
+    elif args.workers > 1:
+        serve_forked(args.bot, args.workers, args.warm)
+    else:
+        serve(args.bot, args.warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Conversation memory with a hard token budget.
+
+Drop-in for ConversationBufferMemory. Turns are kept in a ring buffer with
+their token count computed once, when the turn is saved, so the running total
+is updated incrementally instead of re-tokenising the whole history. Once the
+recent turns plus the rolling summary go over `max_token_limit`, the oldest
+turns are folded into the summary with one LLM call. Eviction goes down to
+`low_watermark` of the budget, so that call happens every few turns, not
+every turn. The summary is capped at `max_summary_tokens` (half the budget),
+so it can't grow until it alone triggers an eviction on every turn. The
+prompt size stays flat however long the session runs.
+
+With a `session_store.SessionStore` and a `session_id`, turns are written
+through to the store as they're saved, and the summary (with the turns kept
+verbatim) after each eviction; a memory built later for the same session id
+starts from what was stored.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.memory.utils import get_prompt_input_key
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.output_parsers import StrOutputParser
+from pydantic import PrivateAttr
+
+from lazy_loading import Lazy
+
+
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return False  # no tiktoken: estimate from length
+
+
+# Loaded on the first count (reading the BPE ranks takes a moment), or before forking workers
+_fallback_encoding = Lazy(_load_encoding, name="cl100k_base")
+
+
+def _has_tokenizer(llm):
+    # AzureChatOpenAI built from a deployment name has model_name=None, and its
+    # get_num_tokens fails looking up a tokenizer for None. Wrappers (the LLM
+    # scheduler) keep the real model in `inner`.
+    while getattr(llm, "inner", None) is not None:
+        llm = llm.inner
+    return llm is not None and getattr(llm, "model_name", "") is not None
+
+
+def count_tokens(llm, text):
+    """
+    `llm.get_num_tokens`, or a cl100k_base count when the model has no known
+    tokenizer (AzureChatOpenAI without model_name only knows its deployment)
+    or there's no model (llm=None).
+    """
+    if _has_tokenizer(llm):
+        return llm.get_num_tokens(text)
+    encoding = _fallback_encoding()
+    return len(encoding.encode(text)) if encoding else (len(text) + 3) // 4
+
+
+def summarize(llm, summary, messages):
+    """Fold `messages` into the running `summary` (same prompt as ConversationSummaryMemory)."""
+    chain = SUMMARY_PROMPT | llm | StrOutputParser()
+    return chain.invoke({"summary": summary, "new_lines": get_buffer_string(messages)})
+
+
+def truncate_summary(llm, summary, max_tokens):
+    """
+    `(summary, tokens)` with the summary cut to at most `max_tokens`. A rolling
+    summary grows at the end, so the oldest part goes, from a sentence start
+    where there is one.
+    """
+    tokens = count_tokens(llm, summary)
+    while tokens > max_tokens and summary:
+        keep = int(len(summary) * max_tokens / tokens * 0.9)
+        summary = summary[len(summary) - keep:] if keep else ""
+        sentence = summary.find(". ")
+        if 0 <= sentence < len(summary) // 2:
+            summary = summary[sentence + 2:]
+        tokens = count_tokens(llm, summary)
+    return summary, tokens
+
+
+class TokenBudgetMemory(BaseMemory):
+    llm: BaseLanguageModel
+    max_token_limit: int = 2000
+    low_watermark: float = 0.75  # evict down to this share of the budget
+    max_turns: int = 64          # ring buffer size, independent of tokens
+    max_summary_tokens: Optional[int] = None  # default: half the budget, so the summary alone never forces an eviction
+    memory_key: str = "chat_history"
+    input_key: Optional[str] = None
+    output_key: Optional[str] = None
+    return_messages: bool = False
+    store: Optional[Any] = None        # session_store.SessionStore
+    session_id: Optional[str] = None   # persisted only with both
+    store_key: str = "memory"          # which of the session's memories this is
+
+    _turns: Deque[Tuple[HumanMessage, AIMessage, int]] = PrivateAttr(default_factory=deque)
+    _turn_tokens: int = PrivateAttr(default=0)
+    _summary: str = PrivateAttr(default="")
+    _summary_tokens: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        if self._persisted:
+            self._summary, self._summary_tokens, turns = self.store.load(self.session_id, self.store_key)
+            for human_text, ai_text, tokens in turns:
+                self._turns.append((HumanMessage(content=human_text), AIMessage(content=ai_text), tokens))
+                self._turn_tokens += tokens
+
+    @property
+    def _persisted(self) -> bool:
+        return self.store is not None and self.session_id is not None
+
+    def _save_snapshot(self) -> None:
+        turns = [(human.content, ai.content, tokens) for human, ai, tokens in self._turns]
+        self.store.save_snapshot(self.session_id, self.store_key, self._summary, self._summary_tokens, turns)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @property
+    def summary_limit(self) -> int:
+        return self.max_summary_tokens or self.max_token_limit // 2
+
+    @property
+    def total_tokens(self) -> int:
+        return self._turn_tokens + self._summary_tokens
+
+    def _messages(self) -> List[BaseMessage]:
+        messages: List[BaseMessage] = []
+        if self._summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {self._summary}"))
+        for human, ai, _ in self._turns:
+            messages.extend([human, ai])
+        return messages
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self._messages()
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def _io(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> Tuple[str, str]:
+        input_key = self.input_key or get_prompt_input_key(inputs, self.memory_variables)
+        if self.output_key:
+            output_key = self.output_key
+        elif len(outputs) == 1:
+            output_key = next(iter(outputs))
+        else:
+            output_key = "output"
+        return str(inputs[input_key]), str(outputs[output_key])
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        human_text, ai_text = self._io(inputs, outputs)
+        human, ai = HumanMessage(content=human_text), AIMessage(content=ai_text)
+        tokens = count_tokens(self.llm, human_text) + count_tokens(self.llm, ai_text)
+        self._turns.append((human, ai, tokens))
+        self._turn_tokens += tokens
+        if self._persisted:
+            self.store.append_turn(self.session_id, self.store_key, human_text, ai_text, tokens)
+        if self.total_tokens > self.max_token_limit or len(self._turns) > self.max_turns:
+            self._evict()
+
+    def _evict(self) -> None:
+        target = int(self.max_token_limit * self.low_watermark)
+        evicted: List[BaseMessage] = []
+        # Always keep the latest turn verbatim
+        while len(self._turns) > 1 and (
+            self._turn_tokens + self._summary_tokens > target or len(self._turns) > self.max_turns
+        ):
+            human, ai, tokens = self._turns.popleft()
+            evicted.extend([human, ai])
+            self._turn_tokens -= tokens
+        if evicted:
+            self._summary, self._summary_tokens = truncate_summary(
+                self.llm, summarize(self.llm, self._summary, evicted), self.summary_limit
+            )
+            if self._persisted:
+                self._save_snapshot()
+
+    def clear(self) -> None:
+        self._turns.clear()
+        self._turn_tokens = 0
+        self._summary = ""
+        self._summary_tokens = 0
+        if self._persisted:
+            self._save_snapshot()
@@ -0,0 +1,183 @@
+"""
+Batched, deduplicated and cached embeddings.
+
+`CachedEmbeddings(AzureOpenAIEmbeddings(...))` is a drop-in LangChain
+`Embeddings`. For every call it
+
+- drops duplicate texts and texts embedded before (any process, any run),
+- sends the rest in batches of up to `batch_size` inputs (the deployment's
+  per-request limit), with up to `max_concurrency` requests in flight,
+- appends the new vectors to an on-disk store and returns everything in
+  input order.
+
+The store is two append-only files: `<path>.f32` (a 16-byte header, then
+float32 rows, memory-mapped for reads) and `<path>.keys` (one 16-byte
+content hash per row). Writers take an flock, so several processes can
+share one store; each process picks up the others' rows from the keys file.
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so only one process should write a store
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MAGIC = b"EMB1"
+HEADER = struct.Struct("<4sI8x")  # magic, dim, padding to 16 bytes
+KEY_SIZE = 16
+
+
+@contextmanager
+def _exclusive(lock_file):
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Content-hash -> float32 vector, append-only, shared between processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.vectors_path = path + ".f32"
+        self.keys_path = path + ".keys"
+        self.dim = None
+        self._rows = {}   # digest -> row
+        self._count = 0   # rows in the keys file
+        self._map = None  # read-only mmap of the vectors file
+        self._view = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock_file = open(path + ".lock", "a+")
+        with self._lock:
+            self._sync()
+
+    def __len__(self):
+        return len(self._rows)
+
+    # ---- reading ----
+    def _sync(self):
+        """Pick up rows other processes appended since we last looked (lock held)."""
+        try:
+            size = os.path.getsize(self.keys_path)
+        except FileNotFoundError:
+            return
+        known = self._count
+        if size // KEY_SIZE <= known:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(known * KEY_SIZE)
+            data = f.read((size // KEY_SIZE - known) * KEY_SIZE)
+        for i in range(len(data) // KEY_SIZE):
+            self._rows.setdefault(data[i * KEY_SIZE:(i + 1) * KEY_SIZE], known + i)
+        self._count = size // KEY_SIZE
+        self._remap()
+
+    def _remap(self):
+        with open(self.vectors_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, dim = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.vectors_path} is not an embedding store")
+        self.dim = dim
+        rows = (len(self._map) - HEADER.size) // (dim * 4)
+        self._view = np.frombuffer(self._map, dtype="<f4", count=rows * dim, offset=HEADER.size).reshape(rows, dim)
+
+    def get_many(self, digests):
+        """{digest: vector} for the digests that are stored."""
+        with self._lock:
+            if any(d not in self._rows for d in digests):
+                self._sync()
+            found = {d: self._rows[d] for d in digests if d in self._rows}
+            view = self._view
+        return {d: view[row] for d, row in found.items()}
+
+    # ---- writing ----
+    def put_many(self, digests, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        with self._lock, _exclusive(self._lock_file):
+            self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.vectors_path, "wb") as f:
+                    f.write(HEADER.pack(MAGIC, self.dim))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"store holds {self.dim}-d vectors, got {vectors.shape[1]}-d")
+            new = [i for i, d in enumerate(digests) if d not in self._rows]
+            new = list({digests[i]: i for i in new}.values())  # one row per digest
+            if not new:
+                return
+            # Vectors first, keys second: a key on disk always has its row. Rows
+            # left behind by a writer that died before writing its keys are cut.
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(HEADER.size + self._count * self.dim * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors[new].tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(digests[i] for i in new))
+            self._sync()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner, path=".cache/embeddings/default", batch_size=2048, max_concurrency=4):
+        """
+        inner: the real `Embeddings` (e.g. AzureOpenAIEmbeddings)
+        path: store prefix; use one per embedding model
+        batch_size: inputs per request (2048 for Azure OpenAI embedding deployments)
+        max_concurrency: embedding requests in flight at once
+        """
+        self.inner = inner
+        self.batch_size = batch_size
+        self.store = EmbeddingStore(path)
+        self._model = str(getattr(inner, "model", None) or getattr(inner, "deployment", None) or "")
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, text):
+        return hashlib.blake2b(f"{self._model}\x00{text}".encode(), digest_size=KEY_SIZE).digest()
+
+    def embed_documents(self, texts):
+        digests = [self._digest(text) for text in texts]
+        unique = dict(zip(digests, texts))  # dedupe within the call
+        found = self.store.get_many(list(unique))
+        missing = [(d, t) for d, t in unique.items() if d not in found]
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            results = self._pool.map(lambda batch: self.inner.embed_documents([t for _, t in batch]), batches)
+            new_digests, new_vectors = [], []
+            for batch, vectors in zip(batches, results):
+                new_digests += [d for d, _ in batch]
+                new_vectors += vectors
+            vectors = np.asarray(new_vectors, dtype=np.float32)
+            self.store.put_many(new_digests, vectors)
+            found.update(zip(new_digests, vectors))
+
+        return [found[d].tolist() for d in digests]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
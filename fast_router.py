@@ -0,0 +1,194 @@
+"""
+Local intent router for the multi-agent bot.
+
+Decides the obvious cases between `utility_agent` (currency, weather, math)
+and `research_agent` (factual lookups) without an LLM call. Keyword/regex
+rules, seeded with the bot's slang-to-currency table, go first and cost
+microseconds. If they're unsure and an embeddings model is given, the query
+is compared against per-route example centroids. When neither is confident
+enough, `route()` returns None and the caller falls back to the LLM router.
+
+Words that are just as common outside a conversion or a forecast (slang like
+"canadian" or "yen", "snow", a bare currency code) are weak cues: they only
+decide together with an amount or a convert/weather phrase. Currency codes
+only count in capitals, so "CAD" is a code and "cad" isn't.
+
+`python fast_router.py` checks the rules against `DECIDED` and `UNDECIDED`.
+"""
+import math
+import re
+
+import numpy as np
+
+UTILITY = "utility_agent"
+RESEARCH = "research_agent"
+
+# Not "try" or "php": far more often an English word or a programming topic than lira or pesos
+CURRENCY_CODES = {
+    "usd", "eur", "inr", "gbp", "jpy", "aud", "cad", "sgd", "cny", "chf", "hkd", "nzd",
+    "sek", "nok", "dkk", "zar", "aed", "sar", "krw", "brl", "mxn", "rub", "thb", "myr",
+    "idr", "pkr", "bdt", "lkr", "npr", "pln", "btc", "eth",
+}
+
+# A number standing on its own (not part of a date, version, size or word)
+_NUMBER = r"(?<![\w./-])\d+(?:\.\d+)?(?![\w./-])"
+_OPERAND = r"\d+(?:\.\d+)?(?![\w./-])"
+# A year pair like 1914-1918 or 2020/21 is a span, not a subtraction or division
+_YEARS = r"(?:1[5-9]|20)\d\d\s*[-/]\s*(?:(?:1[5-9]|20)\d\d|\d\d)(?![\w./-])"
+
+# Words naming money: on their own a weak cue, after an amount ("50 bucks") a strong one
+MONEY_WORDS = ["currency", "currencies", "dollars?", "euros?", "pounds?", "rupees?"]
+
+# (pattern, route, weight): 3 = unambiguous, 2 = strong cue, 1 = weak cue.
+# One strong cue is enough to skip the LLM router, a weak one needs company.
+RULES = [
+    (r"\b(convert|conversion|exchange rate|forex)\b", UTILITY, 2),
+    (r"\b(" + "|".join(MONEY_WORDS) + r")\b", UTILITY, 1),
+    (r"\b(weather|temperature|forecast|raining|rain|snow|humid(ity)?|sunny|windy)\b", UTILITY, 1),
+    (r"\b(weather|temperature|forecast)\s+(in|at|for|like|today|tomorrow|this|next)\b"
+     r"|\b(is|will) it\s+(going to\s+)?(be\s+)?(rain|snow|sunny|windy|cold|hot)", UTILITY, 2),
+    (_NUMBER + r"\s*[+*×÷^]\s*" + _OPERAND, UTILITY, 2),
+    (r"(?<![\w./-])(?!" + _YEARS + r")\d+(?:\.\d+)?\s*[-/]\s*" + _OPERAND, UTILITY, 1),  # also ranges, ids
+    (_NUMBER + r"\s*(%|percent)\s+of\s+" + _OPERAND, UTILITY, 3),
+    (r"\b(calculate|compute|square root|sqrt|percent of|multiplied|divided)\b", UTILITY, 2),
+    (r"\bhow much\b", UTILITY, 1),
+    (r"^(who|whom|whose)\b", RESEARCH, 2),
+    (r"\b(who is|who was|when did|when was|where is|where was|tell me about|history of|biography)\b", RESEARCH, 2),
+    (r"\b(capital of|founded|invented|born|died|president|prime minister|ceo of|population of)\b", RESEARCH, 2),
+    (r"\b(latest news|news about|current events|wikipedia|according to)\b", RESEARCH, 2),
+    (r"^(what|why|how) (is|are|was|were|did|does)\b", RESEARCH, 1),
+]
+
+EXAMPLES = {
+    UTILITY: [
+        "convert 100 USD to INR",
+        "how many euros is 50 bucks",
+        "what's the weather like in London",
+        "is it going to rain in Mumbai today",
+        "what is 15% of 240",
+        "calculate 23 * 47",
+    ],
+    RESEARCH: [
+        "who is the president of France",
+        "tell me about the history of the Roman empire",
+        "when was the Eiffel Tower built",
+        "what is the capital of Australia",
+        "latest news about the Mars rover",
+        "who invented the telephone",
+    ],
+}
+
+# Checked by `python fast_router.py`: rules alone must send these to the route...
+DECIDED = {
+    "convert 100 USD to INR": UTILITY,
+    "50 bucks in rupees": UTILITY,
+    "what's the weather like in London": UTILITY,
+    "is it going to rain in Mumbai today": UTILITY,
+    "what is 15% of 240": UTILITY,
+    "calculate 23 * 47": UTILITY,
+    "who invented the telephone": RESEARCH,
+}
+# ...and leave these to the LLM router (a lone weak cue, or a code in lower case)
+UNDECIDED = [
+    "Best CAD software for 3D printing",
+    "Snow Patrol latest album",
+    "Canadian history 1867",
+    "yen for adventure",
+    "the cad in the story",
+    "World War I 1914-1918",
+]
+
+
+class FastRouter:
+    def __init__(self, slang_to_currency=None, embeddings=None, threshold=0.7,
+                 min_similarity=0.75, examples=EXAMPLES):
+        """
+        slang_to_currency: informal currency names (e.g. the bot's SLANG_TO_CURRENCY)
+        embeddings: optional LangChain `Embeddings` for the similarity classifier
+        threshold: confidence (0-1) needed to skip the LLM router
+        """
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        self.embeddings = embeddings
+        self.examples = examples
+        self._centroids = None
+
+        self._rules = [(re.compile(p, re.IGNORECASE), route, w) for p, route, w in RULES]
+        slang = [re.escape(word) for word in sorted((slang_to_currency or {}), key=len, reverse=True)]
+        if slang:
+            self._rules.append((re.compile(r"\b(" + "|".join(slang) + r")\b", re.IGNORECASE), UTILITY, 1))
+        codes = "|".join(code.upper() for code in sorted(CURRENCY_CODES))
+        self._codes = re.compile(r"\b(" + codes + r")\b")  # case-sensitive: "CAD", not "cad"
+        # An amount of money: "50 bucks", "100 USD", "USD 100", "20 dollars"
+        money = "|".join(slang + MONEY_WORDS)
+        self._amount = re.compile(
+            _NUMBER + r"\s*(?:(?i:" + money + r")\b|(?:" + codes + r")\b)"
+            r"|\b(?:" + codes + r")\s*" + _OPERAND
+        )
+
+    # ---- rules ----
+    def _rule_scores(self, text):
+        scores = {UTILITY: 0, RESEARCH: 0}
+        for pattern, route, weight in self._rules:
+            if pattern.search(text):
+                scores[route] += weight
+        codes = self._codes.findall(text)
+        if codes:
+            scores[UTILITY] += 2 if len(set(codes)) >= 2 else 1  # "USD to INR" is a conversion on its own
+        if self._amount.search(text):
+            scores[UTILITY] += 1
+        return scores
+
+    @staticmethod
+    def _confidence(margin, unit):
+        # margin of `unit` -> 0.5, 2*unit -> 0.75, 3*unit -> 0.875 ...
+        return 1 - math.pow(0.5, margin / unit) if margin > 0 else 0.0
+
+    def _by_rules(self, text):
+        scores = self._rule_scores(text)
+        (best, best_score), (_, other_score) = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        return best, self._confidence(best_score - other_score, 1)
+
+    # ---- embeddings ----
+    def _load_centroids(self):
+        routes = list(self.examples)
+        centroids = []
+        for route in routes:
+            vectors = np.asarray(self.embeddings.embed_documents(self.examples[route]), dtype=np.float32)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self._centroids = routes, np.stack(centroids)
+
+    def _by_embedding(self, text):
+        if self._centroids is None:
+            self._load_centroids()
+        routes, centroids = self._centroids
+        query = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        sims = centroids @ (query / np.linalg.norm(query))
+        order = np.argsort(sims)[::-1]
+        best, second = sims[order[0]], sims[order[1]]
+        if best < self.min_similarity:
+            return routes[order[0]], 0.0
+        return routes[order[0]], self._confidence(float(best - second), 0.05)
+
+    # ---- public API ----
+    def classify(self, text):
+        """(route, confidence) from the cheapest classifier that is confident enough."""
+        route, confidence = self._by_rules(text)
+        if confidence >= self.threshold or self.embeddings is None:
+            return route, confidence
+        return self._by_embedding(text)
+
+    def route(self, text):
+        """Agent name to send `text` to, or None to let the LLM router decide."""
+        route, confidence = self.classify(text)
+        return route if confidence >= self.threshold else None
+
+
+if __name__ == "__main__":
+    router = FastRouter(slang_to_currency={"bucks": "USD", "rupees": "INR", "yen": "JPY", "canadian": "CAD"})
+    wrong = {text: router.classify(text) for text, route in DECIDED.items() if router.route(text) != route}
+    wrong.update({text: router.classify(text) for text in UNDECIDED if router.route(text) is not None})
+    for text, (route, confidence) in wrong.items():
+        print(f"{text!r}: {route} at {confidence:.2f}")
+    raise SystemExit(1 if wrong else 0)
@@ -0,0 +1,264 @@
+"""
+Shared HTTP transport for the bots' own tools (currency rates, weather).
+
+- keep-alive connection pools per host, one client per process
+- every request's timeout is capped by the current turn's remaining budget
+  (`with deadline(seconds):` around the turn, inherited by the tools)
+- idempotent requests are retried on connection errors / 429 / 5xx with
+  jittered exponential backoff, as long as the budget allows
+- a circuit breaker per host fails fast while an upstream is down
+
+`get`/`request` use requests; `aget`/`arequest` use httpx (installed with
+openai) so the same tools work under `ainvoke`.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import span
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+PROBE = "probe"  # CircuitBreaker.allow() for the one trial request of a half-open breaker
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_deadline = contextvars.ContextVar("http_deadline", default=None)  # time.monotonic() value
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a request can't be completed (retries exhausted, breaker open, or no budget left)."""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Raised without touching the network while a host's breaker is open."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Raised when the turn's budget ran out before the request could be made."""
+
+
+@contextmanager
+def deadline(seconds):
+    """Limit every request made inside the block (nested deadlines only ever shrink it)."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current deadline, or None if there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, lets one probe through after `reset_after`s."""
+
+    def __init__(self, failure_threshold=5, reset_after=30):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Truthy if a request may go out: True while closed, PROBE for the half-open trial request."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self._probing = True  # half-open: this caller is the probe
+            return PROBE
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The probe ended with no verdict on the host (caller cancelled, out of budget): let another caller probe."""
+        with self._lock:
+            self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class HttpClient:
+    def __init__(self, timeout=5, retries=2, backoff=0.2, max_backoff=2.0,
+                 pool_size=10, max_hosts=16, failure_threshold=5, reset_after=30):
+        """
+        timeout: per-attempt timeout in seconds (shrunk to the remaining turn budget)
+        retries: extra attempts for idempotent requests
+        backoff/max_backoff: base and cap for the full-jitter backoff between attempts
+        pool_size: keep-alive connections per host; max_hosts: host pools kept
+        failure_threshold/reset_after: per-host circuit breaker settings
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._async_client = None
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_after)
+            return breaker
+
+    # ---- shared retry policy ----
+    def _attempt_timeout(self):
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise DeadlineExceeded("No time left in this turn's budget")
+        return min(self.timeout, left)
+
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to sleep before the next attempt, or None if the budget can't cover it."""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    @staticmethod
+    def _retry_after(headers):
+        value = headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None  # HTTP-date form; fall back to our own backoff
+
+    def _plan(self, method, url):
+        breaker = self.breaker(url)
+        self._attempt_timeout()  # out of budget: fail before taking the half-open probe
+        allowed = breaker.allow()
+        if not allowed:
+            raise CircuitOpen(f"{urlsplit(url).netloc} is unavailable (circuit open)")
+        attempts = 1 + (self.retries if method.upper() in IDEMPOTENT else 0)
+        return breaker, attempts, allowed == PROBE
+
+    # ---- sync ----
+    def request(self, method, url, **kwargs):
+        """Like `requests.request`; returns the last response, raises UpstreamUnavailable on transport failure."""
+        breaker, attempts, probe = self._plan(method, url)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                with span(f"http {method.upper()}", kind="http", url=url, attempt=attempt):
+                    response = self.session.request(method, url, timeout=self._attempt_timeout(), **kwargs)
+            except requests.RequestException as e:
+                breaker.record_failure()
+                # No retry against a breaker this failure (or the failed probe) opened
+                delay = None if last or breaker.is_open else self._backoff(attempt)
+                if delay is None:
+                    raise UpstreamUnavailable(f"{method.upper()} {url} failed: {e}") from e
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Out of budget, interrupted: no verdict on the host, but an unfinished probe must be released
+                if probe:
+                    breaker.release_probe()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            delay = None if last or breaker.is_open else self._backoff(attempt, self._retry_after(response.headers))
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    # ---- async ----
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size),
+            )
+        return self._async_client
+
+    async def arequest(self, method, url, **kwargs):
+        """Async twin of `request` (returns an httpx.Response)."""
+        import httpx
+
+        breaker, attempts, probe = self._plan(method, url)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                with span(f"http {method.upper()}", kind="http", url=url, attempt=attempt):
+                    response = await self.async_client.request(
+                        method, url, timeout=self._attempt_timeout(), **kwargs
+                    )
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                # No retry against a breaker this failure (or the failed probe) opened
+                delay = None if last or breaker.is_open else self._backoff(attempt)
+                if delay is None:
+                    raise UpstreamUnavailable(f"{method.upper()} {url} failed: {e}") from e
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Out of budget, or cancelled (parallel_tools' per-tool timeout): same as above
+                if probe:
+                    breaker.release_probe()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            delay = None if last or breaker.is_open else self._backoff(attempt, self._retry_after(response.headers))
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+
+    async def aget(self, url, **kwargs):
+        return await self.arequest("GET", url, **kwargs)
+
+
+# One client (and one set of pools/breakers) shared by every tool in the process
+default_client = HttpClient()
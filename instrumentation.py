@@ -0,0 +1,406 @@
+"""
+Per-turn span trees for the bots: agent steps, LLM calls, tool calls, HTTP
+requests and memory updates, with monotonic (perf_counter_ns) timings.
+
+    tracer = Tracer([HistogramExporter(), JsonlExporter("traces.jsonl")])
+    with tracer.turn("turn", session="abc"):
+        agent.invoke({"input": text}, config={"callbacks": [tracer.handler]})
+
+LLM, tool and agent spans come from LangChain callbacks. LLM spans carry the
+prompt/completion token usage reported by the API. Code outside LangChain
+opens spans with `span("http GET", kind="http")`, which nest under whatever
+span is current (the tool that made the request, for example). Wrap a memory
+with `tracer.wrap_memory(memory)` to time its load/save, including any
+summarisation it does.
+
+Spans are plain objects and exporting happens once per turn, so leaving this
+on costs a few microseconds per event.
+"""
+import bisect
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.memory import BaseMemory
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "start_ns", "end_ns", "start_time", "attrs", "children", "parent")
+
+    def __init__(self, name, kind, parent=None, **attrs):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.attrs = attrs
+        self.children = []
+        self.start_time = time.time()       # wall clock, for humans
+        self.start_ns = time.perf_counter_ns()  # monotonic, for durations
+        self.end_ns = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def end(self, **attrs):
+        self.end_ns = time.perf_counter_ns()
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self, root_ns=None):
+        root_ns = self.start_ns if root_ns is None else root_ns
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "offset_ms": round((self.start_ns - root_ns) / 1e6, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs,
+            "children": [child.to_dict(root_ns) for child in self.children],
+        }
+
+
+@contextmanager
+def span(name, kind="internal", **attrs):
+    """Child span of the current span; does nothing when no turn is being traced."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(name, kind, parent, **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attrs["error"] = repr(e)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+
+
+class Tracer:
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+        self.handler = TracingCallbackHandler()
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    @contextmanager
+    def turn(self, name="turn", **attrs):
+        if not self.enabled:
+            yield None
+            return
+        root = Span(name, "turn", None, **attrs)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except Exception as e:
+            root.attrs["error"] = repr(e)
+            raise
+        finally:
+            root.end()
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                exporter.export(root)
+
+    def wrap_memory(self, memory, name="memory"):
+        return TracedMemory(inner=memory, name=name) if self.enabled else memory
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Turns LangChain run events into spans under the current turn."""
+
+    run_inline = True  # keep events on the calling thread so contextvars line up
+
+    def __init__(self):
+        self._spans = {}
+        self._previous = {}  # tool run_id -> span that was current before it
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, name, kind, **attrs):
+        with self._lock:
+            parent = self._spans.get(parent_run_id) if parent_run_id else None
+        if parent is None:
+            parent = _current_span.get()
+            if parent is None:
+                return None
+        current = Span(name, kind, parent, **attrs)
+        with self._lock:
+            self._spans[run_id] = current
+        return current
+
+    def _end(self, run_id, **attrs):
+        with self._lock:
+            current = self._spans.pop(run_id, None)
+        if current is not None:
+            current.end(**attrs)
+        return current
+
+    @staticmethod
+    def _name(serialized, kwargs, default):
+        if kwargs.get("name"):
+            return kwargs["name"]
+        if serialized:
+            return serialized.get("name") or (serialized.get("id") or [default])[-1]
+        return default
+
+    # ---- chains / agents ----
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = self._name(serialized, kwargs, "chain")
+        self._start(run_id, parent_run_id, name, "agent" if "Agent" in name else "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        with self._lock:
+            agent = self._spans.get(run_id)
+        if agent is not None:
+            agent.attrs["steps"] = agent.attrs.get("steps", 0) + 1
+            agent.attrs.setdefault("actions", []).append(action.tool)
+
+    # ---- LLM ----
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "llm"), "llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "chat_model"), "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._end(
+            run_id,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,  # provider prompt cache
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    # ---- tools (current span follows the tool so HTTP spans nest under it) ----
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        previous = _current_span.get()
+        current = self._start(run_id, parent_run_id, self._name(serialized, kwargs, "tool"), "tool")
+        if current is not None:
+            with self._lock:
+                self._previous[run_id] = previous
+            _current_span.set(current)
+
+    def _end_tool(self, run_id, **attrs):
+        current = self._end(run_id, **attrs)
+        with self._lock:
+            previous = self._previous.pop(run_id, None)
+        if current is not None and _current_span.get() is current:
+            _current_span.set(previous)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, error=repr(error))
+
+
+class TracedMemory(BaseMemory):
+    """Times load/save of the wrapped memory (summarisation included)."""
+
+    inner: BaseMemory
+    name: str = "memory"
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return self.inner.memory_variables
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with span(f"{self.name}.load", kind="memory"):
+            return self.inner.load_memory_variables(inputs)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        with span(f"{self.name}.save", kind="memory"):
+            self.inner.save_context(inputs, outputs)
+
+    def clear(self) -> None:
+        self.inner.clear()
+
+
+# ---- exporters ----
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank, seen = p / 100 * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class HistogramExporter:
+    """In-process latency histograms per (kind, name) plus token counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.tokens = {"prompt": 0, "completion": 0, "cached": 0}
+
+    def export(self, root):
+        with self._lock:
+            for s in root.walk():
+                key = (s.kind, s.name)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = _Histogram()
+                histogram.observe(s.duration_ms / 1000)
+                if s.kind == "llm":
+                    self.tokens["prompt"] += s.attrs.get("prompt_tokens", 0)
+                    self.tokens["completion"] += s.attrs.get("completion_tokens", 0)
+                    self.tokens["cached"] += s.attrs.get("cached_tokens", 0)
+
+    def summary(self):
+        with self._lock:
+            return {
+                f"{kind}:{name}": {
+                    "count": h.count,
+                    "mean_ms": h.total / h.count * 1000,
+                    "p50_ms": h.percentile(50) * 1000,
+                    "p99_ms": h.percentile(99) * 1000,
+                }
+                for (kind, name), h in self.histograms.items()
+            }
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP bot_span_duration_seconds Duration of traced spans.",
+            "# TYPE bot_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (kind, name), h in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",name="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'bot_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"bot_span_duration_seconds_sum{{{labels}}} {h.total}")
+                lines.append(f"bot_span_duration_seconds_count{{{labels}}} {h.count}")
+            lines += [
+                "# HELP bot_llm_tokens_total LLM tokens reported by the API.",
+                "# TYPE bot_llm_tokens_total counter",
+            ]
+            for kind, value in self.tokens.items():
+                lines.append(f'bot_llm_tokens_total{{type="{kind}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class JsonlExporter:
+    """Appends one JSON span tree per turn to a file."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, root):
+        line = json.dumps(dict(root.to_dict(), start_time=root.start_time), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+def serve_metrics(histograms, port=9464, host="127.0.0.1"):
+    """Serve `histograms.prometheus()` at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = histograms.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Metrics endpoints set up by tracer_from_env: [histograms, port, server or None]
+_endpoints = []
+_deferred = False
+
+
+def defer_metrics():
+    """
+    Set up metrics endpoints from now on without serving them. A process that
+    forks workers (bot_launcher.py --workers) calls this before importing the
+    bot: a server thread doesn't survive a fork, and the parent's histograms
+    would stay empty anyway. Each worker then calls start_metrics().
+    """
+    global _deferred
+    _deferred = True
+
+
+def start_metrics(port_offset=0):
+    """Serve every metrics endpoint not served yet, on its port + `port_offset` (one port per worker)."""
+    for endpoint in _endpoints:
+        histograms, port, server = endpoint
+        if server is None:
+            endpoint[2] = serve_metrics(histograms, port + port_offset)
+
+
+def tracer_from_env(env):
+    """Tracer configured from BOT_TRACE_FILE / BOT_METRICS_PORT (disabled when neither is set)."""
+    exporters = []
+    trace_file = env.get("BOT_TRACE_FILE")
+    metrics_port = env.get("BOT_METRICS_PORT")
+    if trace_file:
+        exporters.append(JsonlExporter(trace_file))
+    if metrics_port:
+        histograms = HistogramExporter()
+        exporters.append(histograms)
+        _endpoints.append([histograms, int(metrics_port), None])
+        if not _deferred:
+            start_metrics()
+    return Tracer(exporters)
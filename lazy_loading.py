@@ -0,0 +1,107 @@
+"""
+Build expensive things the first time they're used instead of at import.
+
+A bot used to load every tool and build every agent before its first prompt,
+even the ones a conversation never touches. `Lazy(factory)` wraps such a
+thing: `lazy.get()` (or `lazy()`) calls the factory once, under a lock, and
+returns the same object afterwards. `LazyAgents` does the same for the
+agents of one session, so a session that only asks for currency conversions
+never builds the research agent.
+
+Lazy values are registered; `load_all()` builds all of them. The pre-fork
+mode of bot_launcher.py calls it in the parent, so the workers it forks
+inherit the loaded tools (copy-on-write) instead of each loading them on its
+first request. Values marked `fork_safe=False` (e.g. a model whose runtime
+starts thread pools, which don't survive a fork) are left to each worker.
+"""
+import threading
+from collections.abc import Mapping
+
+_registry = []  # every Lazy created; they're module-level, so this doesn't grow per session
+_registry_lock = threading.Lock()
+
+
+class Lazy:
+    def __init__(self, factory, name=None, fork_safe=True):
+        """
+        factory: zero-argument callable that builds the value
+        name: shown in repr() and by load_all(); defaults to the factory's name
+        fork_safe: whether the value still works in a process forked after it was built
+        """
+        self.factory = factory
+        self.name = name or getattr(factory, "__name__", "lazy")
+        self.fork_safe = fork_safe
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded = False
+        with _registry_lock:
+            _registry.append(self)
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+        return self._value
+
+    __call__ = get
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __repr__(self):
+        return f"Lazy({self.name}, {'loaded' if self._loaded else 'not loaded'})"
+
+
+def load_all(fork_safe_only=False):
+    """Build every registered Lazy value that isn't built yet (only fork-safe ones if asked); returns their names."""
+    loaded = []
+    # A factory may create (and load) further Lazy values, so repeat until none are left
+    while True:
+        with _registry_lock:
+            pending = [lazy for lazy in _registry if not lazy.loaded and (lazy.fork_safe or not fork_safe_only)]
+        if not pending:
+            return loaded
+        for lazy in pending:
+            lazy.get()
+            loaded.append(lazy.name)
+
+
+class LazyAgents(Mapping):
+    """
+    The agents (and memories) of one session, each built on first access.
+
+    `factories` maps names to `factory(agents)` callables; a factory gets this
+    mapping, so it can use other entries (e.g. the router's memory) or call
+    them later from a tool. Not registered with load_all(): sessions are built
+    per connection, after the fork.
+    """
+
+    def __init__(self, factories):
+        self._factories = dict(factories)
+        self._built = {}
+        self._lock = threading.RLock()  # a factory may look up another entry
+
+    def __getitem__(self, name):
+        try:
+            return self._built[name]
+        except KeyError:
+            pass
+        factory = self._factories[name]
+        with self._lock:
+            if name not in self._built:
+                self._built[name] = factory(self)
+            return self._built[name]
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    @property
+    def built(self):
+        """Names of the entries built so far."""
+        return list(self._built)
@@ -0,0 +1,150 @@
+"""
+Persistent exact-match cache for deterministic (temperature=0) LLM calls.
+
+A LangChain `BaseCache` backed by SQLite in WAL mode. Several processes (e.g.
+Streamlit workers and the bots) can share one cache file. An entry is keyed by
+a hash of the LLM string (deployment name + model kwargs) and the serialised
+message list. The file is kept under `max_bytes` by evicting the least
+recently read entries.
+
+Only attach this to models built with temperature=0. Anything else isn't
+deterministic, so replaying a stored answer would change behaviour.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache(last_access);
+CREATE TABLE IF NOT EXISTS llm_cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteLLMCache(BaseCache):
+    def __init__(self, path=".cache/llm_cache.sqlite", max_bytes=256 * 1024 * 1024,
+                 size_check_every=32):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size_check_every = size_check_every
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._unflushed = {"hits": 0, "misses": 0}
+        self._inserts = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, or with a forked
+        # worker (bot_launcher.py --workers); one per thread per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            self._unflushed[name] += 1
+
+    # ---- BaseCache ----
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return [loads(g) for g in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        value = json.dumps([dumps(g) for g in return_val])
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (self._key(prompt, llm_string), value, len(value), time.time()),
+        )
+        self.flush_stats()
+        with self._lock:
+            self._inserts += 1
+            check = self._inserts % self.size_check_every == 0
+        if check:
+            self._evict()
+
+    def clear(self, **kwargs):
+        self._conn().execute("DELETE FROM llm_cache")
+
+    # ---- eviction + stats ----
+    def _evict(self):
+        """Drop least recently read entries until the cache is back under 90% of max_bytes."""
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - int(self.max_bytes * 0.9)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            freed = 0
+            for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+                if freed >= to_free:
+                    break
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                freed += size
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush_stats(self):
+        """Add this process's hit/miss counts to the shared totals."""
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {"hits": 0, "misses": 0}
+        conn = self._conn()
+        for name, value in pending.items():
+            if value:
+                conn.execute(
+                    "INSERT INTO llm_cache_stats (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (name, value),
+                )
+
+    def stats(self):
+        self.flush_stats()
+        conn = self._conn()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        totals = dict(conn.execute("SELECT name, value FROM llm_cache_stats").fetchall())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,499 @@
+"""
+Request scheduler in front of the chat deployments.
+
+Every bot talks to one Azure deployment with a requests-per-minute and a
+tokens-per-minute quota. Sending each user's calls straight through works
+for one user; with many it ends in 429 storms, where every client retries on
+its own and summarisation competes with people waiting for an answer.
+`schedule(llm)` wraps a chat model so every call first gets a slot from a
+shared `LLMScheduler`:
+
+- token buckets for RPM and TPM: a call is charged its prompt tokens plus
+  `max_tokens`, and the charge is corrected to the real usage afterwards
+- two priorities: interactive turns go before background work (summaries);
+  background work that waited `max_background_wait`s is let through anyway
+- fair share: within a priority, sessions take turns (round robin), so one
+  chatty session can't starve the others
+- adaptive concurrency: the in-flight limit grows while it is fully used and
+  latency stays near its long-term level, shrinks when short-term latency
+  climbs above that, and halves on a 429, which also pauses dispatch for the
+  `Retry-After` period
+
+The session and priority of a call come from `with scheduling(...)` around
+it (the async server sets the session; background summaries set the
+priority), so nothing has to be threaded through the agents.
+
+Set LLM_RPM / LLM_TPM to the deployment's quota. Without them only the
+priorities, fair share and adaptive concurrency apply. The buckets are per
+process: `bot_launcher.py --workers N` gives each worker 1/N of the quota,
+and separately started processes on one deployment need their own share
+(e.g. LLM_RPM=quota/3 for three of them).
+"""
+import asyncio
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatResult
+
+try:
+    from openai import APIConnectionError  # also APITimeoutError
+except ImportError:
+    APIConnectionError = ()
+
+from bounded_memory import count_tokens
+from http_client import DeadlineExceeded, remaining
+from instrumentation import span
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_session = contextvars.ContextVar("llm_session", default=None)
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def scheduling(session=None, priority=None):
+    """Attribute the LLM calls made inside the block to `session` and/or `priority`."""
+    tokens = []
+    if session is not None:
+        tokens.append((_session, _session.set(session)))
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class TokenBucket:
+    """`per_minute` units, refilled continuously; None means unlimited."""
+
+    def __init__(self, per_minute=None):
+        self.per_minute = per_minute
+        self.level = float(per_minute or 0)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.per_minute:
+            self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_for(self, amount, now):
+        """Seconds until `amount` can be taken (0 if it can be now)."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.per_minute)  # a call bigger than the quota waits for a full bucket
+        return max(0.0, (amount - self.level) * 60 / self.per_minute)
+
+    def take(self, amount, now):
+        if self.per_minute:
+            self._refill(now)
+            self.level -= min(amount, self.per_minute)
+
+    def credit(self, amount):
+        """Give back (or, if negative, charge) the difference between estimated and real usage."""
+        if self.per_minute:
+            self.level = min(self.per_minute, self.level + amount)
+
+    def drain(self):
+        if self.per_minute:
+            self.level = min(self.level, 0.0)
+
+    def scale(self, share):
+        """Keep `share` of the quota (and of what's left in the bucket)."""
+        if self.per_minute:
+            self.per_minute *= share
+            self.level *= share
+
+
+class _Ticket:
+    __slots__ = ("cost", "session", "priority", "queued_at", "granted", "future", "loop")
+
+    def __init__(self, cost, session, priority, loop=None):
+        self.cost = cost
+        self.session = session
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class LLMScheduler:
+    def __init__(self, rpm=None, tpm=None, initial_concurrency=4, max_concurrency=64,
+                 latency_tolerance=2.0, max_background_wait=30.0):
+        """
+        rpm / tpm: the deployment's requests / tokens per minute (None = not limited here)
+        initial_concurrency: in-flight calls allowed before any latency has been observed
+        max_concurrency: upper bound for the adaptive limit
+        latency_tolerance: latency over this multiple of the baseline shrinks the limit
+        max_background_wait: seconds after which a background call stops yielding to interactive ones
+        """
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.max_background_wait = max_background_wait
+
+        self._cond = threading.Condition()
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}  # session -> deque of tickets
+        self._queued = 0
+        self._inflight = 0
+        self._cooldown_until = 0.0
+        self._penalty = 1.0           # Retry-After fallback, doubles on consecutive 429s
+        self._latency = None          # short-term EWMA of call latency
+        self._baseline = None         # long-term EWMA: what latency normally is for this workload
+        self.granted = self.rate_limited = 0
+        self.waited = 0.0
+
+    def split_quota(self, processes):
+        """Keep 1/`processes` of the RPM/TPM quota, for one of `processes` that share the deployment."""
+        with self._cond:
+            self.requests.scale(1 / processes)
+            self.tokens.scale(1 / processes)
+
+    # ---- queue ----
+    def _enqueue(self, ticket):
+        self._queues[ticket.priority].setdefault(ticket.session, deque()).append(ticket)
+        self._queued += 1
+
+    def _remove(self, ticket):
+        queue = self._queues[ticket.priority].get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.priority][ticket.session]
+            self._queued -= 1
+
+    def _next(self, now):
+        """The ticket to grant next: interactive first, sessions in turn, starving background work excepted."""
+        background = self._queues[BACKGROUND]
+        if background:
+            oldest = min((queue[0] for queue in background.values()), key=lambda t: t.queued_at)
+            if now - oldest.queued_at >= self.max_background_wait:
+                return oldest
+        for priority in (INTERACTIVE, BACKGROUND):
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _pop(self, ticket):
+        sessions = self._queues[ticket.priority]
+        queue = sessions.pop(ticket.session)
+        queue.popleft()
+        if queue:
+            sessions[ticket.session] = queue  # back of the line: the next session goes first
+        self._queued -= 1
+
+    def _dispatch(self, now):
+        """Grant queued tickets while the limits allow (lock held); seconds until the next might go, or None."""
+        woke = False
+        wait = None
+        while self._queued:
+            if now < self._cooldown_until:
+                wait = self._cooldown_until - now
+                break
+            if self._inflight >= max(1, int(self.limit)):
+                break  # a release will dispatch again
+            ticket = self._next(now)
+            wait = max(self.requests.wait_for(1, now), self.tokens.wait_for(ticket.cost, now))
+            if wait > 0:
+                break
+            wait = None
+            self.requests.take(1, now)
+            self.tokens.take(ticket.cost, now)
+            self._pop(ticket)
+            ticket.granted = True
+            self._inflight += 1
+            self.granted += 1
+            self.waited += now - ticket.queued_at
+            ticket.wake()
+            woke = True
+        if woke:
+            self._cond.notify_all()
+        return wait
+
+    # ---- acquiring a slot ----
+    def acquire(self, cost, session=None, priority=None):
+        """Block until a call costing `cost` tokens may start; returns the ticket to `release`."""
+        ticket = _Ticket(cost, self._session_key(session), _priority.get() if priority is None else priority)
+        with self._cond:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    wait = self._dispatch(time.monotonic())
+                    if ticket.granted:
+                        return ticket
+                    wait = self._bounded(ticket, wait)
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                self._remove(ticket)  # e.g. KeyboardInterrupt while queued
+                raise
+
+    async def aacquire(self, cost, session=None, priority=None):
+        ticket = _Ticket(cost, self._session_key(session), _priority.get() if priority is None else priority,
+                         loop=asyncio.get_running_loop())
+        with self._cond:
+            self._enqueue(ticket)
+        while True:
+            with self._cond:
+                wait = self._dispatch(time.monotonic())
+                if ticket.granted:
+                    return ticket
+                wait = self._bounded(ticket, wait)
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self._cond:
+                    if ticket.granted:
+                        self._release_slot()
+                    else:
+                        self._remove(ticket)
+                raise
+
+    def _bounded(self, ticket, wait):
+        """Cap a wait by the turn's deadline; give up (and leave the queue) once it has passed (lock held)."""
+        left = remaining()
+        if left is None:
+            return wait
+        if left <= 0:
+            self._remove(ticket)
+            raise DeadlineExceeded("No LLM capacity before the turn's deadline")
+        return left if wait is None else min(wait, left)
+
+    @staticmethod
+    def _session_key(session):
+        if session is not None:
+            return session
+        current = _session.get()
+        return current if current is not None else threading.get_ident()
+
+    # ---- feedback ----
+    def _release_slot(self):
+        self._inflight -= 1
+        self._dispatch(time.monotonic())
+        self._cond.notify_all()
+
+    def release(self, ticket, latency=None, used_tokens=None, rate_limited=False, retry_after=None,
+                remaining_tokens=None):
+        """Report how the call went: latency (s), real token usage, 429s and the server's own quota view."""
+        with self._cond:
+            now = time.monotonic()
+            if used_tokens is not None:
+                self.tokens.credit(ticket.cost - used_tokens)
+            if remaining_tokens is not None and self.tokens.per_minute:
+                self.tokens.level = min(self.tokens.level, float(remaining_tokens))
+            if rate_limited:
+                self._on_rate_limited(now, retry_after)
+            elif latency is not None:
+                self._on_success(now, latency)
+            self._release_slot()
+
+    def _on_rate_limited(self, now, retry_after):
+        self.rate_limited += 1
+        self.limit = max(1.0, self.limit / 2)
+        pause = retry_after if retry_after is not None else self._penalty
+        self._penalty = min(30.0, self._penalty * 2)
+        self._cooldown_until = max(self._cooldown_until, now + pause)
+        self.tokens.drain()  # the server says the quota is spent, whatever the bucket thinks
+
+    def _on_success(self, now, latency):
+        self._penalty = 1.0
+        if self._latency is None:
+            self._latency = self._baseline = latency
+        self._latency = 0.8 * self._latency + 0.2 * latency
+        self._baseline = 0.98 * self._baseline + 0.02 * latency
+        if self._baseline > 2 * self._latency:
+            self._baseline = self._latency  # calls got much faster (less load, shorter prompts): start over
+        # 1 while short-term latency is within `latency_tolerance` of the long-term level, down to 0.5 beyond
+        gradient = max(0.5, min(1.0, self.latency_tolerance * self._baseline / self._latency))
+        if gradient < 1.0:
+            target = self.limit * gradient  # queueing at the deployment: back off
+        elif self._inflight >= int(self.limit):
+            target = self.limit + math.sqrt(self.limit)  # using the whole limit and still fast: probe higher
+        else:
+            return
+        self.limit = min(self.max_concurrency, max(1.0, 0.9 * self.limit + 0.1 * target))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "inflight": self._inflight,
+                "queued_interactive": sum(len(q) for q in self._queues[INTERACTIVE].values()),
+                "queued_background": sum(len(q) for q in self._queues[BACKGROUND].values()),
+                "granted": self.granted,
+                "rate_limited": self.rate_limited,
+                "avg_wait_ms": self.waited / self.granted * 1000 if self.granted else 0.0,
+                "latency_ms": (self._latency or 0.0) * 1000,
+            }
+
+
+def _rate_limit_info(error):
+    """(is a 429, Retry-After seconds or None) for an exception from an OpenAI or Hugging Face client."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return False, None
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return True, float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return True, None
+
+
+def _transient(error):
+    """Whether a failed call is worth retrying as is: dropped connection, timeout, 408, 409 or 5xx."""
+    if isinstance(error, APIConnectionError):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status in (408, 409) or (isinstance(status, int) and status >= 500)
+
+
+def _usage(result):
+    """(total tokens used, tokens left in the deployment's window) from a ChatResult, where reported."""
+    used = ((result.llm_output or {}).get("token_usage") or {}).get("total_tokens")
+    message = result.generations[0].message if result.generations else None
+    if used is None and message is not None and message.usage_metadata:
+        used = message.usage_metadata.get("total_tokens")
+    headers = (message.response_metadata.get("headers") if message is not None else None) or {}
+    left = headers.get("x-ratelimit-remaining-tokens")
+    return used, float(left) if left is not None else None
+
+
+class ScheduledChatModel(BaseChatModel):
+    """A chat model whose calls each wait for a slot from `scheduler`."""
+
+    inner: BaseChatModel
+    scheduler: Any
+    max_retries: int = 4              # 429s retried after the scheduler's pause
+    max_transient_retries: int = 2    # connection errors, timeouts, 408/409/5xx (the OpenAI client's default)
+    retry_backoff: float = 0.5        # seconds, doubled per transient retry, with jitter
+    expected_completion_tokens: int = 256  # charged when the model has no max_tokens
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.inner.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        return self.inner.get_num_tokens_from_messages(messages)
+
+    def _cost(self, messages, kwargs):
+        completion = kwargs.get("max_tokens") or getattr(self.inner, "max_tokens", None) or self.expected_completion_tokens
+        return count_tokens(self.inner, get_buffer_string(messages)) + completion
+
+    def _backoff(self, retry):
+        """Jittered exponential delay before a transient retry, cut short by the turn's deadline."""
+        delay = random.uniform(0, self.retry_backoff * 2 ** retry)
+        left = remaining()
+        return delay if left is None else max(0.0, min(delay, left))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        cost = self._cost(messages, kwargs)
+        limited_retries = transient_retries = 0
+        while True:
+            with span("llm.queue", "queue", attempt=limited_retries + transient_retries):
+                ticket = self.scheduler.acquire(cost)
+            started = time.monotonic()
+            try:
+                result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except BaseException as e:
+                # Also on cancellation (client gone, tool timeout): the slot is freed, without a latency sample
+                limited, retry_after = _rate_limit_info(e)
+                self.scheduler.release(ticket, rate_limited=limited, retry_after=retry_after)
+                if limited and limited_retries < self.max_retries:
+                    limited_retries += 1
+                    continue
+                if _transient(e) and transient_retries < self.max_transient_retries:
+                    time.sleep(self._backoff(transient_retries))
+                    transient_retries += 1
+                    continue
+                raise
+            used, left = _usage(result)
+            self.scheduler.release(ticket, time.monotonic() - started, used, remaining_tokens=left)
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        cost = self._cost(messages, kwargs)
+        limited_retries = transient_retries = 0
+        while True:
+            with span("llm.queue", "queue", attempt=limited_retries + transient_retries):
+                ticket = await self.scheduler.aacquire(cost)
+            started = time.monotonic()
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except BaseException as e:
+                # Also on cancellation (client gone, tool timeout): the slot is freed, without a latency sample
+                limited, retry_after = _rate_limit_info(e)
+                self.scheduler.release(ticket, rate_limited=limited, retry_after=retry_after)
+                if limited and limited_retries < self.max_retries:
+                    limited_retries += 1
+                    continue
+                if _transient(e) and transient_retries < self.max_transient_retries:
+                    await asyncio.sleep(self._backoff(transient_retries))
+                    transient_retries += 1
+                    continue
+                raise
+            used, left = _usage(result)
+            self.scheduler.release(ticket, time.monotonic() - started, used, remaining_tokens=left)
+            return result
+
+
+def scheduler_from_env(env):
+    """LLMScheduler for LLM_RPM / LLM_TPM / LLM_MAX_CONCURRENCY (all optional)."""
+    def number(name):
+        value = env.get(name)
+        return int(value) if value else None
+
+    return LLMScheduler(
+        rpm=number("LLM_RPM"),
+        tpm=number("LLM_TPM"),
+        max_concurrency=number("LLM_MAX_CONCURRENCY") or 64,
+    )
+
+
+# One scheduler per process: every bot in it shares the deployment's quota
+default_scheduler = scheduler_from_env(os.environ)
+
+
+def schedule(llm, scheduler=None, **kwargs):
+    """Wrap a chat model so its calls go through `scheduler` (default: the process-wide one).
+
+    Build the wrapped model with max_retries=0: the scheduler retries 429s itself,
+    after pausing every caller, instead of each client retrying on its own, and
+    retries dropped connections, timeouts and 5xx (`max_transient_retries`) with
+    backoff, each attempt taking a fresh slot. Model
+    options that act outside the request, like `cache=`, go here in `kwargs`.
+    """
+    return ScheduledChatModel(inner=llm, scheduler=scheduler or default_scheduler, **kwargs)
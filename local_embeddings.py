@@ -0,0 +1,209 @@
+"""
+Sentence embeddings computed locally on CPU.
+
+`LocalEmbeddings()` is a drop-in for `AzureOpenAIEmbeddings`: same LangChain
+`Embeddings` interface, but a small sentence-transformers model runs in this
+process, so routing, caching and retrieval can embed text in a few
+milliseconds with no network round trip.
+
+Two backends, picked when the model is loaded (on the first embedding, or
+`load()`):
+
+- ONNX Runtime, when `onnxruntime` is installed and an exported model exists
+  (`python local_embeddings.py --export` writes an int8-quantized one to
+  `.cache/onnx/<model>/`). This is the fast path.
+- PyTorch via `transformers`, with the Linear layers dynamically quantized to
+  int8 (`quantize=True`), for when there's no ONNX export.
+
+Texts are sorted by length and cut into batches (little padding per batch),
+and batches run on a small thread pool; both runtimes release the GIL while
+computing.
+"""
+import argparse
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from lazy_loading import Lazy
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR = ".cache/onnx"
+
+
+def default_onnx_path(model_name):
+    """Where `export_onnx` puts the quantized export of `model_name`."""
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"), "model.quant.onnx")
+
+
+class LocalEmbeddings(Embeddings):
+    def __init__(self, model_name=DEFAULT_MODEL, onnx_path=None, batch_size=32, max_length=256,
+                 num_threads=None, max_concurrency=2, quantize=True):
+        """
+        model_name: Hugging Face sentence-embedding model (mean pooling is applied)
+        onnx_path: exported model to run with onnxruntime (default: default_onnx_path(model_name) if it exists)
+        batch_size: texts per forward pass
+        max_length: tokens per text; longer texts are truncated
+        num_threads: intra-op threads per forward pass (default: cores / max_concurrency)
+        max_concurrency: batches computed at once
+        quantize: int8 dynamic quantization for the PyTorch backend
+        """
+        self.model = model_name  # also keys CachedEmbeddings' store, like the Azure `model`
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="local-embed")
+        self._onnx_path = onnx_path or default_onnx_path(model_name)
+        self._quantize = quantize
+        # A fast (Rust) tokenizer can't be called from two threads at once ("Already borrowed")
+        self._tokenizer_lock = threading.Lock()
+        # The backend name once loaded. load_all() loads it too, but not before a fork:
+        # ONNX Runtime/PyTorch thread pools don't survive one
+        self._loader = Lazy(self._load_backend, name=f"LocalEmbeddings({model_name})", fork_safe=False)
+
+    # ---- backends ----
+    def load(self):
+        """Load the model now instead of on the first embedding (importing torch/onnxruntime takes seconds)."""
+        self._loader.get()
+        return self
+
+    @property
+    def backend(self):
+        return self._loader.get()
+
+    def _load_backend(self):
+        if os.path.exists(self._onnx_path) and self._load_onnx(self._onnx_path):
+            return "onnx"
+        self._load_torch(self._quantize)
+        return "torch"
+
+    def _load_onnx(self, path):
+        try:
+            import onnxruntime
+        except ImportError:
+            return False
+        from transformers import AutoTokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        # export_onnx saves the tokenizer next to the model, so no hub access is needed
+        directory = os.path.dirname(path)
+        source = directory if os.path.exists(os.path.join(directory, "tokenizer_config.json")) else self.model
+        self.tokenizer = AutoTokenizer.from_pretrained(source)
+        return True
+
+    def _load_torch(self, quantize):
+        try:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "LocalEmbeddings needs onnxruntime (with an exported model) or torch + transformers"
+            ) from e
+        torch.set_num_threads(self.num_threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model)
+        model = AutoModel.from_pretrained(self.model).eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._torch, self._model = torch, model
+
+    def _hidden_states(self, encoded):
+        """(batch, tokens, dim) last hidden state for tokenized inputs."""
+        if self.backend == "onnx":
+            feed = {name: encoded[name].astype(np.int64) for name in self._input_names}
+            return self._session.run(None, feed)[0]
+        with self._torch.inference_mode():
+            inputs = {name: self._torch.from_numpy(array) for name, array in encoded.items()}
+            return self._model(**inputs).last_hidden_state.numpy()
+
+    def _embed_batch(self, texts):
+        self.load()
+        with self._tokenizer_lock:
+            encoded = dict(self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                          return_tensors="np"))
+        hidden = self._hidden_states(encoded)
+        # Mean over real tokens, then unit length (what sentence-transformers does)
+        mask = encoded["attention_mask"][..., np.newaxis].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    # ---- Embeddings interface ----
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # Similar lengths share a batch, so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch([texts[i] for i in batches[0]])]
+        else:
+            results = self._pool.map(lambda batch: self._embed_batch([texts[i] for i in batch]), batches)
+        vectors = [None] * len(texts)
+        for batch, embedded in zip(batches, results):
+            for i, vector in zip(batch, embedded):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+def export_onnx(model_name=DEFAULT_MODEL, path=None, quantize=True, opset=17):
+    """Export `model_name` to ONNX (int8-quantized by default) plus its tokenizer; returns the model path."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    path = path or default_onnx_path(model_name)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(directory)
+
+    sample = tokenizer(["A sample sentence to trace the graph."], return_tensors="pt")
+    # BERT-style forward(input_ids, attention_mask, token_type_ids): positional order matters
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    axes = {name: {0: "batch", 1: "tokens"} for name in names + ["last_hidden_state"]}
+    full_path = path + ".fp32" if quantize else path
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in names), full_path, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(full_path, path, weight_type=QuantType.QInt8)
+        os.remove(full_path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a sentence-embedding model for LocalEmbeddings.")
+    parser.add_argument("--export", action="store_true", help="export the model to ONNX")
+    parser.add_argument("--model", default=os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_MODEL))
+    parser.add_argument("--path", help=f"output file (default: under {ONNX_DIR}/)")
+    parser.add_argument("--no-quantize", action="store_true", help="keep float32 weights")
+    args = parser.parse_args()
+
+    if args.export:
+        path = export_onnx(args.model, args.path, quantize=not args.no_quantize)
+        print(f"Exported {args.model} to {path}")
+        return
+    embeddings = LocalEmbeddings(args.model, onnx_path=args.path)
+    vector = embeddings.embed_query("Delhi is the capital of India")
+    print(f"{args.model} ({embeddings.backend}): {len(vector)}-d vectors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Local retrieval over everything the research tools have fetched before.
+
+Every Wikipedia/Search result is split into chunks, embedded (in the
+background, off the request path) and appended to a float32 matrix of unit
+vectors. The research agent gets a `local_knowledge` tool to try first: a
+repeat question is answered from here in milliseconds instead of a web round
+trip, and only falls through to wikipedia/Search when nothing close enough
+is stored.
+
+Search is an exact matrix-vector product until the index reaches
+`ivf_threshold` chunks. Past that it switches to an IVF index: k-means
+centroids over the vectors, and only the `nprobe` closest lists are scored.
+The index is snapshotted to an `.npz` file so it survives restarts; when
+several worker processes share the file, each save first merges in the chunks
+the others saved.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.tools import Tool
+
+from snapshots import file_version, snapshot_lock
+
+NO_RESULT = "No relevant local knowledge found."
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_text(text, max_chars=800, overlap=1):
+    """Split into chunks of whole sentences up to `max_chars`, repeating `overlap` sentences between chunks."""
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        sentences = [s.strip() for s in _SENTENCE_END.split(" ".join(paragraph.split())) if s.strip()]
+        current = []
+        for sentence in sentences:
+            if current and len(" ".join(current + [sentence])) > max_chars:
+                chunks.append(" ".join(current))
+                current = current[-overlap:] if overlap else []
+            current.append(sentence)
+        if current:
+            chunks.append(" ".join(current))
+    return [chunk[: max_chars * 2] for chunk in chunks]  # a single huge "sentence" is cut
+
+
+def _digest(text):
+    return hashlib.blake2b(" ".join(text.lower().split()).encode(), digest_size=8).hexdigest()
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalKnowledge:
+    def __init__(self, embeddings, path=None, min_score=0.8, max_chunks=500_000,
+                 ivf_threshold=20_000, nprobe=8, snapshot_every=20, seed=0):
+        """
+        embeddings: any LangChain `Embeddings` (e.g. AzureOpenAIEmbeddings)
+        path: `.npz` snapshot to load from / save to (None keeps it in memory)
+        min_score: cosine similarity a chunk needs to be returned
+        ivf_threshold: chunk count from which search uses the IVF index
+        nprobe: IVF lists scored per query
+        snapshot_every: save after this many ingested results
+        """
+        self.embeddings = embeddings
+        self.path = path
+        self.min_score = min_score
+        self.max_chunks = max_chunks
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.snapshot_every = snapshot_every
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._vectors = None  # (capacity, dim) float32, unit length
+        self._size = 0
+        self._chunks = []     # [(text, source, query)]
+        self._seen = set()    # digests of stored chunks
+        self._centroids = None
+        self._lists = None    # IVF list of each vector
+        self._trained_at = 0
+        self._unsaved = 0
+        self._disk_version = None  # snapshot file as this process last read or wrote it
+        self._ingester = ThreadPoolExecutor(max_workers=1, thread_name_prefix="knowledge")
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return self._size
+
+    # ---- ingestion ----
+    def add(self, text, source="", query=""):
+        """Chunk, embed and store `text`; chunks already stored are skipped. Returns chunks added."""
+        chunks = []
+        for chunk in chunk_text(text):
+            digest = _digest(chunk)
+            if digest not in self._seen:
+                chunks.append((digest, chunk))
+        if not chunks:
+            return 0
+        vectors = _unit(self.embeddings.embed_documents([chunk for _, chunk in chunks]))
+
+        with self._lock:
+            added = 0
+            for (digest, chunk), vector in zip(chunks, vectors):
+                if digest in self._seen or self._size >= self.max_chunks:
+                    continue
+                self._append(vector)
+                self._chunks.append((chunk, source, query))
+                self._seen.add(digest)
+                added += 1
+            if self._size >= self.ivf_threshold and self._size >= 2 * self._trained_at:
+                self._train()
+            self._unsaved += 1
+            save = self.path and self._unsaved >= self.snapshot_every
+        if save:
+            self.save()
+        return added
+
+    def add_async(self, text, source="", query=""):
+        """Queue `add` on the background ingester (embedding calls stay off the request path)."""
+        return self._ingester.submit(self.add, text, source, query)
+
+    def _append(self, vector):
+        if self._vectors is None:
+            self._vectors = np.zeros((1024, len(vector)), dtype=np.float32)
+        elif self._size == len(self._vectors):
+            grown = np.zeros((len(self._vectors) * 2, self._vectors.shape[1]), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            self._vectors = grown
+        if self._lists is not None and len(self._lists) < len(self._vectors):
+            lists = np.zeros(len(self._vectors), dtype=np.int32)
+            lists[: self._size] = self._lists[: self._size]
+            self._lists = lists
+        self._vectors[self._size] = vector
+        if self._centroids is not None:
+            self._lists[self._size] = np.argmax(self._centroids @ vector)
+        self._size += 1
+
+    # ---- IVF ----
+    def _train(self, iterations=10):
+        """Spherical k-means over (a sample of) the vectors, then assign every vector to a list (lock held)."""
+        vectors = self._vectors[: self._size]
+        nlist = max(1, int(np.sqrt(self._size)))
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(self._size, size=min(self._size, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # keep empty lists where they were
+            centroids = _unit(sums)
+        self._centroids = centroids
+        self._lists = np.zeros(len(self._vectors), dtype=np.int32)
+        for start in range(0, self._size, 8192):
+            self._lists[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        self._trained_at = self._size
+
+    # ---- search ----
+    def search(self, query, k=4):
+        """[(score, chunk, source, query)] for the best chunks scoring at least `min_score`."""
+        if not self._size:
+            return []
+        q = _unit(self.embeddings.embed_query(query))
+        with self._lock:
+            n = self._size
+            vectors, centroids, lists = self._vectors, self._centroids, self._lists
+            chunks = self._chunks
+        if centroids is None:
+            ids = np.arange(n)
+            scores = vectors[:n] @ q
+        else:
+            probe = np.argsort(centroids @ q)[-self.nprobe:]
+            ids = np.flatnonzero(np.isin(lists[:n], probe))
+            scores = vectors[ids] @ q
+        if len(ids) > k:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(scores[top])[::-1]]
+        return [
+            (float(scores[i]), *chunks[ids[i]])
+            for i in top
+            if scores[i] >= self.min_score
+        ]
+
+    # ---- tools ----
+    def lookup(self, query):
+        """Tool function: the matching chunks as text, or NO_RESULT."""
+        hits = self.search(query)
+        if not hits:
+            return NO_RESULT
+        return "\n\n".join(f"[{source}: {asked}] {chunk}" for _, chunk, source, asked in hits)
+
+    def as_tool(self):
+        return Tool(
+            name="local_knowledge",
+            func=self.lookup,
+            description="Facts found by earlier research, searched locally in milliseconds. "
+                        "Try this first for factual questions. If it answers "
+                        f"'{NO_RESULT}' or the result doesn't answer the question, use wikipedia or Search.",
+        )
+
+    def wrap(self, tool):
+        """Same tool, but every result is also ingested into the index in the background."""
+        def run(query):
+            result = str(tool.invoke(query))
+            self.add_async(result, source=tool.name, query=query)
+            return result
+
+        async def arun(query):
+            result = str(await tool.ainvoke(query))
+            self.add_async(result, source=tool.name, query=query)
+            return result
+
+        return Tool(name=tool.name, description=tool.description, func=run, coroutine=arun)
+
+    # ---- persistence ----
+    def save(self, path=None):
+        path = path or self.path
+        with snapshot_lock(path):
+            # Another worker saved since we last looked: keep its chunks
+            if file_version(path) not in (None, self._disk_version):
+                self.merge(path)
+            with self._lock:
+                if not self._size:
+                    return
+                arrays = dict(
+                    vectors=self._vectors[: self._size].copy(),
+                    chunks=np.frombuffer(json.dumps(self._chunks).encode(), dtype=np.uint8),
+                )
+                if self._centroids is not None:
+                    arrays.update(centroids=self._centroids, lists=self._lists[: self._size].copy(),
+                                  trained_at=np.array(self._trained_at))
+                self._unsaved = 0
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+            self._disk_version = file_version(path)
+
+    @staticmethod
+    def _read(path):
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            chunks = [tuple(c) for c in json.loads(data["chunks"].tobytes().decode())]
+            centroids = data["centroids"] if "centroids" in data else None
+            lists = data["lists"] if "lists" in data else None
+            trained_at = int(data["trained_at"]) if "trained_at" in data else 0
+        return vectors, chunks, centroids, lists, trained_at
+
+    def merge(self, path):
+        """Add the chunks of the snapshot at `path` that aren't stored here yet. Returns chunks added."""
+        vectors, chunks, _, _, _ = self._read(path)
+        with self._lock:
+            added = 0
+            for (chunk, source, query), vector in zip(chunks, vectors):
+                digest = _digest(chunk)
+                if digest in self._seen or self._size >= self.max_chunks:
+                    continue
+                self._append(vector)
+                self._chunks.append((chunk, source, query))
+                self._seen.add(digest)
+                added += 1
+            if added and self._size >= self.ivf_threshold and self._size >= 2 * self._trained_at:
+                self._train()
+        self._disk_version = file_version(path)
+        return added
+
+    def load(self, path):
+        vectors, chunks, centroids, lists, trained_at = self._read(path)
+        with self._lock:
+            self._vectors = np.zeros((max(len(vectors), 1024), vectors.shape[1]), dtype=np.float32)
+            self._vectors[: len(vectors)] = vectors
+            self._size = len(vectors)
+            self._chunks = chunks
+            self._seen = {_digest(chunk) for chunk, _, _ in chunks}
+            self._centroids, self._trained_at = centroids, trained_at
+            self._lists = None
+            if lists is not None:
+                self._lists = np.zeros(len(self._vectors), dtype=np.int32)
+                self._lists[: len(lists)] = lists
+        self._disk_version = file_version(path)
+
+    def close(self):
+        """Finish queued ingestion and write a final snapshot."""
+        self._ingester.shutdown(wait=True)
+        if self.path:
+            self.save()
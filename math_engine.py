@@ -0,0 +1,537 @@
+"""
+Native calculator for the agents.
+
+The `llm-math` tool costs an extra LLM call per question: it asks the model
+to turn the question into an expression, then evaluates that with numexpr.
+The agent already has to decide what to compute, so `calculator_tool()`
+takes the expression directly and evaluates it here:
+
+- safely: the expression is parsed with `ast` and only arithmetic, numbers,
+  lists, known names and whitelisted functions are evaluated
+- exactly: numbers are `Decimal`s with `PRECISION` significant digits, so
+  0.1 + 0.2 is 0.3 and big integers don't overflow
+- with units: "5 km + 300 m", "60 mph to km/h", "2 GB / 5 s"
+- over lists with NumPy: "[120, 80, 45] * 1.18", "mean([3, 5, 10])" (list
+  maths is float64)
+
+Anything it can't parse (e.g. a question in words) goes to the `llm-math`
+fallback, if one is given.
+"""
+import ast
+import decimal
+import math
+import re
+from decimal import Decimal
+
+import numpy as np
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+from lazy_loading import Lazy
+
+PRECISION = 50
+MAX_LENGTH = 500       # characters in an expression
+MAX_EXPONENT = 10_000  # bounds x ** n, so one request can't pin a CPU
+MAX_FACTORIAL = 1000
+MAX_LIST = 100_000
+
+PI = Decimal("3.14159265358979323846264338327950288419716939937510")
+E = Decimal("2.71828182845904523536028747135266249775724709369995")
+
+
+class MathError(ValueError):
+    """Raised when an expression can't be evaluated (syntax, unknown name, bad units...)."""
+
+
+# ---- units ----
+BASE_DIMENSIONS = ("m", "kg", "s", "bit")
+
+
+def _dims(m=0, kg=0, s=0, bit=0):
+    return (m, kg, s, bit)
+
+
+DIMENSIONLESS = _dims()
+
+# name -> (factor to SI, dimensions)
+UNITS = {
+    # length
+    "m": (Decimal(1), _dims(m=1)), "km": (Decimal(1000), _dims(m=1)), "cm": (Decimal("0.01"), _dims(m=1)),
+    "mm": (Decimal("0.001"), _dims(m=1)), "mi": (Decimal("1609.344"), _dims(m=1)),
+    "mile": (Decimal("1609.344"), _dims(m=1)), "miles": (Decimal("1609.344"), _dims(m=1)),
+    "ft": (Decimal("0.3048"), _dims(m=1)), "feet": (Decimal("0.3048"), _dims(m=1)),
+    "inch": (Decimal("0.0254"), _dims(m=1)), "inches": (Decimal("0.0254"), _dims(m=1)),
+    "yd": (Decimal("0.9144"), _dims(m=1)), "nmi": (Decimal(1852), _dims(m=1)),
+    # mass
+    "kg": (Decimal(1), _dims(kg=1)), "g": (Decimal("0.001"), _dims(kg=1)), "mg": (Decimal("0.000001"), _dims(kg=1)),
+    "t": (Decimal(1000), _dims(kg=1)), "tonne": (Decimal(1000), _dims(kg=1)),
+    "lb": (Decimal("0.45359237"), _dims(kg=1)), "lbs": (Decimal("0.45359237"), _dims(kg=1)),
+    "oz": (Decimal("0.028349523125"), _dims(kg=1)),
+    # time ("min" is minutes unless it's called, then it's min())
+    "s": (Decimal(1), _dims(s=1)), "sec": (Decimal(1), _dims(s=1)), "ms": (Decimal("0.001"), _dims(s=1)),
+    "min": (Decimal(60), _dims(s=1)), "h": (Decimal(3600), _dims(s=1)), "hr": (Decimal(3600), _dims(s=1)),
+    "hour": (Decimal(3600), _dims(s=1)), "hours": (Decimal(3600), _dims(s=1)),
+    "day": (Decimal(86400), _dims(s=1)), "days": (Decimal(86400), _dims(s=1)),
+    "week": (Decimal(604800), _dims(s=1)), "weeks": (Decimal(604800), _dims(s=1)),
+    "year": (Decimal(31557600), _dims(s=1)), "years": (Decimal(31557600), _dims(s=1)),  # Julian year
+    # area / volume
+    "ha": (Decimal(10000), _dims(m=2)), "acre": (Decimal("4046.8564224"), _dims(m=2)),
+    "L": (Decimal("0.001"), _dims(m=3)), "l": (Decimal("0.001"), _dims(m=3)), "ml": (Decimal("0.000001"), _dims(m=3)),
+    "gal": (Decimal("0.003785411784"), _dims(m=3)),
+    # speed
+    "mph": (Decimal("0.44704"), _dims(m=1, s=-1)), "kph": (Decimal(1000) / 3600, _dims(m=1, s=-1)),
+    "knot": (Decimal(1852) / 3600, _dims(m=1, s=-1)), "knots": (Decimal(1852) / 3600, _dims(m=1, s=-1)),
+    # force / energy / power
+    "N": (Decimal(1), _dims(m=1, kg=1, s=-2)), "J": (Decimal(1), _dims(m=2, kg=1, s=-2)),
+    "kJ": (Decimal(1000), _dims(m=2, kg=1, s=-2)), "cal": (Decimal("4.184"), _dims(m=2, kg=1, s=-2)),
+    "kcal": (Decimal(4184), _dims(m=2, kg=1, s=-2)), "Wh": (Decimal(3600), _dims(m=2, kg=1, s=-2)),
+    "kWh": (Decimal(3600000), _dims(m=2, kg=1, s=-2)),
+    "W": (Decimal(1), _dims(m=2, kg=1, s=-3)), "kW": (Decimal(1000), _dims(m=2, kg=1, s=-3)),
+    "hp": (Decimal("745.69987158227022"), _dims(m=2, kg=1, s=-3)),
+    # data
+    "bit": (Decimal(1), _dims(bit=1)), "bits": (Decimal(1), _dims(bit=1)),
+    "B": (Decimal(8), _dims(bit=1)), "byte": (Decimal(8), _dims(bit=1)), "bytes": (Decimal(8), _dims(bit=1)),
+    "KB": (Decimal(8000), _dims(bit=1)), "MB": (Decimal(8 * 10 ** 6), _dims(bit=1)),
+    "GB": (Decimal(8 * 10 ** 9), _dims(bit=1)), "TB": (Decimal(8 * 10 ** 12), _dims(bit=1)),
+    "KiB": (Decimal(8 * 2 ** 10), _dims(bit=1)), "MiB": (Decimal(8 * 2 ** 20), _dims(bit=1)),
+    "GiB": (Decimal(8 * 2 ** 30), _dims(bit=1)),
+}
+
+
+class Quantity:
+    """A value (Decimal or float64 array) in SI units with dimensions, and the unit to show it in."""
+
+    __slots__ = ("value", "dims", "unit", "factor")
+
+    def __init__(self, value, dims, unit=None, factor=Decimal(1)):
+        self.value = value
+        self.dims = dims
+        self.unit = unit      # display unit, e.g. "km/h"
+        self.factor = factor  # display unit -> SI
+
+    def __repr__(self):
+        return f"Quantity({self.value!r}, {self.dims!r}, {self.unit!r})"
+
+
+def _unit_name(dims):
+    """SI spelling of a dimension tuple: (1, 1, -2, 0) -> "m*kg/s**2"."""
+    up, down = [], []
+    for name, power in zip(BASE_DIMENSIONS, dims):
+        if power:
+            text = name if abs(power) == 1 else f"{name}**{abs(power)}"
+            (up if power > 0 else down).append(text)
+    return ("*".join(up) or "1") + "".join(f"/{d}" for d in down)
+
+
+def _same_dims(a, b, op):
+    if a.dims != b.dims:
+        raise MathError(f"can't {op} {a.unit or _unit_name(a.dims)} and {b.unit or _unit_name(b.dims)}")
+
+
+# ---- numbers ----
+def _is_array(x):
+    return isinstance(x, np.ndarray)
+
+
+def _floats(x):
+    return x if _is_array(x) else float(x)
+
+
+def _decimal(x):
+    if isinstance(x, Decimal):
+        return x
+    if isinstance(x, (int, np.integer)):
+        return Decimal(int(x))
+    return Decimal(repr(float(x)))
+
+
+def _binary(op, a, b):
+    """Plain numbers: exact Decimal maths, float64 NumPy as soon as a list is involved."""
+    if _is_array(a) or _is_array(b):
+        return op(_floats(a), _floats(b))
+    return op(a, b)
+
+
+def _power(base, exponent):
+    if _is_array(base) or _is_array(exponent):
+        return np.power(_floats(base), _floats(exponent))
+    if abs(exponent) > MAX_EXPONENT:
+        raise MathError(f"exponent larger than {MAX_EXPONENT}")
+    if base < 0 and exponent != exponent.to_integral_value():
+        raise MathError("fractional power of a negative number")
+    return base ** exponent
+
+
+def _scalar_function(decimal_fn, float_fn):
+    def apply(x):
+        if _is_array(x):
+            return float_fn(x)
+        return decimal_fn(x)
+    return apply
+
+
+def _via_float(fn):
+    return lambda x: _decimal(fn(float(x)))
+
+
+def _reduce(fn, exact=None):
+    """Aggregate over a list argument or over several arguments."""
+    def apply(*args):
+        if len(args) == 1 and _is_array(args[0]):
+            return _decimal(fn(args[0]))
+        if exact is not None and not any(_is_array(a) for a in args):
+            return exact(args)
+        return _decimal(fn(np.array([_floats(a) for a in args], dtype=np.float64)))
+    return apply
+
+
+def _log(x, base=None):
+    if _is_array(x):
+        return np.log(x) if base is None else np.log(x) / math.log(float(base))
+    if x <= 0:
+        raise MathError("log of a non-positive number")
+    return x.ln() if base is None else x.ln() / _decimal(base).ln()
+
+
+def _round(x, digits=0):
+    if _is_array(x):
+        return np.round(x, int(digits))
+    return x.quantize(Decimal(1).scaleb(-int(digits)), rounding=decimal.ROUND_HALF_UP)
+
+
+def _factorial(x):
+    if x != x.to_integral_value() or x < 0 or x > MAX_FACTORIAL:
+        raise MathError(f"factorial needs a whole number from 0 to {MAX_FACTORIAL}")
+    return Decimal(math.factorial(int(x)))
+
+
+# Functions of dimensionless numbers (sqrt/abs/min/max/sum/round also take quantities, see _call)
+FUNCTIONS = {
+    "sqrt": _scalar_function(lambda x: x.sqrt(), np.sqrt),
+    "abs": _scalar_function(abs, np.abs),
+    "exp": _scalar_function(lambda x: x.exp(), np.exp),
+    "ln": _log,
+    "log": _log,
+    "log10": _scalar_function(lambda x: x.log10(), np.log10),
+    "log2": lambda x: _log(x, 2),
+    "sin": _scalar_function(_via_float(math.sin), np.sin),
+    "cos": _scalar_function(_via_float(math.cos), np.cos),
+    "tan": _scalar_function(_via_float(math.tan), np.tan),
+    "asin": _scalar_function(_via_float(math.asin), np.arcsin),
+    "acos": _scalar_function(_via_float(math.acos), np.arccos),
+    "atan": _scalar_function(_via_float(math.atan), np.arctan),
+    "radians": _scalar_function(lambda x: x * PI / 180, np.radians),
+    "degrees": _scalar_function(lambda x: x * 180 / PI, np.degrees),
+    "floor": _scalar_function(lambda x: x.to_integral_value(rounding=decimal.ROUND_FLOOR), np.floor),
+    "ceil": _scalar_function(lambda x: x.to_integral_value(rounding=decimal.ROUND_CEILING), np.ceil),
+    "round": _round,
+    "factorial": _factorial,
+    "sum": _reduce(np.sum, exact=lambda args: sum(args, Decimal(0))),
+    "min": _reduce(np.min, exact=min),
+    "max": _reduce(np.max, exact=max),
+    "mean": _reduce(np.mean, exact=lambda args: sum(args, Decimal(0)) / len(args)),
+    "avg": _reduce(np.mean, exact=lambda args: sum(args, Decimal(0)) / len(args)),
+    "median": _reduce(np.median),
+    "std": _reduce(np.std),
+    "len": lambda x: Decimal(len(x)) if _is_array(x) else Decimal(1),
+}
+# Unit-preserving: the result has the dimensions of the (common) argument
+_UNIT_PRESERVING = {"abs", "sum", "min", "max", "mean", "avg", "median", "std", "round", "floor", "ceil"}
+
+CONSTANTS = {"pi": PI, "e": E, "tau": 2 * PI}
+
+_BINARY_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+}
+
+
+class _Evaluator:
+    """Walks a parsed expression; every node type not handled here is rejected."""
+
+    def visit(self, node):
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None:
+            raise MathError(f"unsupported syntax: {type(node).__name__}")
+        return method(node)
+
+    def visit_Expression(self, node):
+        return self.visit(node.body)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise MathError(f"not a number: {node.value!r}")
+        return _decimal(node.value) if isinstance(node.value, int) else Decimal(repr(node.value))
+
+    def visit_Name(self, node):
+        if node.id in CONSTANTS:
+            return CONSTANTS[node.id]
+        if node.id in UNITS:
+            factor, dims = UNITS[node.id]
+            return Quantity(factor, dims, node.id, factor)
+        raise MathError(f"unknown name: {node.id}")
+
+    def visit_List(self, node):
+        if len(node.elts) > MAX_LIST:
+            raise MathError(f"lists are limited to {MAX_LIST} items")
+        items = [self.visit(element) for element in node.elts]
+        if any(isinstance(item, Quantity) for item in items):
+            first = next(item for item in items if isinstance(item, Quantity))
+            for item in items:
+                if not isinstance(item, Quantity):
+                    raise MathError("mix of numbers and quantities in a list")
+                _same_dims(first, item, "list")
+            return Quantity(np.array([float(item.value) for item in items]), first.dims, first.unit, first.factor)
+        if any(_is_array(item) for item in items):
+            raise MathError("nested lists aren't supported")
+        return np.array([float(item) for item in items], dtype=np.float64)
+
+    visit_Tuple = visit_List
+
+    def visit_UnaryOp(self, node):
+        value = self.visit(node.operand)
+        if isinstance(node.op, ast.UAdd):
+            return value
+        if isinstance(node.op, ast.USub):
+            if isinstance(value, Quantity):
+                return Quantity(-value.value, value.dims, value.unit, value.factor)
+            return -value
+        raise MathError(f"unsupported operator: {type(node.op).__name__}")
+
+    def visit_BinOp(self, node):
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Pow):
+            return self._pow(left, right)
+        op = _BINARY_OPS.get(type(node.op))
+        if op is None:
+            raise MathError(f"unsupported operator: {type(node.op).__name__}")
+        if not isinstance(left, Quantity) and not isinstance(right, Quantity):
+            return _binary(op, left, right)
+        return self._quantity_op(type(node.op), op, left, right)
+
+    def _quantity_op(self, kind, op, left, right):
+        if kind in (ast.Add, ast.Sub, ast.Mod, ast.FloorDiv):
+            left, right = _as_quantity(left), _as_quantity(right)
+            _same_dims(left, right, "add" if kind is ast.Add else "combine")
+            unit = left.unit or right.unit
+            factor = left.factor if left.unit else right.factor
+            return _normalize(Quantity(_binary(op, left.value, right.value), left.dims, unit, factor))
+        left, right = _as_quantity(left), _as_quantity(right)
+        sign = 1 if kind is ast.Mult else -1
+        dims = tuple(a + sign * b for a, b in zip(left.dims, right.dims))
+        if left.unit and right.unit:
+            unit = f"{left.unit}{'*' if sign == 1 else '/'}{right.unit}"
+            factor = left.factor * right.factor if sign == 1 else left.factor / right.factor
+        elif left.unit:
+            unit, factor = left.unit, left.factor
+        elif right.unit:
+            unit = right.unit if sign == 1 else f"1/{right.unit}"
+            factor = right.factor if sign == 1 else 1 / right.factor
+        else:
+            unit, factor = None, Decimal(1)
+        return _normalize(Quantity(_binary(op, left.value, right.value), dims, unit, factor))
+
+    def _pow(self, base, exponent):
+        if isinstance(exponent, Quantity):
+            if exponent.dims != DIMENSIONLESS:
+                raise MathError("exponent must be a plain number")
+            exponent = exponent.value
+        if not isinstance(base, Quantity):
+            return _power(base, exponent)
+        if _is_array(exponent):
+            raise MathError("a quantity can't be raised to a list")
+        dims = tuple(d * exponent for d in base.dims)
+        if any(d != int(d) for d in dims):
+            raise MathError(f"{base.unit or _unit_name(base.dims)} ** {exponent} has fractional units")
+        unit = f"{base.unit}**{exponent.normalize()}" if base.unit else None
+        factor = base.factor ** exponent if base.unit else Decimal(1)
+        return _normalize(Quantity(_power(base.value, exponent), tuple(int(d) for d in dims), unit, factor))
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            name = node.func.id if isinstance(node.func, ast.Name) else type(node.func).__name__
+            raise MathError(f"unknown function: {name}")
+        if node.keywords:
+            raise MathError("keyword arguments aren't supported")
+        name = node.func.id
+        args = [self.visit(arg) for arg in node.args]
+        if not args:
+            raise MathError(f"{name}() needs an argument")
+        quantities = [arg for arg in args if isinstance(arg, Quantity)]
+        if not quantities:
+            return FUNCTIONS[name](*args)
+        first = quantities[0]
+        if name == "sqrt":
+            return self._pow(first, Decimal("0.5"))
+        if name in _UNIT_PRESERVING and isinstance(args[0], Quantity):
+            for arg in quantities:
+                _same_dims(first, arg, name)
+            values = [arg.value if isinstance(arg, Quantity) else arg for arg in args]
+            if name == "round":  # round in the display unit, not in SI
+                shown = _binary(lambda a, b: a / b, first.value, first.factor)
+                value = _binary(lambda a, b: a * b, FUNCTIONS[name](shown, *values[1:]), first.factor)
+            else:
+                value = FUNCTIONS[name](*values)
+            return _normalize(Quantity(value, first.dims, first.unit, first.factor))
+        raise MathError(f"{name}() needs a plain number, got {first.unit or _unit_name(first.dims)}")
+
+
+def _as_quantity(x):
+    return x if isinstance(x, Quantity) else Quantity(x, DIMENSIONLESS)
+
+
+def _normalize(q):
+    """Units that cancelled out leave a plain number (5 km / 250 m -> 20)."""
+    return q.value if q.dims == DIMENSIONLESS else q
+
+
+# ---- parsing ----
+_NUMBER = r"(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?"
+_PERCENT_OF = re.compile(rf"({_NUMBER})\s*%\s*of\b", re.IGNORECASE)
+_PERCENT = re.compile(rf"({_NUMBER})\s*%(?!\s*[\d(.])")
+_END = r"(?![\d.])(?![eE][+-]?\d)"  # the whole number, not a prefix of it
+_NUMBER_UNIT = re.compile(rf"(?<![\w.])({_NUMBER}){_END}\s*([A-Za-z_]\w*)\b(?!\s*\()")
+_IMPLICIT = re.compile(rf"(?<![\w.])({_NUMBER}){_END}\s*(?=[A-Za-z_(])|(?<=[)\]])\s*(?=[A-Za-z_\[(])")
+_CONVERSION = re.compile(r"^(.*\S)\s+(?:to|in|into|as)\s+([A-Za-z][\w*/^ .]*)$")
+
+
+def _prepare(text):
+    """Calculator notation -> Python expression: 15% of 240, 2^10, 5 km, 3(4 + 1), 1,000,000."""
+    text = text.strip().rstrip("=?").strip()
+    text = text.replace("×", "*").replace("÷", "/").replace("−", "-").replace("^", "**")
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)  # thousands separators
+    text = _PERCENT_OF.sub(r"(\1/100)*", text)
+    text = _PERCENT.sub(r"(\1/100)", text)
+    # "5 km" binds tighter than "/", so 5 km / 250 m is (5*km)/(250*m)
+    text = _NUMBER_UNIT.sub(r"(\1*\2)", text)
+    return _IMPLICIT.sub(lambda m: f"{m.group(1) or ''}*", text)
+
+
+def _parse(text):
+    try:
+        return ast.parse(_prepare(text), mode="eval")
+    except SyntaxError as e:
+        raise MathError(f"can't parse {text!r}") from e
+
+
+def evaluate(expression):
+    """Value of `expression`: a Decimal, a float64 array or a Quantity. Raises MathError."""
+    if len(expression) > MAX_LENGTH:
+        raise MathError(f"expression longer than {MAX_LENGTH} characters")
+    target = None
+    match = _CONVERSION.match(expression.strip())
+    if match:  # "60 mph to km/h"
+        expression, target = match.groups()
+    with decimal.localcontext() as context, np.errstate(all="ignore"):
+        context.prec = PRECISION
+        try:
+            value = _Evaluator().visit(_parse(expression))
+            if target is not None:
+                value = convert(value, _Evaluator().visit(_parse(target)), target)
+        except MathError:
+            raise
+        except (decimal.DivisionByZero, ZeroDivisionError):
+            raise MathError("division by zero") from None
+        except (decimal.Overflow, OverflowError):
+            raise MathError("result too large") from None
+        except (decimal.DecimalException, ArithmeticError, ValueError, TypeError):
+            raise MathError(f"invalid operation in {expression!r}") from None
+    array = value.value if isinstance(value, Quantity) else value
+    if _is_array(array) and not np.all(np.isfinite(array)):
+        raise MathError("result isn't a finite number")
+    return value
+
+
+def convert(value, unit, name):
+    """Express `value` in `unit` (a Quantity parsed from the unit text `name`)."""
+    if not isinstance(unit, Quantity):
+        raise MathError(f"unknown unit: {name}")
+    value = _as_quantity(value)
+    _same_dims(value, unit, "convert")
+    return Quantity(value.value, value.dims, name.replace(" ", "").replace("^", "**"), unit.value)
+
+
+def _format_number(x):
+    if not isinstance(x, Decimal):
+        return format(float(x), ".15g")
+    with decimal.localcontext() as context:
+        context.prec = PRECISION
+        if x == x.to_integral_value() and abs(x) < Decimal(10) ** PRECISION:
+            return str(x.quantize(Decimal(1)))
+        x = x.normalize()
+        exponent = x.adjusted()
+        if -7 <= exponent < 21:
+            text = format(x, "f")
+            # Show 15 significant digits; the full precision is still used in the maths
+            return format(round(x, max(0, 14 - exponent)).normalize(), "f") if len(text) > 24 else text
+        mantissa, _, power = format(x, ".14e").partition("e")
+        return f"{mantissa.rstrip('0').rstrip('.')}e{power}"
+
+
+def format_result(value, max_items=100):
+    """Human-readable result: 1.05, 5.3 km, [1.18, 2.36] kg."""
+    if isinstance(value, Quantity):
+        shown = value.value / _floats(value.factor) if _is_array(value.value) else value.value / value.factor
+        unit = value.unit or _unit_name(value.dims)
+        return f"{format_result(shown, max_items)} {unit}"
+    if _is_array(value):
+        items = [_format_number(v) for v in value[:max_items]]
+        more = f", ... ({len(value)} items)" if len(value) > max_items else ""
+        return f"[{', '.join(items)}{more}]"
+    return _format_number(value)
+
+
+class CalculatorInput(BaseModel):
+    expression: str = Field(
+        ...,
+        description="A math expression, not a question in words. Examples: '12 * (3 + 4)', '2^64', "
+                    "'15% of 240', 'sqrt(2) * 10', '60 mph to km/h', '5 km + 300 m', 'mean([3, 5, 10])'",
+    )
+
+
+def calculator_tool(fallback=None):
+    """
+    The `Calculator` tool; expressions it can't evaluate go to `fallback` (e.g. the
+    llm-math tool). `fallback` may be a `Lazy`, so that tool is only loaded if needed.
+    """
+    def fallback_tool():
+        return fallback.get() if isinstance(fallback, Lazy) else fallback
+
+    def run(expression):
+        try:
+            return format_result(evaluate(expression))
+        except MathError as e:
+            if fallback is None:
+                return f"Error: {e}"
+            return str(fallback_tool().invoke(expression))
+
+    async def arun(expression):
+        try:
+            return format_result(evaluate(expression))
+        except MathError as e:
+            if fallback is None:
+                return f"Error: {e}"
+            return str(await fallback_tool().ainvoke(expression))
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name="Calculator",
+        description="Evaluates a math expression exactly (big numbers, percentages, units, lists). "
+                    "Pass the expression itself, e.g. '12 * 7' or '60 mph to km/h'.",
+        args_schema=CalculatorInput,
+    )
+
+
+def llm_math_fallback(llm):
+    """The llm-math tool as a `Lazy` fallback: it (and langchain_community's tool loader) is only imported when needed."""
+    def load_llm_math():
+        from langchain_community.agent_toolkits.load_tools import load_tools
+
+        return load_tools(["llm-math"], llm=llm)[0]
+
+    return Lazy(load_llm_math, name="llm-math")
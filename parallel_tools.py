@@ -0,0 +1,115 @@
+"""
+AgentExecutor that runs the tool calls of one model turn concurrently.
+
+When the agent plans several actions in one step (e.g. OPENAI_MULTI_FUNCTIONS
+asking for `currency_converter` and `weather_checker` together), the stock
+executor runs them one after another. This one dispatches them on a thread
+pool as soon as the first is due and hands the observations back in the
+order the model asked for them, so a turn costs as long as its slowest tool
+instead of the sum. Every action, a lone one included, gets a per-tool
+timeout. Each tool runs with an HTTP
+deadline equal to its timeout, so a hung upstream gives up instead of
+holding a pool thread.
+"""
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+from pydantic import PrivateAttr
+
+from http_client import deadline
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    max_workers: int = 8
+    tool_timeout: float = 30.0
+    tool_timeouts: Dict[str, float] = {}  # per-tool overrides of tool_timeout
+
+    _pending: List[AgentAction] = PrivateAttr(default_factory=list)
+    _results: Dict[int, AgentStep] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_executor(cls, executor, **kwargs):
+        """Wrap an executor built by `initialize_agent`, keeping every setting (agent, tools, memory, limits...)."""
+        fields = {name: getattr(executor, name) for name in AgentExecutor.model_fields}
+        return cls(**dict(fields, **kwargs))
+
+    def _timeout_for(self, tool_name):
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    def _timeout_step(self, agent_action):
+        timeout = self._timeout_for(agent_action.tool)
+        return AgentStep(
+            action=agent_action,
+            observation=f"Error: tool '{agent_action.tool}' timed out after {timeout:g}s",
+        )
+
+    # ---- sync ----
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base class yields every planned action before performing any of
+        # them, so by the first _perform_agent_action call we know the batch.
+        self._pending, self._results = [], {}
+        try:
+            for item in super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, AgentAction):
+                    self._pending.append(item)
+                yield item
+        finally:
+            self._pending, self._results = [], {}
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # A lone action goes through the pool too: that's what applies its timeout
+        if self._pending and not self._results:
+            actions, self._pending = self._pending, []
+            self._results = self._perform_in_parallel(name_to_tool_map, color_mapping, actions, run_manager)
+        step = self._results.pop(id(agent_action), None)
+        if step is not None:
+            return step
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    def _perform_with_deadline(self, name_to_tool_map, color_mapping, action, run_manager):
+        with deadline(self._timeout_for(action.tool)):
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, action, run_manager)
+
+    def _perform_in_parallel(self, name_to_tool_map, color_mapping, actions, run_manager):
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(actions)))
+        started = time.monotonic()
+        # Each worker runs in a copy of this context so the turn's deadline carries over
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run, self._perform_with_deadline,
+                name_to_tool_map, color_mapping, action, run_manager,
+            )
+            for action in actions
+        ]
+        results = {}
+        try:
+            for action, future in zip(actions, futures):
+                remaining = started + self._timeout_for(action.tool) - time.monotonic()
+                try:
+                    results[id(action)] = future.result(timeout=max(remaining, 0))
+                except FutureTimeout:
+                    future.cancel()
+                    results[id(action)] = self._timeout_step(action)
+        finally:
+            # Don't let a hung tool hold up the turn
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    # ---- async (the base class already gathers multiple actions) ----
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        timeout = self._timeout_for(agent_action.tool)
+        try:
+            with deadline(timeout):
+                return await asyncio.wait_for(
+                    super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                    timeout=timeout,
+                )
+        except asyncio.TimeoutError:
+            return self._timeout_step(agent_action)
@@ -0,0 +1,226 @@
+"""
+Prompt templates compiled once and laid out for provider-side prompt caching.
+
+`compile_prompt()` turns a `PromptTemplate` into one whose f-string is split
+into literal/field pieces up front, so formatting is a join instead of a
+parse, and a `ChatPromptTemplate` into one whose static messages (no input
+variables) are built once and then sent as the same message objects on every
+call. `MessagesPlaceholder`s pass through. `load_compiled()` does this for a
+prompt file, cached by the file's mtime, so a Streamlit rerun doesn't
+re-parse it.
+
+Azure OpenAI caches the longest prompt prefix it has seen recently (from
+1024 tokens, in 128-token steps) and bills those tokens at a discount with
+less latency. The prefix is the tool schemas followed by the messages, so it
+only hits if the system message and tools are byte-identical and come before
+anything that changes per turn:
+
+- `compile_agent()` compiles an agent's prompt and computes its function
+  schemas once instead of on every step.
+- `hoist_static()` moves the static instruction lines of a string template
+  into a system message ahead of the per-request lines, when those lines
+  alone reach the 1024-token minimum. Below it the reordered prompt couldn't
+  be cached anyway, so the template keeps its own order.
+
+`PrefixCacheReport` is a callback that reads `cached_tokens` from each
+response and reports what share of the prompt came from the cached prefix.
+"""
+import os
+import string
+import threading
+from collections import deque
+
+from langchain.agents.openai_functions_agent.base import OpenAIFunctionsAgent
+from langchain.agents.openai_functions_multi_agent.base import OpenAIMultiFunctionsAgent
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, PromptTemplate, load_prompt
+from pydantic import PrivateAttr
+
+from bounded_memory import count_tokens
+
+_formatter = string.Formatter()
+
+# Shortest prefix the provider caches; a shorter static prefix gets no discount
+CACHE_MIN_TOKENS = 1024
+
+
+class CompiledPromptTemplate(PromptTemplate):
+    """A PromptTemplate (f-string) that formats by joining pre-split pieces."""
+
+    _pieces: list = PrivateAttr(default=None)
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        pieces = []
+        for literal, field, spec, conversion in _formatter.parse(self.template):
+            if literal:
+                pieces.append((literal, None))
+            if field is None:
+                continue
+            if spec or conversion or not field.isidentifier():
+                pieces = None  # "{x.y}", "{x:>8}", "{x!r}": leave it to str.format
+                break
+            pieces.append((None, field))
+        self._pieces = pieces
+
+    def format(self, **kwargs):
+        kwargs = self._merge_partial_and_user_variables(**kwargs)
+        if self._pieces is None:
+            return self.template.format(**kwargs)
+        return "".join(literal if field is None else str(kwargs[field]) for literal, field in self._pieces)
+
+
+def compile_prompt(prompt):
+    """Compiled copy of `prompt`; prompts it doesn't know how to compile are returned as they are."""
+    if isinstance(prompt, CompiledPromptTemplate):
+        return prompt
+    if type(prompt) is PromptTemplate and prompt.template_format == "f-string":
+        return CompiledPromptTemplate(**{name: getattr(prompt, name) for name in PromptTemplate.model_fields})
+    if type(prompt) is ChatPromptTemplate:
+        return ChatPromptTemplate(
+            messages=[_compile_message(message) for message in prompt.messages],
+            input_variables=prompt.input_variables,
+            partial_variables=prompt.partial_variables,
+            input_types=prompt.input_types,
+        )
+    return prompt
+
+
+def _compile_message(message):
+    if not isinstance(getattr(message, "prompt", None), PromptTemplate):
+        return message  # a message, a MessagesPlaceholder, an image template
+    if not message.input_variables:
+        # Static: build the message once, so every call sends the same bytes
+        return message.format()
+    return message.__class__(prompt=compile_prompt(message.prompt), additional_kwargs=message.additional_kwargs)
+
+
+def hoist_static(prompt, min_prefix_tokens=CACHE_MIN_TOKENS):
+    """
+    A string PromptTemplate as a chat prompt: its lines without variables become
+    the system message, the lines with variables the human message.
+
+    In "Summarize {paper} ...\\n<20 lines of fixed rules>" the cacheable prefix
+    ends at the first variable; afterwards the rules are a fixed prefix. That
+    changes how the model reads the prompt, so it's only done when the rules
+    are at least `min_prefix_tokens` long; otherwise the prompt is compiled as
+    it is.
+    """
+    static, dynamic = [], []
+    for line in prompt.template.splitlines(keepends=True):
+        has_field = any(field is not None for _, field, _, _ in _formatter.parse(line))
+        (dynamic if has_field else static).append(line)
+    static_text = "".join(static).strip()
+    if not static_text or not dynamic or count_tokens(None, static_text) < min_prefix_tokens:
+        return compile_prompt(prompt)
+    human = CompiledPromptTemplate(
+        template="".join(dynamic).strip(),
+        input_variables=prompt.input_variables,
+        partial_variables=prompt.partial_variables,
+    )
+    return ChatPromptTemplate(
+        messages=[SystemMessage(content=static_text.format()), HumanMessagePromptTemplate(prompt=human)],
+        input_variables=prompt.input_variables,
+        partial_variables=prompt.partial_variables,
+    )
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_compiled(path, stable_prefix=False):
+    """
+    `load_prompt(path)`, compiled, and only re-read when the file changes (mtime
+    or size). `stable_prefix=True` opts in to `hoist_static()` for a string
+    template, which still leaves it alone below the cacheable size.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (path, stable_prefix)
+    with _loaded_lock:
+        cached = _loaded.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    prompt = load_prompt(path)
+    prompt = hoist_static(prompt) if stable_prefix and isinstance(prompt, PromptTemplate) else compile_prompt(prompt)
+    with _loaded_lock:
+        _loaded[key] = (version, prompt)
+    return prompt
+
+
+# ---- agents ----
+class _CachedFunctionsMixin:
+    @property
+    def functions(self):
+        # The tools don't change, so neither do their schemas: build them once
+        if self._functions is None:
+            self._functions = super().functions
+        return self._functions
+
+
+class CompiledOpenAIFunctionsAgent(_CachedFunctionsMixin, OpenAIFunctionsAgent):
+    _functions: list = PrivateAttr(default=None)
+
+
+class CompiledOpenAIMultiFunctionsAgent(_CachedFunctionsMixin, OpenAIMultiFunctionsAgent):
+    _functions: list = PrivateAttr(default=None)
+
+
+_COMPILED_AGENTS = {
+    OpenAIFunctionsAgent: CompiledOpenAIFunctionsAgent,
+    OpenAIMultiFunctionsAgent: CompiledOpenAIMultiFunctionsAgent,
+}
+
+
+def compile_agent(executor):
+    """Compile the prompt of an agent built by `initialize_agent` (and cache its function schemas). Returns it."""
+    agent = executor.agent
+    compiled = _COMPILED_AGENTS.get(type(agent))
+    if compiled is not None:
+        fields = {name: getattr(agent, name) for name in type(agent).model_fields}
+        executor.agent = compiled(**dict(fields, prompt=compile_prompt(agent.prompt)))
+    elif hasattr(agent, "llm_chain"):
+        agent.llm_chain.prompt = compile_prompt(agent.llm_chain.prompt)
+    return executor
+
+
+# ---- report ----
+class PrefixCacheReport(BaseCallbackHandler):
+    """Per-request prompt tokens vs. tokens served from the provider's prompt cache."""
+
+    def __init__(self, max_requests=1000):
+        self._lock = threading.Lock()
+        self.requests = deque(maxlen=max_requests)  # (prompt_tokens, cached_tokens)
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        if not prompt_tokens:
+            return  # e.g. a streamed response without usage
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        with self._lock:
+            self.requests.append((prompt_tokens, cached))
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached
+
+    @property
+    def share(self):
+        """Share of all prompt tokens so far that came from the cached prefix."""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def summary(self):
+        with self._lock:
+            shares = [cached / prompt for prompt, cached in self.requests]
+            return {
+                "requests": len(shares),
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_share": self.share,
+                "requests_with_hits": sum(1 for share in shares if share > 0),
+                "last_request_share": shares[-1] if shares else 0.0,
+            }
@@ -0,0 +1,279 @@
+"""
+Shared exchange-rate provider for the currency tools.
+
+Fetches through the shared HTTP client (pooled, retried, deadline-aware),
+caches per-base rate tables for a short TTL (LRU-bounded), makes sure
+concurrent misses for the same base only trigger a single fetch, and derives
+cross rates from any cached table so e.g. EUR -> INR can be answered from a
+cached USD table without another request.
+
+`convert_many` converts whole lists of (amount, from, to) at once: each base
+table is fetched at most once and the arithmetic is one NumPy pass.
+
+With a `RateSnapshot` (see rate_snapshot.py, enabled by RATE_SNAPSHOT_PATH)
+rates come from the shared memory-mapped matrix while it's fresh, and from
+the live API otherwise; if the API is down an older snapshot still answers.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from http_client import UpstreamUnavailable, default_client
+from rate_snapshot import RateSnapshot
+
+CURRENCY_API_URL = os.getenv(
+    "CURRENCY_API_URL",
+    "https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies",
+)
+
+
+class RateUnavailable(Exception):
+    """Raised when a rate table can't be fetched."""
+
+
+class UnsupportedCurrency(RateUnavailable):
+    """Raised when the rate table doesn't quote the requested currency."""
+
+
+class _InFlight:
+    """A fetch that other threads can wait on instead of starting their own."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.table = None
+        self.error = None
+
+
+class RateProvider:
+    def __init__(self, base_url=CURRENCY_API_URL, ttl=600, max_tables=32, client=default_client,
+                 snapshot=None):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.max_tables = max_tables
+        self.client = client
+        self.snapshot = snapshot
+
+        self._tables = OrderedDict()  # base -> (fetched_at, {code: rate})
+        self._inflight = {}           # base -> _InFlight
+        self._lock = threading.Lock()
+
+    # ---- cache ----
+    def _cached(self, base):
+        """Return a fresh cached table for `base` (and mark it recently used)."""
+        entry = self._tables.get(base)
+        if entry is None:
+            return None
+        fetched_at, table = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            del self._tables[base]
+            return None
+        self._tables.move_to_end(base)
+        return table
+
+    def _store(self, base, table):
+        self._tables[base] = (time.monotonic(), table)
+        self._tables.move_to_end(base)
+        while len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+
+    def _fetch(self, base):
+        try:
+            response = self.client.get(f"{self.base_url}/{base}.json")
+        except UpstreamUnavailable as e:
+            raise RateUnavailable(str(e)) from e
+        if response.status_code != 200:
+            raise RateUnavailable(f"Rate API returned {response.status_code} for {base.upper()}")
+        table = response.json().get(base)
+        if not table:
+            raise RateUnavailable(f"No rate table for {base.upper()}")
+        return table
+
+    # ---- public API ----
+    def get_table(self, base):
+        """Rate table for `base`: from cache, or fetched once even under concurrent misses."""
+        base = base.lower()
+        with self._lock:
+            table = self._cached(base)
+            if table is not None:
+                return table
+            flight = self._inflight.get(base)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[base] = _InFlight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.table
+
+        try:
+            flight.table = self._fetch(base)
+        except Exception as e:
+            flight.error = e if isinstance(e, RateUnavailable) else RateUnavailable(str(e))
+        finally:
+            with self._lock:
+                if flight.table is not None:
+                    self._store(base, flight.table)
+                del self._inflight[base]
+            flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.table
+
+    def fetch_table(self, base):
+        """Fetch `base` from the API now, bypassing (and then refreshing) the cache."""
+        base = base.lower()
+        table = self._fetch(base)
+        with self._lock:
+            self._store(base, table)
+        return table
+
+    def _cross_rate(self, from_currency, to_currency):
+        """Derive a rate from any cached table that quotes both currencies."""
+        with self._lock:
+            for base in reversed(list(self._tables)):
+                table = self._cached(base)
+                if table is None:
+                    continue
+                if base == to_currency and from_currency in table and table[from_currency]:
+                    return 1 / table[from_currency]
+                if from_currency in table and to_currency in table and table[from_currency]:
+                    return table[to_currency] / table[from_currency]
+        return None
+
+    def get_rate(self, from_currency, to_currency):
+        from_currency, to_currency = from_currency.lower(), to_currency.lower()
+        if from_currency == to_currency:
+            return 1.0
+
+        if self.snapshot is not None and self.snapshot.is_fresh():
+            rate = self.snapshot.rate(from_currency, to_currency)
+            if rate is not None:
+                return rate
+        try:
+            return self._live_rate(from_currency, to_currency)
+        except UnsupportedCurrency:
+            raise
+        except RateUnavailable:
+            # API down: an older snapshot is better than no answer
+            if self.snapshot is not None and self.snapshot.is_usable():
+                rate = self.snapshot.rate(from_currency, to_currency)
+                if rate is not None:
+                    return rate
+            raise
+
+    def _live_rate(self, from_currency, to_currency):
+        with self._lock:
+            table = self._cached(from_currency)
+        if table is None:
+            rate = self._cross_rate(from_currency, to_currency)
+            if rate is not None:
+                return rate
+            table = self.get_table(from_currency)
+
+        rate = table.get(to_currency)
+        if rate is None:
+            raise UnsupportedCurrency(f"Conversion rate for {to_currency.upper()} not available.")
+        return rate
+
+    def convert(self, amount, from_currency, to_currency):
+        return amount * self.get_rate(from_currency, to_currency)
+
+    # ---- batch API ----
+    def rate_matrix(self, codes=None):
+        """
+        Cross rates between `codes` (default: every code quoted) from the most
+        recently used cached table: `matrix[i, j]` converts codes[i] into codes[j].
+        Unknown codes get NaN rows/columns; nothing cached means all NaN.
+        """
+        with self._lock:
+            anchor = None
+            for base in reversed(list(self._tables)):
+                anchor = self._cached(base)
+                if anchor is not None:
+                    anchor = dict(anchor, **{base: 1.0})
+                    break
+        anchor = anchor or {}
+        codes = sorted(anchor) if codes is None else [c.lower() for c in codes]
+        per_anchor = np.array([anchor.get(c) or np.nan for c in codes], dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return codes, per_anchor[np.newaxis, :] / per_anchor[:, np.newaxis]
+
+    def convert_many(self, amounts, from_currencies, to_currencies):
+        """
+        Vectorised `convert` over parallel sequences.
+
+        Returns (converted, errors): a float64 array with NaN where no rate
+        was available, and {base: message} for base tables that couldn't be
+        fetched.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        bases, base_idx = np.unique([c.lower() for c in from_currencies], return_inverse=True)
+        targets, target_idx = np.unique([c.lower() for c in to_currencies], return_inverse=True)
+
+        # Fresh snapshot first, then cross rates of whatever is cached, then
+        # fetch only the bases whose rows still have gaps, once each
+        fresh = self.snapshot is not None and self.snapshot.is_fresh()
+        rates = self.snapshot.lookup(bases, targets) if fresh else np.full((len(bases), len(targets)), np.nan)
+        missing = np.isnan(rates)
+        if missing.any():
+            _, matrix = self.rate_matrix(list(bases) + list(targets))
+            rates[missing] = matrix[:len(bases), len(bases):][missing]
+        rates[bases[:, np.newaxis] == targets[np.newaxis, :]] = 1.0
+
+        errors = {}
+        for i, base in enumerate(bases):
+            missing = np.isnan(rates[i])
+            if not missing.any():
+                continue
+            try:
+                table = self.get_table(base)
+            except RateUnavailable as e:
+                if self.snapshot is not None and self.snapshot.is_usable():
+                    rates[i, missing] = self.snapshot.lookup([base], targets[missing])[0]
+                if np.isnan(rates[i]).any():
+                    errors[base] = str(e)
+                continue
+            rates[i, missing] = [table.get(t) or np.nan for t in targets[missing]]
+
+        return amounts * rates[base_idx, target_idx], errors
+
+
+def format_conversions(amounts, from_currencies, to_currencies, converted, errors, max_lines=100):
+    """Tool output for a batch: one line per conversion (capped) plus totals per target currency."""
+    lines, totals = [], {}
+    for amount, source, target, value in zip(amounts, from_currencies, to_currencies, converted):
+        source, target = source.upper(), target.upper()
+        if np.isnan(value):
+            reason = errors.get(source.lower(), f"rate {source} -> {target} not available")
+            line = f"{amount} {source} -> {target}: {reason}"
+        else:
+            line = f"{amount} {source} = {value:.2f} {target}"
+            totals[target] = totals.get(target, 0.0) + value
+        if len(lines) < max_lines:
+            lines.append(line)
+    if len(converted) > max_lines:
+        lines.append(f"... {len(converted) - max_lines} more conversions not shown")
+    if len(converted) > 1:
+        lines.append("Totals: " + ", ".join(f"{total:.2f} {code}" for code, total in totals.items()))
+    return "\n".join(lines)
+
+
+def _snapshot_from_env():
+    path = os.getenv("RATE_SNAPSHOT_PATH")
+    if not path:
+        return None
+    return RateSnapshot(
+        path,
+        fresh_for=float(os.getenv("RATE_SNAPSHOT_FRESH_FOR", "3600")),
+        max_age=float(os.getenv("RATE_SNAPSHOT_MAX_AGE", str(7 * 86400))),
+    )
+
+
+# One provider shared by every tool in the process
+default_provider = RateProvider(snapshot=_snapshot_from_env())
@@ -0,0 +1,245 @@
+"""
+On-disk snapshot of exchange rates shared by every bot process.
+
+One fetch of a full rate table (every currency quoted against one base) is
+enough to derive the whole cross-rate matrix, which is written as
+
+    header  <8s magic, H version, H reserved, I n, d timestamp>   24 bytes
+    codes   n x 16-byte NUL-padded ASCII currency codes
+    matrix  n x n float64, matrix[i, j] converts codes[i] into codes[j]
+
+and replaced atomically. Readers memory-map the file, so any number of
+processes share one copy in the page cache, opening it costs nothing beyond
+reading the code list, and a conversion is a single array lookup.
+
+Refresh it from cron or a sidecar:
+
+    python rate_snapshot.py --path .cache/rates.snapshot --interval 3600
+
+and point the bots at it with RATE_SNAPSHOT_PATH. How old a snapshot may be
+before the live API is preferred (`fresh_for`) and before it isn't used even
+as a fallback (`max_age`) is configurable.
+"""
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"RATESNP1"
+VERSION = 1
+HEADER = struct.Struct("<8sHHId")
+CODE_SIZE = 16
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing pieces or isn't a snapshot."""
+
+
+# Everything one mapping provides, swapped in as a whole so readers never pair
+# one file's code index with another file's matrix
+_Table = namedtuple("_Table", "timestamp codes index matrix")
+_EMPTY = _Table(None, [], {}, None)
+
+
+def matrix_from_table(base, table):
+    """(codes, cross-rate matrix) from one table of `base -> code` rates."""
+    table = dict(table, **{base.lower(): 1.0})
+    codes = sorted(code for code, rate in table.items() if rate and len(code.encode()) <= CODE_SIZE)
+    per_base = np.array([table[code] for code in codes], dtype=np.float64)
+    return codes, per_base[np.newaxis, :] / per_base[:, np.newaxis]
+
+
+def write_snapshot(path, codes, matrix, timestamp=None):
+    """Write atomically: readers see either the old file or the new one, never a mix."""
+    n = len(codes)
+    matrix = np.ascontiguousarray(matrix, dtype="<f8")
+    if matrix.shape != (n, n):
+        raise ValueError(f"matrix must be {n}x{n}, got {matrix.shape}")
+    header = HEADER.pack(MAGIC, VERSION, 0, n, time.time() if timestamp is None else timestamp)
+    code_block = b"".join(code.lower().encode().ljust(CODE_SIZE, b"\0") for code in codes)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".rates-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(code_block)
+            f.write(matrix.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class RateSnapshot:
+    def __init__(self, path, fresh_for=3600, max_age=7 * 86400, check_every=5):
+        """
+        path: snapshot file (may not exist yet; it's picked up once written)
+        fresh_for: seconds during which the snapshot is used instead of the live API
+        max_age: seconds after which it isn't used even when the live API is down
+        check_every: how often (seconds) to stat the file for a newer version
+        """
+        self.path = path
+        self.fresh_for = fresh_for
+        self.max_age = max_age
+        self.check_every = check_every
+        self._table = _EMPTY
+        self._identity = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---- loading ----
+    def _map(self):
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size:
+                raise SnapshotError(f"{self.path} is truncated")
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, n, timestamp = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"{self.path} is not a version {VERSION} rate snapshot")
+        matrix_offset = HEADER.size + n * CODE_SIZE
+        if len(buffer) < matrix_offset + n * n * 8:
+            raise SnapshotError(f"{self.path} is truncated")
+        codes = [
+            bytes(buffer[HEADER.size + i * CODE_SIZE:HEADER.size + (i + 1) * CODE_SIZE]).rstrip(b"\0").decode()
+            for i in range(n)
+        ]
+        # A view straight onto the mapped pages: no copy, no parsing
+        matrix = np.frombuffer(buffer, dtype="<f8", count=n * n, offset=matrix_offset).reshape(n, n)
+        return (stat.st_ino, stat.st_mtime_ns), timestamp, codes, matrix
+
+    def refresh(self, force=False):
+        """Re-map the file if it was replaced since the last check (at most every `check_every`s)."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_every:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if (stat.st_ino, stat.st_mtime_ns) == self._identity:
+                return
+            try:
+                identity, timestamp, codes, matrix = self._map()
+            except (OSError, ValueError, SnapshotError):
+                return  # keep serving the previous mapping
+            # Swap in one go; the old mapping is released once nobody references it
+            self._table = _Table(timestamp, codes, {code: i for i, code in enumerate(codes)}, matrix)
+            self._identity = identity
+
+    @property
+    def timestamp(self):
+        return self._table.timestamp
+
+    @property
+    def codes(self):
+        return self._table.codes
+
+    @property
+    def matrix(self):
+        return self._table.matrix
+
+    # ---- staleness policy ----
+    @property
+    def age(self):
+        self.refresh()
+        return None if self.timestamp is None else time.time() - self.timestamp
+
+    def is_fresh(self):
+        age = self.age
+        return age is not None and age <= self.fresh_for
+
+    def is_usable(self):
+        age = self.age
+        return age is not None and age <= self.max_age
+
+    # ---- lookups ----
+    def rate(self, from_currency, to_currency):
+        """Rate from the snapshot, or None if either code isn't in it."""
+        table = self._table  # one read: the index and matrix of the same file
+        i = table.index.get(from_currency.lower())
+        j = table.index.get(to_currency.lower())
+        if i is None or j is None:
+            return None
+        return float(table.matrix[i, j])
+
+    def lookup(self, from_currencies, to_currencies):
+        """len(from) x len(to) rate matrix, NaN for codes the snapshot doesn't have."""
+        _, _, index, matrix = self._table
+        rows = np.array([index.get(c.lower(), -1) for c in from_currencies], dtype=np.intp)
+        cols = np.array([index.get(c.lower(), -1) for c in to_currencies], dtype=np.intp)
+        rates = np.full((len(rows), len(cols)), np.nan)
+        if matrix is None:
+            return rates
+        known_rows, known_cols = rows >= 0, cols >= 0
+        rates[np.ix_(known_rows, known_cols)] = matrix[np.ix_(rows[known_rows], cols[known_cols])]
+        return rates
+
+
+class SnapshotRefresher:
+    """Fetches a full table every `interval` seconds and rewrites the snapshot."""
+
+    def __init__(self, provider, path, base="usd", interval=3600):
+        self.provider = provider
+        self.path = path
+        self.base = base
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh_once(self):
+        table = self.provider.fetch_table(self.base)
+        codes, matrix = matrix_from_table(self.base, table)
+        write_snapshot(self.path, codes, matrix)
+        return len(codes)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                n = self.refresh_once()
+                print(f"Wrote {n}x{n} rate snapshot to {self.path}")
+            except Exception as e:
+                print(f"Rate snapshot refresh failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rate-snapshot", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    from rate_provider import RateProvider
+
+    parser = argparse.ArgumentParser(description="Keep a local exchange-rate snapshot up to date.")
+    parser.add_argument("--path", default=os.getenv("RATE_SNAPSHOT_PATH", ".cache/rates.snapshot"))
+    parser.add_argument("--base", default="usd")
+    parser.add_argument("--interval", type=float, default=3600, help="seconds between refreshes")
+    parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    args = parser.parse_args()
+
+    refresher = SnapshotRefresher(RateProvider(), args.path, args.base, args.interval)
+    if args.once:
+        n = refresher.refresh_once()
+        print(f"Wrote {n}x{n} rate snapshot to {args.path}")
+        return
+    refresher._run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Persistent cache for the research tools (Wikipedia, SerpAPI "Search").
+
+Users ask the same factual questions over and over, and every SerpAPI call
+is billed. `ResearchCache.wrap_tools(load_tools([...]))` returns the same
+tools, but each result is stored in a SQLite file (WAL mode, shared by every
+bot process) under a normalised query key, with a TTL per source: Wikipedia
+pages change slowly, search results go stale within hours. A result saying
+nothing was found (or that the tool failed) is kept only for `empty_ttl`, so
+a transient miss isn't pinned for the source's whole TTL.
+
+Stored results are also indexed with FTS5 so other components can search
+everything fetched so far (`search()`). Hit/miss counts, plus the fetch time
+and SerpAPI calls saved, are kept per process and summed across processes
+in the same file (`stats()`).
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from langchain_core.tools import Tool
+
+# Seconds a result stays valid, keyed by tool name
+SOURCE_TTLS = {
+    "wikipedia": 7 * 86400,
+    "Search": 6 * 3600,
+}
+BILLED_SOURCES = {"Search"}  # every miss is a paid SerpAPI query
+
+# What the tools return instead of raising when they found nothing or failed, e.g.
+# "No good Wikipedia Search Result was found", "No good search result found", "Error: ..."
+_EMPTY_RESULT = re.compile(r"^\s*(no good\b.*\bfound\b|no (search )?results?\b|(\w+ )?error\b)", re.IGNORECASE)
+
+
+def is_empty_result(result):
+    """Whether a tool's output says it found nothing (or failed) rather than giving an answer."""
+    return not result.strip() or bool(_EMPTY_RESULT.match(result))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS research_cache (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    fetch_ms REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS research_cache_stats (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (source, name)
+);
+"""
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS research_fts USING fts5(key UNINDEXED, source UNINDEXED, query, result);
+"""
+
+_ARTICLES = {"a", "an", "the"}
+
+
+# A word keeps the punctuation that changes what it names: "c++", "c#", ".net", "node.js", "3.11"
+_WORD = re.compile(r"\.?\w+(?:\.\w+)*[+#]*")
+
+
+def normalize_query(query):
+    """Case, unicode, punctuation, spacing and articles folded: "The Eiffel Tower?" -> "eiffel tower"."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    words = _WORD.findall(query)
+    content = [word for word in words if word not in _ARTICLES]
+    # A lone name keeps its article: "The Who" and "who" aren't the same question
+    return " ".join(content if len(content) > 1 else words)
+
+
+class ResearchCache:
+    def __init__(self, path=".cache/research_cache.sqlite", ttls=None, default_ttl=86400, empty_ttl=300):
+        """
+        ttls: {tool name: seconds}; tools not listed use default_ttl
+        empty_ttl: seconds a "nothing found" or error result is kept, whatever the source
+        """
+        self.path = path
+        self.ttls = dict(SOURCE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.empty_ttl = empty_ttl
+        self.stats_by_source = {}
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._unflushed = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5: caching still works, search() doesn't
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, or with a forked
+        # worker (bot_launcher.py --workers); one per thread per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def ttl_for(self, source):
+        return self.ttls.get(source, self.default_ttl)
+
+    def _count(self, source, **values):
+        with self._lock:
+            for stats in (self.stats_by_source, self._unflushed):
+                counters = stats.setdefault(source, {})
+                for name, value in values.items():
+                    counters[name] = counters.get(name, 0) + value
+
+    # ---- cache ----
+    def lookup(self, source, query):
+        """Cached result for `query` from `source`, or None if missing or expired."""
+        key = f"{source}\x00{normalize_query(query)}"
+        row = self._conn().execute(
+            "SELECT result, fetched_at, fetch_ms FROM research_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count(source, misses=1)
+            return None
+        result, fetched_at, fetch_ms = row
+        ttl = self.empty_ttl if is_empty_result(result) else self.ttl_for(source)
+        if time.time() - fetched_at > ttl:
+            self._count(source, misses=1)
+            return None
+        self._count(source, hits=1, saved_ms=fetch_ms, saved_calls=1 if source in BILLED_SOURCES else 0)
+        return result
+
+    def store(self, source, query, result, fetch_ms):
+        normalized = normalize_query(query)
+        key = f"{source}\x00{normalized}"
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO research_cache (key, source, query, result, fetched_at, fetch_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, source, query, result, time.time(), fetch_ms),
+            )
+            if self.fts:
+                conn.execute("DELETE FROM research_fts WHERE key = ?", (key,))
+            if self.fts and not is_empty_result(result):  # nothing worth finding in search()
+                conn.execute(
+                    "INSERT INTO research_fts (key, source, query, result) VALUES (?, ?, ?, ?)",
+                    (key, source, normalized, result),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.flush_stats()
+
+    def search(self, text, limit=5, source=None):
+        """Best-matching cached results for free text: [(source, query, result)], empty without FTS5."""
+        words = re.findall(r"\w+", normalize_query(text))
+        if not self.fts or not words:
+            return []
+        match = " OR ".join(f'"{word}"' for word in words)
+        sql = "SELECT source, query, result FROM research_fts WHERE research_fts MATCH ?"
+        params = [match]
+        if source is not None:
+            sql += " AND source = ?"
+            params.append(source)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self._conn().execute(sql, params).fetchall()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM research_cache")
+        if self.fts:
+            conn.execute("DELETE FROM research_fts")
+
+    # ---- tools ----
+    def wrap(self, tool):
+        """A Tool with the same name/description whose results go through the cache."""
+        source = tool.name
+
+        def run(query):
+            cached = self.lookup(source, query)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            result = str(tool.invoke(query))
+            self.store(source, query, result, (time.perf_counter() - start) * 1000)
+            return result
+
+        async def arun(query):
+            cached = self.lookup(source, query)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            result = str(await tool.ainvoke(query))
+            self.store(source, query, result, (time.perf_counter() - start) * 1000)
+            return result
+
+        return Tool(name=tool.name, description=tool.description, func=run, coroutine=arun)
+
+    def wrap_tools(self, tools):
+        """Wrap the tools that have a TTL configured, leave the rest as they are."""
+        return [self.wrap(tool) if tool.name in self.ttls else tool for tool in tools]
+
+    # ---- stats ----
+    def flush_stats(self):
+        """Add this process's counters to the shared totals."""
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {}
+        conn = self._conn()
+        for source, counters in pending.items():
+            for name, value in counters.items():
+                if value:
+                    conn.execute(
+                        "INSERT INTO research_cache_stats (source, name, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT(source, name) DO UPDATE SET value = value + excluded.value",
+                        (source, name, value),
+                    )
+
+    def stats(self):
+        """{source: {hits, misses, hit_rate, saved_ms, saved_calls, total_*}} for this process and all processes."""
+        self.flush_stats()
+        conn = self._conn()
+        totals = {}
+        for source, name, value in conn.execute("SELECT source, name, value FROM research_cache_stats"):
+            totals.setdefault(source, {})[name] = value
+        with self._lock:
+            local = {source: dict(counters) for source, counters in self.stats_by_source.items()}
+        report = {}
+        for source in set(totals) | set(local):
+            mine, shared = local.get(source, {}), totals.get(source, {})
+            lookups = mine.get("hits", 0) + mine.get("misses", 0)
+            report[source] = {
+                "hits": mine.get("hits", 0),
+                "misses": mine.get("misses", 0),
+                "hit_rate": mine.get("hits", 0) / lookups if lookups else 0.0,
+                "saved_ms": mine.get("saved_ms", 0.0),
+                "saved_calls": mine.get("saved_calls", 0),
+                **{f"total_{name}": value for name, value in shared.items()},
+            }
+        return report
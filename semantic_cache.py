@@ -0,0 +1,331 @@
+"""
+Semantic response cache for the chat models.
+
+Plugs into LangChain as a `BaseCache` (pass `cache=SemanticCache(...)` to
+AzureChatOpenAI). The last human message is normalised and embedded. Every
+earlier message, the model settings and any numbers in the question form an
+exact "context key", so a near-duplicate question only hits an entry that
+was asked in the same conversation state. That also stops "convert 100 USD"
+from hitting a cached "convert 200 USD".
+
+Lookups are vectorised with NumPy. Entries are indexed by context key, so a
+lookup only scans the entries asked in the same conversation state. Each
+entry also keeps a 256-bit sign code (random hyperplane projection); a
+Hamming-distance scan over that key's codes picks a handful of candidates,
+and only those get an exact cosine check. At 100k entries a search takes
+about 0.1 ms when they're spread over 1000 contexts and about 1 ms over 10;
+it grows with the entries sharing the question's context, up to ~6 ms if
+all 100k do.
+
+Entries are evicted least-recently-used once `max_entries` is reached, and the
+whole cache is snapshotted to disk so it survives restarts. Several processes
+may share one snapshot (bot_launcher.py --workers): a save first merges in
+the entries other processes saved since, under a lock on the file.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import HumanMessage
+
+from snapshots import file_version, snapshot_lock
+
+CODE_BITS = 256
+CANDIDATES = 32
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(a):
+        return np.bitwise_count(a)
+else:
+    _POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(a):
+        return _POPCOUNT_LUT[a.view(np.uint8)]
+
+
+def normalize_prompt(text):
+    text = " ".join(text.lower().split())
+    return text.strip(" ?!.")
+
+
+def _entry_id(key, question):
+    digest = hashlib.blake2b(int(key).to_bytes(8, "little") + question.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SemanticCache(BaseCache):
+    def __init__(self, embeddings, threshold=0.95, max_entries=100_000,
+                 snapshot_path=None, snapshot_every=50, seed=0):
+        """
+        embeddings: any LangChain `Embeddings` (e.g. AzureOpenAIEmbeddings)
+        threshold: cosine similarity needed for a hit
+        snapshot_path: `.npz` file to load from / save to (None disables persistence)
+        snapshot_every: save after this many new entries
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.seed = seed
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._dim = None
+        self._planes = None
+        self._size = 0
+        self._clock = 0
+        self._unsaved = 0
+        self._vectors = self._codes = self._keys = self._ids = self._last_used = None
+        self._values = []
+        self._disk_version = None  # snapshot file as this process last read or wrote it
+        self._slots = {}  # context key -> slots holding entries for it
+        self._recent = OrderedDict()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    # ---- storage ----
+    def _init_storage(self, dim, capacity=1024):
+        capacity = min(capacity, self.max_entries)
+        self._dim = dim
+        rng = np.random.default_rng(self.seed)
+        self._planes = rng.standard_normal((dim, CODE_BITS)).astype(np.float32)
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._codes = np.zeros((capacity, CODE_BITS // 64), dtype=np.uint64)
+        self._keys = np.zeros(capacity, dtype=np.uint64)
+        self._ids = np.zeros(capacity, dtype=np.uint64)  # (key, question) hash: the same entry in every process
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        capacity = min(len(self._vectors) * 2, self.max_entries)
+        for name in ("_vectors", "_codes", "_keys", "_ids", "_last_used"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def _code(self, vector):
+        bits = (vector @ self._planes) > 0
+        return np.packbits(bits).view(np.uint64)
+
+    def _slot_for_insert(self):
+        if self._size < len(self._vectors):
+            self._size += 1
+            return self._size - 1
+        if len(self._vectors) < self.max_entries:
+            self._grow()
+            self._size += 1
+            return self._size - 1
+        slot = int(np.argmin(self._last_used))  # evict least recently used
+        self._unindex(slot)
+        return slot
+
+    def _index(self, slot, key):
+        self._slots.setdefault(int(key), []).append(slot)
+
+    def _unindex(self, slot):
+        key = int(self._keys[slot])
+        slots = self._slots[key]
+        slots.remove(slot)
+        if not slots:
+            del self._slots[key]
+
+    def _reindex(self):
+        self._slots = {}
+        for slot, key in enumerate(self._keys[:self._size].tolist()):
+            self._slots.setdefault(key, []).append(slot)
+
+    # ---- keys ----
+    @staticmethod
+    def _split(prompt, llm_string):
+        """(context key, normalised question) or None if the prompt isn't cacheable."""
+        try:
+            messages = loads(prompt)
+        except Exception:
+            return None
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return None
+        question = normalize_prompt(str(messages[-1].content))
+        context = json.dumps(
+            [llm_string, dumps(messages[:-1]), _NUMBER.findall(question)]
+        )
+        digest = hashlib.blake2b(context.encode(), digest_size=8).digest()
+        return np.frombuffer(digest, dtype=np.uint64)[0], question
+
+    def _embed(self, text):
+        # A miss is followed by update() for the same question; embed it once
+        vector = self._recent.get(text)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            with self._lock:
+                self._recent[text] = vector
+                if len(self._recent) > 64:
+                    self._recent.popitem(last=False)
+        return vector
+
+    # ---- search ----
+    def _search(self, key, vector):
+        slots = self._slots.get(int(key))
+        if not slots:
+            return None
+        candidates = np.fromiter(slots, dtype=np.intp, count=len(slots))
+        if len(candidates) > CANDIDATES:
+            distances = _popcount(self._codes[candidates] ^ self._code(vector)).sum(axis=1)
+            candidates = candidates[np.argpartition(distances, CANDIDATES - 1)[:CANDIDATES]]
+        scores = self._vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return int(candidates[best])
+
+    # ---- BaseCache ----
+    def lookup(self, prompt, llm_string):
+        parsed = self._split(prompt, llm_string)
+        if parsed is None:
+            return None
+        if self._dim is None:
+            self.misses += 1
+            return None
+        key, question = parsed
+        vector = self._embed(question)
+        with self._lock:
+            slot = self._search(key, vector)
+            if slot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            return self._values[slot]
+
+    def update(self, prompt, llm_string, return_val):
+        # Tool/function calls depend on exact arguments, never reuse them
+        for generation in return_val:
+            message = getattr(generation, "message", None)
+            if message is not None and (
+                message.additional_kwargs.get("function_call")
+                or message.additional_kwargs.get("tool_calls")
+                or getattr(message, "tool_calls", None)
+            ):
+                return
+        parsed = self._split(prompt, llm_string)
+        if parsed is None:
+            return
+        key, question = parsed
+        vector = self._embed(question)
+        with self._lock:
+            if self._dim is None:
+                self._init_storage(len(vector))
+            self._insert(key, _entry_id(key, question), vector, list(return_val))
+            self._unsaved += 1
+            save = self.snapshot_path and self._unsaved >= self.snapshot_every
+        if save:
+            self.save()
+
+    def _insert(self, key, entry_id, vector, value):
+        """Store one entry in a free (or the least recently used) slot (lock held)."""
+        slot = self._slot_for_insert()
+        if slot == len(self._values):
+            self._values.append(None)
+        self._vectors[slot] = vector
+        self._codes[slot] = self._code(vector)
+        self._keys[slot] = key
+        self._ids[slot] = entry_id
+        self._index(slot, key)
+        self._clock += 1
+        self._last_used[slot] = self._clock
+        self._values[slot] = value
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._size = 0
+            self._values = []
+            self._slots = {}
+            self._unsaved = 0
+
+    # ---- persistence ----
+    def save(self, path=None):
+        path = path or self.snapshot_path
+        with snapshot_lock(path):
+            # Another process sharing the snapshot saved since we last looked: keep its entries
+            if file_version(path) not in (None, self._disk_version):
+                self.merge(path)
+            with self._lock:
+                if self._dim is None:
+                    return
+                n = self._size
+                values = json.dumps([[dumps(g) for g in gens] for gens in self._values[:n]])
+                arrays = dict(
+                    vectors=self._vectors[:n], codes=self._codes[:n], keys=self._keys[:n], ids=self._ids[:n],
+                    last_used=self._last_used[:n], values=np.frombuffer(values.encode(), dtype=np.uint8),
+                    seed=np.array(self.seed),
+                )
+                self._unsaved = 0
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+            self._disk_version = file_version(path)
+
+    @staticmethod
+    def _read(path):
+        with np.load(path) as data:
+            keys = data["keys"]
+            vectors = data["vectors"]
+            if "ids" in data:
+                ids = data["ids"]
+            else:  # older snapshot: identify entries by their key and vector instead
+                ids = np.array([_entry_id(k, v.tobytes().hex()) for k, v in zip(keys.tolist(), vectors)],
+                               dtype=np.uint64)
+            return dict(
+                seed=int(data["seed"]), vectors=vectors, codes=data["codes"], keys=keys, ids=ids,
+                last_used=data["last_used"], values=json.loads(data["values"].tobytes().decode()),
+            )
+
+    def load(self, path):
+        snapshot = self._read(path)
+        vectors = snapshot["vectors"]
+        with self._lock:
+            self.seed = snapshot["seed"]
+            n = len(vectors)
+            self._init_storage(vectors.shape[1], capacity=max(n, 1024))
+            self._vectors[:n] = vectors
+            self._codes[:n] = snapshot["codes"]
+            self._keys[:n] = snapshot["keys"]
+            self._ids[:n] = snapshot["ids"]
+            self._last_used[:n] = snapshot["last_used"]
+            self._values = [[loads(g) for g in gens] for gens in snapshot["values"]]
+            self._size = n
+            self._reindex()
+            self._clock = int(self._last_used[:n].max(initial=0))
+        self._disk_version = file_version(path)
+
+    def merge(self, path):
+        """Add the entries of the snapshot at `path` that this cache doesn't have. Returns how many."""
+        snapshot = self._read(path)
+        vectors = snapshot["vectors"]
+        added = 0
+        with self._lock:
+            if len(vectors) and self._dim is None:
+                self._init_storage(vectors.shape[1])
+            known = set(self._ids[:self._size].tolist()) if self._dim is not None else set()
+            for i, entry_id in enumerate(snapshot["ids"].tolist()):
+                if entry_id in known:
+                    continue
+                value = [loads(g) for g in snapshot["values"][i]]
+                self._insert(snapshot["keys"][i], entry_id, vectors[i], value)
+                known.add(entry_id)
+                added += 1
+        self._disk_version = file_version(path)
+        return added
@@ -0,0 +1,311 @@
+"""
+Conversation memories that outlive the process.
+
+The bots' memories (TokenBudgetMemory, BackgroundSummaryMemory) keep their
+turns in RAM, so a session ends with its process and can't move to another
+worker. Given a `SessionStore` and a session id, they also write through to
+disk, and a memory built for the same session id later (after a restart, in
+another worker) starts where the last one stopped:
+
+- Each memory of a session is an append-only log. A saved turn appends one
+  record. A rewritten summary appends one snapshot record (summary plus the
+  turns still kept verbatim) and drops the records before it. No write
+  re-serializes the whole history.
+- Records are length-prefixed UTF-8, not pickled LangChain objects: compact,
+  and readable whatever LangChain version wrote them.
+- Logs live in `shards` SQLite files (WAL mode, shared by every bot process),
+  picked by a hash of the session id. SQLite has one writer per file, so
+  workers saving different sessions rarely wait for each other.
+- Recently used memories stay decoded in a per-process LRU. Loading a hot one
+  is a single indexed query for records newer than the cached copy (another
+  worker may have continued the session); a cold one replays its log, which
+  is at most one snapshot plus the turns since. If the last record the copy
+  applied is gone and no snapshot replaces it (another process deleted or
+  pruned the session, maybe started it again), the log is replayed whole.
+
+One worker at a time should serve a session. Turns two workers append at the
+same moment are both kept, but a snapshot written meanwhile replaces them.
+"""
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_log (
+    session TEXT NOT NULL,
+    memory TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    record BLOB NOT NULL,
+    written_at REAL NOT NULL,
+    PRIMARY KEY (session, memory, seq)
+) WITHOUT ROWID;
+"""
+
+# ---- records ----
+_TURN, _SNAPSHOT = 1, 2
+_U32 = struct.Struct("<I")
+
+
+def _pack_text(text):
+    data = text.encode("utf-8")
+    return _U32.pack(len(data)) + data
+
+
+def _unpack_text(record, offset):
+    (size,) = _U32.unpack_from(record, offset)
+    offset += _U32.size
+    return record[offset:offset + size].decode("utf-8"), offset + size
+
+
+def _pack_turn(human, ai, tokens):
+    return _U32.pack(tokens) + _pack_text(human) + _pack_text(ai)
+
+
+def _unpack_turn(record, offset):
+    (tokens,) = _U32.unpack_from(record, offset)
+    human, offset = _unpack_text(record, offset + _U32.size)
+    ai, offset = _unpack_text(record, offset)
+    return (human, ai, tokens), offset
+
+
+def encode_turn(human, ai, tokens):
+    """One saved turn: kind byte, token count, human text, AI text."""
+    return bytes([_TURN]) + _pack_turn(human, ai, tokens)
+
+
+def encode_snapshot(summary, summary_tokens, turns):
+    """The whole state: summary, its token count, then the turns kept verbatim."""
+    parts = [bytes([_SNAPSHOT]), _U32.pack(summary_tokens), _pack_text(summary), _U32.pack(len(turns))]
+    parts.extend(_pack_turn(human, ai, tokens) for human, ai, tokens in turns)
+    return b"".join(parts)
+
+
+class MemoryState:
+    """
+    Decoded state of one memory: summary, its tokens, [(human, ai, tokens)],
+    and the seq and written_at of the last record applied.
+    """
+
+    __slots__ = ("seq", "written_at", "summary", "summary_tokens", "turns")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seq = 0
+        self.written_at = 0.0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turns = []
+
+    def apply(self, seq, record, written_at):
+        record = bytes(record)
+        if record[0] == _TURN:
+            turn, _ = _unpack_turn(record, 1)
+            self.turns.append(turn)
+        elif record[0] == _SNAPSHOT:
+            (self.summary_tokens,) = _U32.unpack_from(record, 1)
+            self.summary, offset = _unpack_text(record, 1 + _U32.size)
+            (count,) = _U32.unpack_from(record, offset)
+            offset += _U32.size
+            self.turns = []
+            for _ in range(count):
+                turn, offset = _unpack_turn(record, offset)
+                self.turns.append(turn)
+        else:
+            raise ValueError(f"unknown session record kind {record[0]}")
+        self.seq = seq
+        self.written_at = written_at
+
+
+# ---- store ----
+class SessionStore:
+    def __init__(self, path=".cache/sessions", shards=8, hot_memories=4096, lock_stripes=64):
+        """
+        path: directory for the shard files (sessions-<n>.sqlite)
+        shards: SQLite files the sessions are spread over; keep it fixed once sessions are stored
+        hot_memories: decoded memories kept in this process's LRU
+        lock_stripes: locks serializing writes to one memory within the process
+        """
+        self.path = path
+        self.shards = shards
+        self.hot_memories = hot_memories
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._hot = OrderedDict()  # (session, memory) -> MemoryState
+        self._hot_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+        os.makedirs(path, exist_ok=True)
+
+    def shard_for(self, session_id):
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.shards
+
+    def _conn(self, shard):
+        # sqlite3 connections can't be shared between threads, or with a forked
+        # worker (bot_launcher.py --workers); one per shard per thread per process
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conns, self._local.pid = {}, os.getpid()
+        conn = self._local.conns.get(shard)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, f"sessions-{shard}.sqlite"), timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conns[shard] = conn
+        return conn
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _state(self, conn, key):
+        """The up-to-date state of `key` (stripe lock held): the hot copy plus any newer records."""
+        with self._hot_lock:
+            state = self._hot.get(key)
+            if state is not None:
+                self._hot.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if state is None:
+            state = MemoryState()
+        self._catch_up(conn, key, state)
+        with self._hot_lock:
+            self._hot[key] = state
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_memories:
+                self._hot.popitem(last=False)
+        return state
+
+    @staticmethod
+    def _catch_up(conn, key, state):
+        # Also fetches the last applied record's row (without its blob) to check it's still there
+        rows = conn.execute(
+            "SELECT seq, written_at, CASE WHEN seq > ? THEN record END FROM memory_log "
+            "WHERE session = ? AND memory = ? AND seq >= ? ORDER BY seq",
+            (state.seq, key[0], key[1], state.seq),
+        ).fetchall()
+        if state.seq:
+            if rows and rows[0][0] == state.seq and rows[0][1] == state.written_at:
+                rows = rows[1:]
+            elif not rows or rows[0][0] == state.seq or rows[0][2][0] != _SNAPSHOT:
+                # The log was deleted or rewound under us (delete/prune in another process): replay it whole
+                state.reset()
+                SessionStore._catch_up(conn, key, state)
+                return
+        for seq, written_at, record in rows:
+            state.apply(seq, record, written_at)
+
+    def load(self, session_id, memory="memory"):
+        """`(summary, summary_tokens, [(human, ai, tokens)])` stored for one memory of a session."""
+        key = (session_id, memory)
+        with self._stripe(key):
+            state = self._state(self._conn(self.shard_for(session_id)), key)
+            return state.summary, state.summary_tokens, list(state.turns)
+
+    def append_turn(self, session_id, memory, human, ai, tokens):
+        """Append one turn to the memory's log."""
+        key = (session_id, memory)
+        record = encode_turn(human, ai, tokens)
+        with self._stripe(key):
+            conn = self._conn(self.shard_for(session_id))
+            state = self._state(conn, key)
+            while True:
+                written_at = time.time()
+                try:
+                    conn.execute(
+                        "INSERT INTO memory_log (session, memory, seq, record, written_at) VALUES (?, ?, ?, ?, ?)",
+                        (session_id, memory, state.seq + 1, record, written_at),
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    self._catch_up(conn, key, state)  # another process appended first: go after it
+            state.apply(state.seq + 1, record, written_at)
+
+    def save_snapshot(self, session_id, memory, summary, summary_tokens, turns):
+        """Replace the memory's log with one snapshot of its state (after a summary rewrite, or a clear)."""
+        key = (session_id, memory)
+        record = encode_snapshot(summary, summary_tokens, turns)
+        with self._stripe(key):
+            conn = self._conn(self.shard_for(session_id))
+            state = self._state(conn, key)
+            written_at = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = (conn.execute(
+                    "SELECT MAX(seq) FROM memory_log WHERE session = ? AND memory = ?", (session_id, memory)
+                ).fetchone()[0] or 0) + 1
+                conn.execute(
+                    "INSERT INTO memory_log (session, memory, seq, record, written_at) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, memory, seq, record, written_at),
+                )
+                conn.execute("DELETE FROM memory_log WHERE session = ? AND memory = ? AND seq < ?",
+                             (session_id, memory, seq))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            state.apply(seq, record, written_at)
+
+    def delete(self, session_id):
+        """
+        Forget every memory of a session. Other processes notice on their next
+        load or write of it, and start over from the (empty) log.
+        """
+        conn = self._conn(self.shard_for(session_id))
+        keys = {(session_id, memory) for (memory,) in conn.execute(
+            "SELECT DISTINCT memory FROM memory_log WHERE session = ?", (session_id,)
+        )}
+        with self._hot_lock:
+            keys.update(key for key in self._hot if key[0] == session_id)
+        # Wait for this process's writes to those memories; stripes in index order, so two deletes can't deadlock
+        stripes = sorted({hash(key) % len(self._stripes) for key in keys})
+        with ExitStack() as held:
+            for stripe in stripes:
+                held.enter_context(self._stripes[stripe])
+            conn.execute("DELETE FROM memory_log WHERE session = ?", (session_id,))
+            with self._hot_lock:
+                for key in keys:
+                    self._hot.pop(key, None)
+
+    def prune(self, max_age):
+        """
+        Delete sessions not written to in `max_age` seconds; returns how many
+        records went. Like `delete`, other processes drop their copies when
+        they next touch one of these sessions.
+        """
+        cutoff = time.time() - max_age
+        deleted = 0
+        for shard in range(self.shards):
+            deleted += self._conn(shard).execute(
+                "DELETE FROM memory_log WHERE session IN "
+                "(SELECT session FROM memory_log GROUP BY session HAVING MAX(written_at) < ?)",
+                (cutoff,),
+            ).rowcount
+        with self._hot_lock:
+            self._hot.clear()
+        return deleted
+
+    def stats(self):
+        with self._hot_lock:
+            return {"hot": len(self._hot), "hits": self.hits, "misses": self.misses}
+
+
+def store_from_env(env):
+    """The SessionStore configured by SESSION_STORE_PATH (and _SHARDS, _HOT), or None."""
+    path = env.get("SESSION_STORE_PATH")
+    if not path:
+        return None
+    return SessionStore(
+        path,
+        shards=int(env.get("SESSION_STORE_SHARDS", "8")),
+        hot_memories=int(env.get("SESSION_STORE_HOT", "4096")),
+    )
@@ -0,0 +1,40 @@
+"""
+Helpers for `.npz` snapshots that several processes save to.
+
+The semantic cache and the local knowledge index are each snapshotted to one
+file shared by every worker (bot_launcher.py --workers). A save holds
+`snapshot_lock(path)`, compares `file_version(path)` with the version it last
+read or wrote, and merges in what another process saved meanwhile before
+writing.
+"""
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, saves from concurrent processes may overlap
+    fcntl = None
+
+
+@contextmanager
+def snapshot_lock(path):
+    """Exclusive lock on `path` across processes (a `.lock` file next to it), for read-merge-write saves."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_version(path):
+    """(inode, mtime, size) of `path`, or None if it doesn't exist: tells whether someone else rewrote it."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,143 @@
+"""
+Token streaming for the REPL bots and the Streamlit page.
+
+Build the model with `streaming=True` and pass one of these handlers in the
+invoke config (`config={"callbacks": [printer]}`). Tokens are then shown as
+soon as they arrive, so perceived latency is time-to-first-token. `invoke`
+still returns the full result, so callers that don't stream are unaffected.
+When nothing was streamed (e.g. the answer came from a cache) `finish()`
+prints the whole answer instead.
+"""
+import re
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class TokenPrinter(BaseCallbackHandler):
+    """Prints every token of every LLM call (for plain chat models)."""
+
+    def __init__(self, label="Agent:"):
+        self.label = label
+        self.streamed = False
+
+    def _emit(self, text):
+        if not text:
+            return
+        if not self.streamed:
+            if self.label:
+                print(self.label, end=" ", flush=True)
+            self.streamed = True
+        print(text, end="", flush=True)
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._emit(token)
+
+    def finish(self, text):
+        """End the turn: newline after a streamed answer, or print `text` if nothing streamed."""
+        if self.streamed:
+            print()
+        elif self.label:
+            print(self.label, text)
+        else:
+            print(text)
+        self.streamed = False
+
+
+class FinalAnswerPrinter(TokenPrinter):
+    """
+    Streams only the agent's final answer, not its intermediate reasoning.
+
+    prefix: regex marking where the final answer starts in an LLM completion,
+        e.g. r"AI:\\s*" for CONVERSATIONAL_REACT_DESCRIPTION. None means the
+        whole completion is the answer (OPENAI_FUNCTIONS-style agents, where
+        tool calls carry no content tokens).
+    json_string: the answer is a JSON string value (chat-conversational-react's
+        `"action_input": "..."`); stop at the closing quote and unescape.
+    """
+
+    _ESCAPES = {"n": "\n", "t": "\t", '"': '"', "\\": "\\", "/": "/"}
+
+    def __init__(self, prefix=None, json_string=False, label="Bot:"):
+        super().__init__(label)
+        self.prefix = re.compile(prefix) if prefix else None
+        self.json_string = json_string
+        self._runs = {}
+        self._parents = {}   # run_id -> parent_run_id, to spot LLM calls made inside tools
+        self._tool_runs = set()
+
+    def _inside_tool(self, run_id):
+        while run_id is not None:
+            if run_id in self._tool_runs:
+                return True
+            run_id = self._parents.get(run_id)
+        return False
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        self._tool_runs.add(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        # e.g. llm-math's own LLM call is not the agent's answer
+        if self._inside_tool(parent_run_id):
+            return
+        self._runs[run_id] = {"buffer": "", "answering": self.prefix is None, "done": False, "escape": False}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self.on_llm_start(serialized, [], run_id=run_id, parent_run_id=parent_run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is None or run["done"] or not token:
+            return
+        if not run["answering"]:
+            run["buffer"] += token
+            match = self.prefix.search(run["buffer"])
+            if match is None:
+                return
+            run["answering"] = True
+            token = run["buffer"][match.end():]
+        if self.json_string:
+            token = self._json_chars(run, token)
+        self._emit(token)
+
+    def _json_chars(self, run, token):
+        out = []
+        for ch in token:
+            if run["escape"]:
+                out.append(self._ESCAPES.get(ch, ch))
+                run["escape"] = False
+            elif ch == "\\":
+                run["escape"] = True
+            elif ch == '"':
+                run["done"] = True
+                break
+            else:
+                out.append(ch)
+        return "".join(out)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
+
+    def finish(self, text):
+        super().finish(text)
+        self._runs.clear()
+        self._parents.clear()
+        self._tool_runs.clear()
+
+
+class StreamlitWriter(BaseCallbackHandler):
+    """Renders tokens incrementally into a Streamlit placeholder (`st.empty()`)."""
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.placeholder.markdown(self.text + "▌")
+
+    def finish(self, text):
+        self.placeholder.markdown(text)
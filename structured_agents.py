@@ -0,0 +1,341 @@
+"""
+ReAct agents that parse their own output instead of re-prompting.
+
+With `handle_parsing_errors=True` a completion the stock parser can't read
+("action: wikipedia" in lower case, a final answer without the "AI:" prefix,
+a JSON blob with the wrong keys or a missing brace) goes back to the model
+with "Invalid or incomplete response", so one malformed completion costs a
+whole extra LLM call. `initialize_structured_agent()` builds the same agents
+in one of three modes (`AGENT_MODE`):
+
+- "react": the agent's usual prompt, with a parser that accepts what the
+  stock parser accepts and recovers the common near-misses locally
+- "json": the chat-conversational JSON prompt, with the model constrained to
+  emit a JSON object (`response_format=json_object`)
+- "tools": native function calling (OPENAI_FUNCTIONS), so the action is
+  structured by the API rather than by the text
+
+Only output that really can't be read is re-prompted. `parse_stats` counts
+completions parsed as-is, recovered locally, and failed, plus the LLM calls
+(and seconds) the failures cost in retries.
+"""
+import difflib
+import json
+import os
+import re
+import threading
+import time
+from typing import List
+
+from langchain.agents import AgentOutputParser, AgentType, initialize_agent
+from langchain.agents.conversational.output_parser import ConvoOutputParser as ReActOutputParser
+from langchain.agents.conversational_chat.output_parser import ConvoOutputParser as JSONOutputParser
+from langchain.agents.output_parsers.openai_functions import OpenAIFunctionsAgentOutputParser
+from langchain_core.agents import AgentAction, AgentActionMessageLog, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.utils.json import parse_partial_json
+from pydantic import PrivateAttr
+
+from prompt_compiler import compile_agent
+from streaming import FinalAnswerPrinter
+
+AGENT_MODES = ("react", "json", "tools")
+
+
+class ParseStats:
+    """Process-wide counters for every structured agent's output parsing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.parsed = 0         # read as-is
+            self.recovered = 0      # malformed, repaired without an LLM call
+            self.failed = 0         # unreadable, sent back to the model
+            self.retries = 0        # LLM calls spent re-prompting after a failure
+            self.retry_seconds = 0.0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "parsed": self.parsed,
+                "recovered": self.recovered,
+                "failed": self.failed,
+                "retries": self.retries,
+                "retry_seconds": self.retry_seconds,
+            }
+
+
+parse_stats = ParseStats()
+
+
+class _CountingParser(AgentOutputParser):
+    """Counts outcomes in `parse_stats`; subclasses implement `_parse(text) -> (result, recovered)`."""
+
+    tool_names: List[str] = []
+    recover: bool = True  # False: only what the stock parser reads (to measure what recovery saves)
+
+    # One parser per agent and an agent runs one turn at a time, so the next
+    # parse after a failure is the retry it caused
+    _failed_at: float = PrivateAttr(default=None)
+
+    def parse(self, text):
+        try:
+            result, recovered = self._parse(text)
+        except OutputParserException:
+            parse_stats.add(failed=1)
+            self._failed_at = time.perf_counter()
+            raise
+        if self._failed_at is not None:
+            parse_stats.add(retries=1, retry_seconds=time.perf_counter() - self._failed_at)
+            self._failed_at = None
+        parse_stats.add(**{"recovered" if recovered else "parsed": 1})
+        return result
+
+    def get_format_instructions(self):
+        return self._strict.get_format_instructions()
+
+    def _resolve_tool(self, name):
+        """Tool name as the model wrote it, matched to a real tool if it's close (case, quotes, typos)."""
+        cleaned = name.strip().strip("`'\"*[]().:").strip()
+        if not self.tool_names or cleaned in self.tool_names:
+            return cleaned
+        by_lower = {tool.lower(): tool for tool in self.tool_names}
+        close = difflib.get_close_matches(cleaned.lower(), list(by_lower), n=1, cutoff=0.8)
+        return by_lower[close[0]] if close else cleaned
+
+
+# ---- "Do I need to use a tool?" ReAct ----
+_OBSERVATION = re.compile(r"^\s*Observation\s*:", re.IGNORECASE | re.MULTILINE)
+_ACTION = re.compile(r"^[\s*`]*Action[\s*`]*:[\s*`]*(.*?)\s*$", re.IGNORECASE | re.MULTILINE)
+_ACTION_INPUT = re.compile(r"^[\s*`]*Action[\s_]*Input[\s*`]*:[ \t]*", re.IGNORECASE | re.MULTILINE)
+_CALL = re.compile(r"^([\w.-]+)\s*[\[(]([\s\S]*)[\])]$")  # Calculator(12 * 7)
+_NEED_TOOL = re.compile(r"Do I need to use a tool\?\s*(Yes|No)\b[ \t:.]*", re.IGNORECASE)
+_FINAL = re.compile(r"^[\s*`]*Final Answer[\s*`]*:\s*", re.IGNORECASE | re.MULTILINE)
+_THOUGHT = re.compile(r"^[\s*`]*Thought[\s*`]*:[ \t]*", re.IGNORECASE | re.MULTILINE)
+
+
+class RecoveringReActParser(_CountingParser):
+    """CONVERSATIONAL_REACT_DESCRIPTION output, recovering near-misses locally."""
+
+    ai_prefix: str = "AI"
+    _strict: ReActOutputParser = PrivateAttr()
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._strict = ReActOutputParser(ai_prefix=self.ai_prefix)
+
+    def _parse(self, text):
+        # The model sometimes carries on past the stop word and invents the tool's answer
+        cut = _OBSERVATION.search(text)
+        if cut is None:
+            try:
+                result = self._strict.parse(text)
+                if isinstance(result, AgentFinish) or result.tool in self.tool_names or not self.tool_names:
+                    return result, False
+            except OutputParserException:
+                if not self.recover:
+                    raise
+        if not self.recover:
+            return self._strict.parse(text), False
+        body = text[:cut.start()] if cut else text
+
+        ai = re.search(rf"^[\s*`]*{re.escape(self.ai_prefix)}\s*:", body, re.IGNORECASE | re.MULTILINE)
+        final = ai or _FINAL.search(body)
+        if final:
+            return AgentFinish({"output": body[final.end():].strip()}, text), True
+
+        action = _ACTION.search(body)
+        if action:
+            tool, tool_input = action.group(1), ""
+            given = _ACTION_INPUT.search(body, action.end())
+            if given:
+                tool_input = body[given.end():]
+            else:
+                call = _CALL.match(tool)
+                if call:
+                    tool, tool_input = call.groups()
+            return AgentAction(self._resolve_tool(tool), tool_input.strip().strip('`"'), text), True
+
+        # No tool and no "AI:". Only an explicit "Do I need to use a tool? No" makes
+        # the rest an answer; otherwise it's the model's reasoning, and a retry is
+        # better than showing that to the user
+        need = _NEED_TOOL.search(body)
+        if need and need.group(1).lower() == "no":
+            answer = _THOUGHT.sub("", body[need.end():]).strip()
+            if answer:
+                return AgentFinish({"output": answer}, text), True
+        raise OutputParserException(f"Could not parse LLM output: `{text}`")
+
+    @property
+    def _type(self):
+        return "recovering-conversational"
+
+
+# ---- chat-conversational JSON ----
+_ACTION_KEYS = ("action", "tool", "name", "function")
+_INPUT_KEYS = ("action_input", "tool_input", "input", "arguments", "args", "parameters", "answer", "output")
+_FINAL_NAMES = {"final answer", "final_answer", "finalanswer", "final", "answer"}
+
+
+def _json_objects(text):
+    """Top-level {...} objects in `text`, in one pass; a truncated last object is closed for it."""
+    depth, start, in_string, escape = 0, None, False, False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = depth > 0
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                obj = _loads(text[start:i + 1])
+                if obj is not None:
+                    yield obj
+    if depth:
+        obj = _loads(text[start:])
+        if obj is not None:
+            yield obj
+
+
+def _loads(fragment):
+    try:
+        obj = json.loads(fragment, strict=False)
+    except ValueError:
+        obj = parse_partial_json(fragment)
+    return obj if isinstance(obj, dict) else None
+
+
+class RecoveringJSONParser(_CountingParser):
+    """CHAT_CONVERSATIONAL_REACT_DESCRIPTION output, recovering near-misses locally."""
+
+    _strict: JSONOutputParser = PrivateAttr(default_factory=JSONOutputParser)
+
+    def _parse(self, text):
+        try:
+            result = self._strict.parse(text)
+            if isinstance(result, AgentFinish) or result.tool in self.tool_names or not self.tool_names:
+                return result, False
+        except OutputParserException:
+            if not self.recover:
+                raise
+        if not self.recover:
+            return result, False
+
+        for obj in _json_objects(text):
+            action = next((obj[key] for key in _ACTION_KEYS if isinstance(obj.get(key), str)), None)
+            if action is None:
+                continue
+            tool_input = next((obj[key] for key in _INPUT_KEYS if key in obj), "")
+            if action.strip().lower() in _FINAL_NAMES:
+                return AgentFinish({"output": tool_input if isinstance(tool_input, str) else json.dumps(tool_input)}, text), True
+            return AgentAction(self._resolve_tool(action), tool_input, text), True
+
+        if text.strip() and "{" not in text:
+            # Plain prose instead of a blob: that's the answer
+            return AgentFinish({"output": text.strip()}, text), True
+        raise OutputParserException(f"Could not parse LLM output: {text}")
+
+    @property
+    def _type(self):
+        return "recovering-conversational-chat"
+
+
+# ---- native function calling ----
+class RecoveringFunctionsParser(OpenAIFunctionsAgentOutputParser):
+    """OPENAI_FUNCTIONS messages; arguments that aren't quite JSON are repaired, not re-prompted."""
+
+    @staticmethod
+    def parse_ai_message(message):
+        function_call = message.additional_kwargs.get("function_call") if isinstance(message, AIMessage) else None
+        try:
+            result = OpenAIFunctionsAgentOutputParser.parse_ai_message(message)
+        except OutputParserException:
+            arguments = _loads(function_call["arguments"])
+            if arguments is None:
+                parse_stats.add(failed=1)
+                raise
+            parse_stats.add(recovered=1)
+            tool_input = arguments.get("__arg1", arguments)
+            return AgentActionMessageLog(
+                tool=function_call["name"],
+                tool_input=tool_input,
+                log=f"\nInvoking: `{function_call['name']}` with `{tool_input}`\n\n",
+                message_log=[message],
+            )
+        parse_stats.add(parsed=1)
+        return result
+
+
+def _system_text(system_message):
+    return system_message.content if isinstance(system_message, SystemMessage) else system_message
+
+
+def initialize_structured_agent(tools, llm, agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION, mode="react",
+                                agent_kwargs=None, recover=None, **kwargs):
+    """
+    `initialize_agent()` for a conversational ReAct agent, in one of AGENT_MODES (prompt compiled).
+
+    tools, llm, **kwargs: as for initialize_agent (memory, verbose, handle_parsing_errors, ...)
+    agent: the agent type used in "react" mode (CONVERSATIONAL_REACT_DESCRIPTION or the
+        chat-conversational JSON variant)
+    agent_kwargs: as for initialize_agent; a `system_message` is used by every mode
+    recover: repair malformed ReAct/JSON output locally (default: yes, unless AGENT_STRICT_PARSING=1)
+    """
+    if mode not in AGENT_MODES:
+        raise ValueError(f"unknown agent mode {mode!r}, expected one of {', '.join(AGENT_MODES)}")
+    agent_kwargs = dict(agent_kwargs or {})
+    if recover is None:
+        recover = os.getenv("AGENT_STRICT_PARSING") != "1"
+    tool_names = [tool.name for tool in tools]
+
+    if mode == "tools":
+        memory = kwargs.get("memory")
+        system_message = agent_kwargs.pop("system_message", None)
+        agent_kwargs.update(
+            system_message=SystemMessage(content=_system_text(system_message) or "You are a helpful AI assistant."),
+            extra_prompt_messages=[MessagesPlaceholder(variable_name=key) for key in (memory.memory_variables if memory else [])],
+            output_parser=RecoveringFunctionsParser,
+        )
+        return compile_agent(initialize_agent(tools, llm, agent=AgentType.OPENAI_FUNCTIONS, agent_kwargs=agent_kwargs, **kwargs))
+
+    if mode == "json":
+        agent = AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION
+        llm = llm.bind(response_format={"type": "json_object"})
+    if agent == AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION:
+        if "system_message" in agent_kwargs:
+            agent_kwargs["system_message"] = _system_text(agent_kwargs["system_message"])
+        agent_kwargs["output_parser"] = RecoveringJSONParser(tool_names=tool_names, recover=recover)
+    else:
+        agent_kwargs["output_parser"] = RecoveringReActParser(
+            tool_names=tool_names, ai_prefix=agent_kwargs.get("ai_prefix", "AI"), recover=recover
+        )
+    return compile_agent(initialize_agent(tools, llm, agent=agent, agent_kwargs=agent_kwargs, **kwargs))
+
+
+def answer_printer(agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION, mode="react", **kwargs):
+    """A FinalAnswerPrinter that finds the final answer in the completions of `agent` built in `mode`."""
+    if mode == "tools":
+        return FinalAnswerPrinter(prefix=None, **kwargs)
+    if mode == "json" or agent == AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION:
+        # {"action": "Final Answer", "action_input": "..."}
+        return FinalAnswerPrinter(prefix=r'"action":\s*"Final Answer",\s*"action_input":\s*"', json_string=True, **kwargs)
+    return FinalAnswerPrinter(prefix=r"AI:\s*", **kwargs)
@@ -0,0 +1,181 @@
+"""
+Summary memory that summarises in the background.
+
+ConversationSummaryMemory makes a synchronous LLM call after every turn to
+rewrite the summary, so the user waits for two model calls. This memory only
+queues the turn. Once `batch_turns` turns (or `batch_tokens` tokens) are
+pending, one background call folds all of them into the summary. Until that
+call lands, the prompt uses the last completed summary plus the raw pending
+turns, so nothing is lost in between. The summary is capped at
+`max_summary_tokens`; past it the oldest part is dropped, so the prompt and
+each summarisation call stay bounded. A failed call is logged and its turns
+stay pending for the next one; while calls keep failing (an LLM outage), the
+oldest pending turns are dropped past `max_pending_tokens`, so the prompt
+doesn't grow until it no longer fits the context window.
+
+With a `session_store.SessionStore` and a `session_id`, queued turns are
+written through to the store, and the summary (with the turns still pending)
+when a background call lands; a memory built later for the same session id
+starts from what was stored.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.memory.utils import get_prompt_input_key
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from bounded_memory import count_tokens, summarize, truncate_summary
+from llm_scheduler import BACKGROUND, scheduling
+
+logger = logging.getLogger(__name__)
+
+# Shared by every memory in the process; summaries are off the request path
+_summarizer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+def _summarize_in_background(llm, summary, messages, max_tokens):
+    # Nobody is waiting on this call, so it yields to interactive turns in the LLM scheduler
+    with scheduling(priority=BACKGROUND):
+        return truncate_summary(llm, summarize(llm, summary, messages), max_tokens)
+
+
+class BackgroundSummaryMemory(BaseMemory):
+    llm: BaseLanguageModel
+    batch_turns: int = 3
+    batch_tokens: int = 1000
+    max_summary_tokens: int = 1000  # older parts of the summary are dropped past this
+    max_pending_tokens: int = 4000  # after a failed summarisation, the oldest pending turns are dropped past this
+    memory_key: str = "chat_history"
+    input_key: Optional[str] = None
+    output_key: Optional[str] = None
+    return_messages: bool = False
+    store: Optional[Any] = None        # session_store.SessionStore
+    session_id: Optional[str] = None   # persisted only with both
+    store_key: str = "memory"          # which of the session's memories this is
+
+    _summary: str = PrivateAttr(default="")
+    _summary_tokens: int = PrivateAttr(default=0)
+    _pending: List[Tuple[HumanMessage, AIMessage, int]] = PrivateAttr(default_factory=list)
+    _job: Any = PrivateAttr(default=None)
+    _generation: int = PrivateAttr(default=0)  # bumped by clear() so late jobs are dropped
+    _failures: int = PrivateAttr(default=0)    # summarisations failed in a row
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)  # done-callbacks may run inline
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        if self._persisted:
+            self._summary, self._summary_tokens, turns = self.store.load(self.session_id, self.store_key)
+            self._pending = [(HumanMessage(content=human), AIMessage(content=ai), tokens)
+                             for human, ai, tokens in turns]
+
+    @property
+    def _persisted(self) -> bool:
+        return self.store is not None and self.session_id is not None
+
+    def _save_snapshot(self) -> None:
+        """Lock held."""
+        turns = [(human.content, ai.content, tokens) for human, ai, tokens in self._pending]
+        self.store.save_snapshot(self.session_id, self.store_key, self._summary, self._summary_tokens, turns)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            summary, pending = self._summary, list(self._pending)
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=summary))
+        for human, ai, _ in pending:
+            messages.extend([human, ai])
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        input_key = self.input_key or get_prompt_input_key(inputs, self.memory_variables)
+        output_key = self.output_key or (next(iter(outputs)) if len(outputs) == 1 else "output")
+        human = HumanMessage(content=str(inputs[input_key]))
+        ai = AIMessage(content=str(outputs[output_key]))
+        tokens = count_tokens(self.llm, get_buffer_string([human, ai]))
+        with self._lock:
+            self._pending.append((human, ai, tokens))
+            if self._persisted:
+                self.store.append_turn(self.session_id, self.store_key, human.content, ai.content, tokens)
+            if self._failures and self._job is None:
+                self._trim_pending()
+            self._maybe_start_job()
+
+    def _trim_pending(self) -> None:
+        """Drop the oldest pending turns past `max_pending_tokens`, keeping the latest (lock held, no job running)."""
+        pending_tokens = sum(tokens for _, _, tokens in self._pending)
+        dropped = 0
+        while len(self._pending) > 1 and pending_tokens > self.max_pending_tokens:
+            pending_tokens -= self._pending.pop(0)[2]
+            dropped += 1
+        if dropped:
+            logger.warning("Summaries keep failing: dropped the %d oldest unsummarised turns of %s",
+                           dropped, self.session_id or "a session")
+            if self._persisted:
+                self._save_snapshot()
+
+    def _maybe_start_job(self) -> None:
+        """Start one background summarisation if enough turns are pending (lock held)."""
+        if self._job is not None:
+            return
+        pending_tokens = sum(tokens for _, _, tokens in self._pending)
+        if len(self._pending) < self.batch_turns and pending_tokens < self.batch_tokens:
+            return
+        batch = len(self._pending)
+        messages = [m for human, ai, _ in self._pending for m in (human, ai)]
+        generation = self._generation
+        self._job = _summarizer.submit(_summarize_in_background, self.llm, self._summary, messages,
+                                     self.max_summary_tokens)
+        self._job.add_done_callback(lambda job: self._finish_job(job, batch, generation))
+
+    def _finish_job(self, job, batch, generation) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._job = None
+            error = job.exception()
+            if error is not None:
+                # The turns stay pending and are retried on the next save
+                self._failures += 1
+                logger.warning("Summarising %d turns failed (%d in a row)", batch, self._failures,
+                               exc_info=error)
+                self._trim_pending()
+                return
+            self._failures = 0
+            self._summary, self._summary_tokens = job.result()
+            del self._pending[:batch]
+            if self._persisted:
+                self._save_snapshot()
+            self._maybe_start_job()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until the in-flight summarisation (if any) has landed."""
+        job = self._job
+        if job is not None:
+            job.exception(timeout=timeout)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._job = None
+            self._failures = 0
+            self._summary = ""
+            self._summary_tokens = 0
+            self._pending.clear()
+            if self._persisted:
+                self._save_snapshot()
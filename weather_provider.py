@@ -0,0 +1,183 @@
+"""
+Shared weather provider for the weather tools.
+
+The model passes whatever city string it likes ("London", " london ",
+"London, UK"), so lookups are keyed on a canonical city name. A qualifier
+that names another country ("London, Canada") is part of that name, and of
+the query. Answers are
+kept for a short TTL; after that they're still served for a while
+(stale-while-revalidate) while one background refresh fetches the new
+report. Concurrent misses for the same city share a single request, so a
+hot city costs one wttr.in call per TTL no matter how many users ask.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from http_client import UpstreamUnavailable, default_client
+
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://wttr.in")
+
+# Spellings of a country qualifier (after dropping dots: "U.K." -> "uk"), so "London, U.K." and "London, UK" share a key
+COUNTRY_NAMES = {
+    "united kingdom": "uk", "england": "uk", "gb": "uk", "great britain": "uk",
+    "us": "usa", "united states": "usa", "america": "usa",
+    "united arab emirates": "uae",
+}
+
+# The country wttr.in already picks for the bare city name: only this qualifier
+# is dropped ("London, UK" -> "london", but "London, Canada" stays as it is)
+DEFAULT_COUNTRY = {
+    "london": "uk", "paris": "france", "new york": "usa", "los angeles": "usa", "san francisco": "usa",
+    "chicago": "usa", "mumbai": "india", "delhi": "india", "new delhi": "india", "kolkata": "india",
+    "chennai": "india", "bengaluru": "india", "tokyo": "japan", "beijing": "china", "shanghai": "china",
+    "berlin": "germany", "rome": "italy", "madrid": "spain", "sydney": "australia", "toronto": "canada",
+    "singapore": "singapore", "dubai": "uae",
+}
+
+# Nicknames and old names that would otherwise be cached separately
+CITY_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "sf": "san francisco",
+    "la": "los angeles",
+    "bombay": "mumbai",
+    "calcutta": "kolkata",
+    "madras": "chennai",
+    "bangalore": "bengaluru",
+    "peking": "beijing",
+}
+
+
+class WeatherUnavailable(Exception):
+    """Raised when no report could be fetched for a city."""
+
+
+def canonicalize(city):
+    """
+    Cache key (and query) for a city: normalised unicode, case and spacing,
+    aliases folded, and a country qualifier dropped only when it's the one
+    wttr.in would pick anyway.
+    """
+    city = unicodedata.normalize("NFKC", city).casefold()
+    city = re.sub(r"\s+", " ", city).strip(" .,;:!?'\"")
+    parts = [part.strip() for part in city.split(",") if part.strip()]
+    if not parts:
+        return ""
+    name = CITY_ALIASES.get(parts[0], parts[0])
+    qualifiers = [COUNTRY_NAMES.get(part.replace(".", ""), part.replace(".", "")) for part in parts[1:]]
+    if len(qualifiers) == 1 and DEFAULT_COUNTRY.get(name) == qualifiers[0]:
+        qualifiers = []
+    return ", ".join([name] + qualifiers)
+
+
+class _InFlight:
+    """A fetch that other threads can wait on instead of starting their own."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.report = None
+        self.error = None
+
+
+class WeatherProvider:
+    def __init__(self, base_url=WEATHER_API_URL, ttl=600, stale_for=1800, max_cities=1024,
+                 client=default_client):
+        """
+        ttl: seconds a report is served as fresh
+        stale_for: further seconds it's served while a background refresh runs
+        max_cities: LRU bound on cached cities
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.stale_for = stale_for
+        self.max_cities = max_cities
+        self.client = client
+
+        self._reports = OrderedDict()  # canonical city -> (fetched_at, report)
+        self._inflight = {}            # canonical city -> _InFlight
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather")
+        self.hits = self.stale_hits = self.misses = 0
+
+    def _fetch(self, city):
+        try:
+            response = self.client.get(f"{self.base_url}/{quote(city.title())}?format=3")
+        except UpstreamUnavailable as e:
+            raise WeatherUnavailable(str(e)) from e
+        if response.status_code != 200:
+            raise WeatherUnavailable(f"Weather API returned {response.status_code} for {city}")
+        return response.text
+
+    def _store(self, city, report):
+        self._reports[city] = (time.monotonic(), report)
+        self._reports.move_to_end(city)
+        while len(self._reports) > self.max_cities:
+            self._reports.popitem(last=False)
+
+    def _lead(self, city, flight):
+        """Fetch on behalf of everyone waiting on `flight`."""
+        try:
+            flight.report = self._fetch(city)
+        except Exception as e:
+            flight.error = e if isinstance(e, WeatherUnavailable) else WeatherUnavailable(str(e))
+        finally:
+            with self._lock:
+                if flight.report is not None:
+                    self._store(city, flight.report)
+                del self._inflight[city]
+            flight.done.set()
+
+    # ---- public API ----
+    def get(self, city):
+        """Current weather line for `city` (e.g. "London: ⛅️ +18°C")."""
+        key = canonicalize(city)
+        if not key:
+            raise WeatherUnavailable("No city given")
+        with self._lock:
+            entry = self._reports.get(key)
+            if entry is not None:
+                fetched_at, report = entry
+                age = time.monotonic() - fetched_at
+                if age <= self.ttl:
+                    self._reports.move_to_end(key)
+                    self.hits += 1
+                    return report
+                if age <= self.ttl + self.stale_for:
+                    self._reports.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        flight = self._inflight[key] = _InFlight()
+                        self._refresher.submit(self._lead, key, flight)
+                    return report
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+
+        if leader:
+            self._lead(key, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.report
+
+    async def aget(self, city):
+        """`get` for async tools; cache hits never leave the event loop."""
+        key = canonicalize(city)
+        with self._lock:
+            entry = self._reports.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._reports.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        # Misses and stale entries go through the coalescing sync path on a thread
+        return await asyncio.to_thread(self.get, city)